@@ -0,0 +1,199 @@
+"""An index of the IP addresses and ranges mentioned in all the SPI
+cases, for finding which cases mention an IP or range without opening
+each case.
+
+The index is built from the cached CacheableSpiCases, and saved (as a
+pickle) in the file named by settings.API_CASE_INDEX_PATH by
+update_case_index(), which is run periodically by the
+update_case_index management command.  It's kept in a file rather
+than the cache because rebuilding it from scratch means reading every
+case, so it mustn't be evicted, or lost when the cache is flushed.
+For each case, it remembers the rev_id it was built from, so an
+update only has to fetch the cases which have been edited since the
+last one; the rev_ids of all the cases are found with batched page
+info queries.  The stale cases are read concurrently, in batches, and
+the index is saved after each batch, so an interrupted update keeps
+the work it's done.
+
+Lookups go through an IpIndex of all the cases' networks, which makes
+each query a bisection over the sorted networks.  It's rebuilt, in
+one sort, when the cases change, rather than on every query.
+Processes keep the index they loaded, and only reload it when the
+file is replaced.
+
+"""
+import logging
+import os
+import pickle
+import tempfile
+import threading
+
+from django.conf import settings
+
+from spi.fetch_utils import map_concurrently
+from spi.ip_utils import IpIndex, sort_key
+from spi.spi_utils import CacheableSpiCase
+
+
+logger = logging.getLogger('api.case_index')
+
+# Number of cases update_case_index() reads between saves.
+UPDATE_BATCH_SIZE = 200
+
+
+class CaseIndex:
+    def __init__(self):
+        # case name -> (rev_id, tuple of IPv[46]Networks)
+        self.cases = {}
+        self._index = None
+
+
+    def __len__(self):
+        return len(self.cases)
+
+
+    def __getstate__(self):
+        # The IpIndex is cheap to rebuild, and would double the size of
+        # the pickle.
+        state = self.__dict__.copy()
+        state['_index'] = None
+        return state
+
+
+    def rev_id(self, case_name):
+        """Returns the rev_id case_name was indexed at, or None if it
+        isn't indexed.
+
+        """
+        entry = self.cases.get(case_name)
+        return entry and entry[0]
+
+
+    def add(self, case):
+        """Adds (or replaces) the networks for case, a CacheableSpiCase."""
+        networks = tuple(sorted({info.network for info in case.ip_addresses}, key=sort_key))
+        self.cases[case.master_name] = (case.rev_id, networks)
+        self._index = None
+
+
+    def remove(self, case_name):
+        if self.cases.pop(case_name, None) is not None:
+            self._index = None
+
+
+    def lookup(self, network):
+        """Returns a dict mapping the name of each case which mentions an
+        IP or range overlapping network (an address or network) to a
+        list of the IPv[46]Networks it mentions which do, in sort_key()
+        order.
+
+        """
+        if self._index is None:
+            self._index = IpIndex((n, name) for name, (_, networks) in self.cases.items() for n in networks)
+        result = {}
+        for n, name in self._index.overlapping(network):
+            result.setdefault(name, []).append(n)
+        return result
+
+
+def save_case_index(index):
+    """Saves index to settings.API_CASE_INDEX_PATH.  The file is
+    replaced atomically, so readers never see a partly written one.
+
+    """
+    path = settings.API_CASE_INDEX_PATH
+    if not path:
+        logger.warning('API_CASE_INDEX_PATH is not set; not saving case index')
+        return
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+_lock = threading.Lock()
+_loaded = {}  # path -> (mtime, CaseIndex)
+
+
+def get_case_index():
+    """Returns the CaseIndex saved by save_case_index(), or an empty one
+    if there isn't one.
+
+    The index is loaded once per process, and reloaded when a new one
+    is saved.  The same object is returned to every caller, so don't
+    modify it; load_case_index() returns a private copy.
+
+    """
+    path = settings.API_CASE_INDEX_PATH
+    if not path:
+        return CaseIndex()
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return CaseIndex()
+    with _lock:
+        cached = _loaded.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        index = load_case_index()
+        _loaded[path] = (mtime, index)
+        return index
+
+
+def load_case_index():
+    path = settings.API_CASE_INDEX_PATH
+    if not path:
+        return CaseIndex()
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        return CaseIndex()
+
+
+def update_case_index(wiki, case_names, prune=False):
+    """Brings the saved index up to date for case_names, re-reading each
+    case whose rev_id has changed since it was indexed.  Cases which
+    fail to load are logged and skipped, so they'll be retried next
+    time.
+
+    If prune is true, case_names is taken to be all the cases, and any
+    others (e.g. deleted or merged cases) are removed from the index.
+
+    Returns the updated CaseIndex.
+
+    """
+    index = load_case_index()
+    rev_ids = CacheableSpiCase.get_rev_ids(wiki, case_names)
+    stale = [name for name, rev_id in rev_ids.items() if index.rev_id(name) != rev_id]
+    gone = [name for name in index.cases if name not in rev_ids] if prune else []
+    logger.info('updating %d of %d cases, removing %d', len(stale), len(rev_ids), len(gone))
+    for name in gone:
+        index.remove(name)
+    if gone:
+        save_case_index(index)
+
+    def get_case(name):
+        try:
+            return CacheableSpiCase.get(wiki, name, rev_id=rev_ids[name])
+        except Exception:  # pylint: disable=broad-except
+            logger.exception('failed to index %s', name)
+            return None
+
+    failures = 0
+    for i in range(0, len(stale), UPDATE_BATCH_SIZE):
+        cases = map_concurrently(get_case, stale[i:i + UPDATE_BATCH_SIZE])
+        for case in cases:
+            if case is None:
+                failures += 1
+            else:
+                index.add(case)
+        if any(case is not None for case in cases):
+            save_case_index(index)
+        logger.info('indexed %d of %d cases', min(i + UPDATE_BATCH_SIZE, len(stale)), len(stale))
+    logger.info('indexed %d cases (%d failed)', len(stale) - failures, failures)
+    return index
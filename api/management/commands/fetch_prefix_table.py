@@ -0,0 +1,57 @@
+"""Download a prefix-to-AS dump, and save it as a PrefixTable in
+settings.API_PREFIX_TABLE_PATH.
+
+The dump is parsed here, once, so the web workers only have to load
+the compact table.  It's written to a temporary name and then renamed,
+so running processes never see a partial file; they pick up the new
+one on their next lookup.
+
+"""
+import logging
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+import requests
+
+from api.prefix_table import PrefixTable
+from spi.fetch_utils import http_session
+
+
+logger = logging.getLogger('api.fetch_prefix_table')
+
+CHUNK_SIZE = 1 << 20
+
+
+class Command(BaseCommand):
+    help = 'Download a prefix-to-AS dump (e.g. CAIDA RouteViews pfx2as) for the CIDR API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='URL of the dump; it must be gzipped if the URL ends in .gz')
+
+
+    def handle(self, *args, **options):
+        path = settings.API_PREFIX_TABLE_PATH
+        if not path:
+            raise CommandError('API_PREFIX_TABLE_PATH is not set')
+        url = options['url']
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.gz' if url.endswith('.gz') else '')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                with http_session().get(url, stream=True, timeout=(10, 60)) as response:
+                    response.raise_for_status()
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        f.write(chunk)
+            # Make sure it parses before replacing a good table.
+            table = PrefixTable.from_dump(temp_path)
+            if not table:
+                raise CommandError(f'no prefixes found in {url}')
+            table.save(path)
+        except requests.RequestException as ex:
+            raise CommandError(f'failed to download {url}: {ex}') from ex
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        logger.info('wrote %d prefixes from %s to %s', len(table), url, path)
+        self.stdout.write(f'{len(table)} prefixes')
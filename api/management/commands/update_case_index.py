@@ -0,0 +1,50 @@
+"""Bring the cross-case IP index up to date with all the SPI cases,
+open and archived.
+
+Only the cases which have been edited since the last update are read
+again.  Run this periodically, either from a scheduled job, or with
+--interval to loop forever.
+
+"""
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.case_index import update_case_index
+from spi.spi_utils import get_archived_case_names, get_current_case_names
+from wiki_interface import Wiki
+
+
+logger = logging.getLogger('api.update_case_index')
+
+
+class Command(BaseCommand):
+    help = 'Update the index of the IPs mentioned in SPI cases'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval',
+                            type=int,
+                            help='Repeat every INTERVAL seconds, instead of running once')
+        parser.add_argument('cases',
+                            nargs='*',
+                            help='Case names to update (default: all the open and archived cases)')
+
+
+    def handle(self, *args, **options):
+        while True:
+            self.update(options['cases'])
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+
+    def update(self, case_names):
+        wiki = Wiki()
+        t0 = time.time()
+        if case_names:
+            index = update_case_index(wiki, case_names)
+        else:
+            all_names = set(get_current_case_names(wiki)) | set(get_archived_case_names(wiki))
+            index = update_case_index(wiki, sorted(all_names), prune=True)
+        logger.info('case index has %d cases; updated in %.1f sec', len(index), time.time() - t0)
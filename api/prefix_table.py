@@ -0,0 +1,221 @@
+"""A local table of routed prefixes, for finding the network an IP
+address belongs to without asking whois.
+
+The table is loaded from a prefix-to-AS dump, such as CAIDA's
+RouteViews pfx2as files, optionally gzipped.  Each line is either
+
+    <address> <prefix length> <AS>     (pfx2as format)
+    <network>/<prefix length> <AS>     (CIDR format)
+
+separated by whitespace.  Blank lines, and lines starting with #, are
+ignored.  The AS field is kept as a string, since multi-origin
+prefixes are written as (for example) 1234_5678.
+
+Lookups are longest-prefix matches.  Rather than a trie, the table
+keeps, for each prefix length, a sorted array of the prefixes (the
+network number shifted right by the number of host bits) and a
+parallel array of indexes into the list of distinct AS strings.  A
+lookup shifts the address to each prefix length in the table, longest
+first, bisects that length's array, and stops at the first hit.
+That's at most 33 (or 129) bisections, and in practice a couple of
+dozen.  Prefixes of up to 64 bits are stored in machine-word arrays,
+so a full table of a million prefixes takes about 10 MB, instead of
+the ~120 MB of dicts of Python ints.
+
+Parsing a text dump takes several seconds, so fetch_prefix_table
+parses it once and saves the arrays (pickled) to
+settings.API_PREFIX_TABLE_PATH.  Web workers load that file when the
+WSGI application starts (see tools_app.wsgi), so no request waits for
+it, and reload it if it's replaced.
+
+"""
+from array import array
+from bisect import bisect_left
+from dataclasses import dataclass
+import gzip
+from ipaddress import ip_network
+import logging
+import os
+import pickle
+import tempfile
+import threading
+
+from django.conf import settings
+
+
+logger = logging.getLogger('api.prefix_table')
+
+MAX_PREFIXLEN = {4: 32, 6: 128}
+
+
+@dataclass(frozen=True)
+class PrefixMatch:
+    network: object  # IPv4Network or IPv6Network
+    asn: str
+
+
+def _prefix_array(prefixlen, prefixes):
+    """Returns the smallest kind of sorted sequence which can hold
+    prefixes of prefixlen bits.
+
+    """
+    if prefixlen <= 32:
+        return array('I', prefixes)
+    if prefixlen <= 64:
+        return array('Q', prefixes)
+    return list(prefixes)
+
+
+class PrefixTable:
+    def __init__(self, prefixes=()):
+        """prefixes is an iterable of (IPv[46]Network, AS) pairs.  If a
+        network appears more than once, the last AS wins.
+
+        """
+        by_length = {4: {}, 6: {}}  # version -> {prefix length -> {prefix -> AS}}
+        for network, asn in prefixes:
+            host_bits = MAX_PREFIXLEN[network.version] - network.prefixlen
+            prefix = int(network.network_address) >> host_bits
+            by_length[network.version].setdefault(network.prefixlen, {})[prefix] = asn
+
+        asn_ids = {}
+        # version -> [(prefix length, sorted prefixes, AS ids)], longest first
+        self._tables = {4: [], 6: []}
+        self._count = 0
+        for version, lengths in by_length.items():
+            for prefixlen in sorted(lengths, reverse=True):
+                entries = sorted(lengths[prefixlen].items())
+                self._tables[version].append(
+                    (prefixlen,
+                     _prefix_array(prefixlen, (prefix for prefix, _ in entries)),
+                     array('I', (asn_ids.setdefault(asn, len(asn_ids)) for _, asn in entries))))
+                self._count += len(entries)
+        self._asns = list(asn_ids)
+
+
+    def __len__(self):
+        return self._count
+
+
+    def lookup(self, address):
+        """Returns a PrefixMatch for the longest prefix which contains
+        address (an IPv[46]Address), or None.
+
+        """
+        value = int(address)
+        max_prefixlen = MAX_PREFIXLEN[address.version]
+        for prefixlen, prefixes, asn_ids in self._tables[address.version]:
+            host_bits = max_prefixlen - prefixlen
+            prefix = value >> host_bits
+            i = bisect_left(prefixes, prefix)
+            if i < len(prefixes) and prefixes[i] == prefix:
+                return PrefixMatch(ip_network((prefix << host_bits, prefixlen)), self._asns[asn_ids[i]])
+        return None
+
+
+    @staticmethod
+    def parse_lines(lines):
+        """Yields (IPv[46]Network, AS) pairs from the lines of a dump.
+        Lines which can't be parsed are logged and skipped.
+
+        """
+        bad_lines = 0
+        for line in lines:
+            fields = line.split()
+            if not fields or fields[0].startswith('#'):
+                continue
+            try:
+                if '/' in fields[0]:
+                    network = ip_network(fields[0])
+                    asn = fields[1]
+                else:
+                    network = ip_network((fields[0], int(fields[1])))
+                    asn = fields[2]
+            except (IndexError, ValueError):
+                bad_lines += 1
+                if bad_lines <= 10:
+                    logger.warning('skipping bad prefix table line: %r', line)
+                continue
+            yield network, asn
+        if bad_lines:
+            logger.warning('skipped %d bad prefix table lines', bad_lines)
+
+
+    @staticmethod
+    def from_lines(lines):
+        return PrefixTable(PrefixTable.parse_lines(lines))
+
+
+    @staticmethod
+    def from_dump(path):
+        """Builds a PrefixTable from a text dump, which is gunzipped if
+        path ends in .gz.
+
+        """
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt', encoding='utf-8') as lines:
+            return PrefixTable.from_lines(lines)
+
+
+    def save(self, path):
+        """Writes the table to path, in the form load() reads.  The file
+        is replaced atomically, so readers never see a partial one.
+
+        """
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+
+    @staticmethod
+    def load(path):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+
+_lock = threading.Lock()
+_loaded = {}  # path -> (mtime, PrefixTable)
+
+
+def get_prefix_table():
+    """Returns the PrefixTable saved in settings.API_PREFIX_TABLE_PATH,
+    or None if that isn't set or the file doesn't exist.
+
+    The table is loaded once per process (normally by
+    load_prefix_table() at startup), and reloaded if the file is
+    replaced.
+
+    """
+    path = settings.API_PREFIX_TABLE_PATH
+    if not path:
+        return None
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return None
+    with _lock:
+        cached = _loaded.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        logger.info('loading prefix table from %s', path)
+        table = PrefixTable.load(path)
+        logger.info('loaded %d prefixes', len(table))
+        _loaded[path] = (mtime, table)
+        return table
+
+
+def load_prefix_table():
+    """Loads the prefix table, if there is one, so the first request
+    doesn't have to wait for it.  Errors are logged, not raised; the
+    API falls back to whois without the table.
+
+    """
+    try:
+        get_prefix_table()
+    except Exception:  # pylint: disable=broad-except
+        logger.exception('failed to load prefix table')
@@ -0,0 +1,199 @@
+from ipaddress import ip_network
+import os
+import pickle
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch, NonCallableMock
+
+from django.test import override_settings
+
+from api.case_index import CaseIndex, get_case_index, load_case_index, save_case_index, update_case_index
+from spi.spi_utils import CacheableSpiCase, SpiIpInfo
+from wiki_interface import Wiki
+
+
+class CaseIndexFileTestCase(TestCase):
+    """Points settings.API_CASE_INDEX_PATH at a temporary file."""
+    def setUp(self):
+        temp_dir = TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.path = os.path.join(temp_dir.name, 'case-index.pickle')
+        settings_override = override_settings(API_CASE_INDEX_PATH=self.path)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+def make_case(name, rev_id, *ips):
+    return CacheableSpiCase(name, rev_id, [], [SpiIpInfo(ip, '1 January 2020', name) for ip in ips])
+
+
+def networks(*strings):
+    return [ip_network(s) for s in strings]
+
+
+class CaseIndexTest(TestCase):
+    def setUp(self):
+        self.index = CaseIndex()
+        self.index.add(make_case('Fred', 100, '1.2.3.4', '1.2.3.4', '1.2.0.0/16', '2600::1'))
+        self.index.add(make_case('Wilma', 200, '1.2.3.5', '5.6.7.8'))
+
+
+    def test_len_and_rev_id(self):
+        self.assertEqual(len(self.index), 2)
+        self.assertEqual(self.index.rev_id('Fred'), 100)
+        self.assertIsNone(self.index.rev_id('Barney'))
+
+
+    def test_lookup_address(self):
+        self.assertEqual(self.index.lookup(ip_network('1.2.3.4')),
+                         {'Fred': networks('1.2.0.0/16', '1.2.3.4/32')})
+
+
+    def test_lookup_range(self):
+        self.assertEqual(self.index.lookup(ip_network('1.2.3.0/24')),
+                         {'Fred': networks('1.2.0.0/16', '1.2.3.4/32'),
+                          'Wilma': networks('1.2.3.5/32')})
+        self.assertEqual(self.index.lookup(ip_network('2600::/16')),
+                         {'Fred': networks('2600::1/128')})
+        self.assertEqual(self.index.lookup(ip_network('9.0.0.0/8')), {})
+
+
+    def test_add_replaces_case(self):
+        self.index.lookup(ip_network('5.6.7.8'))
+
+        self.index.add(make_case('Wilma', 201, '9.9.9.9'))
+
+        self.assertEqual(self.index.rev_id('Wilma'), 201)
+        self.assertEqual(self.index.lookup(ip_network('5.6.7.8')), {})
+        self.assertEqual(self.index.lookup(ip_network('9.9.9.9')), {'Wilma': networks('9.9.9.9/32')})
+
+
+    def test_remove(self):
+        self.index.lookup(ip_network('5.6.7.8'))
+
+        self.index.remove('Wilma')
+        self.index.remove('Barney')
+
+        self.assertEqual(len(self.index), 1)
+        self.assertEqual(self.index.lookup(ip_network('5.6.7.8')), {})
+
+
+    def test_pickle_leaves_out_ip_index(self):
+        self.index.lookup(ip_network('5.6.7.8'))
+
+        copy = pickle.loads(pickle.dumps(self.index))
+
+        self.assertIsNone(copy._index)  # pylint: disable=protected-access
+        self.assertEqual(copy.cases, self.index.cases)
+        self.assertEqual(copy.lookup(ip_network('5.6.7.8')), {'Wilma': networks('5.6.7.8/32')})
+
+
+class GetCaseIndexTest(CaseIndexFileTestCase):
+    def test_empty_if_never_saved(self):
+        self.assertEqual(len(get_case_index()), 0)
+
+
+    def test_empty_if_no_path(self):
+        with override_settings(API_CASE_INDEX_PATH=None):
+            save_case_index(CaseIndex())
+            self.assertEqual(len(get_case_index()), 0)
+        self.assertFalse(os.path.exists(self.path))
+
+
+    def test_loaded_once_per_file_version(self):
+        index = CaseIndex()
+        index.add(make_case('Fred', 100, '1.2.3.4'))
+        save_case_index(index)
+
+        with patch('api.case_index.load_case_index', wraps=load_case_index) as mock_load_case_index:
+            first = get_case_index()
+            second = get_case_index()
+
+        self.assertIs(first, second)
+        mock_load_case_index.assert_called_once_with()
+        self.assertEqual(first.cases, index.cases)
+
+        index.add(make_case('Wilma', 200, '5.6.7.8'))
+        save_case_index(index)
+        os.utime(self.path, (0, 0))
+
+        self.assertEqual(len(get_case_index()), 2)
+
+
+@patch('api.case_index.CacheableSpiCase', autospec=True)
+class UpdateCaseIndexTest(CaseIndexFileTestCase):
+    # pylint: disable=invalid-name
+
+    def setUp(self):
+        super().setUp()
+        self.wiki = NonCallableMock(Wiki)
+        index = CaseIndex()
+        index.add(make_case('Fred', 100, '1.2.3.4'))
+        index.add(make_case('Wilma', 200, '5.6.7.8'))
+        save_case_index(index)
+
+
+    @staticmethod
+    def saved_index():
+        return load_case_index()
+
+
+    def test_only_changed_cases_are_read(self, mock_CacheableSpiCase):
+        mock_CacheableSpiCase.get_rev_ids.return_value = {'Fred': 100, 'Wilma': 201, 'Barney': 300}
+        mock_CacheableSpiCase.get.side_effect = lambda wiki, name, rev_id: {
+            'Wilma': make_case('Wilma', 201, '9.9.9.9'),
+            'Barney': make_case('Barney', 300, '1.2.3.0/24'),
+        }[name]
+
+        update_case_index(self.wiki, ['Fred', 'Wilma', 'Barney'])
+
+        mock_CacheableSpiCase.get_rev_ids.assert_called_once_with(self.wiki, ['Fred', 'Wilma', 'Barney'])
+        self.assertCountEqual([(c.args[1], c.kwargs['rev_id']) for c in mock_CacheableSpiCase.get.call_args_list],
+                              [('Wilma', 201), ('Barney', 300)])
+        index = self.saved_index()
+        self.assertEqual({name: index.rev_id(name) for name in index.cases}, {'Fred': 100, 'Wilma': 201, 'Barney': 300})
+        self.assertEqual(index.lookup(ip_network('1.2.3.4')), {'Fred': networks('1.2.3.4/32'),
+                                                               'Barney': networks('1.2.3.0/24')})
+
+
+    def test_prune_removes_missing_cases(self, mock_CacheableSpiCase):
+        mock_CacheableSpiCase.get_rev_ids.return_value = {'Fred': 100}
+
+        update_case_index(self.wiki, ['Fred'], prune=True)
+
+        mock_CacheableSpiCase.get.assert_not_called()
+        self.assertEqual(list(self.saved_index().cases), ['Fred'])
+
+
+    def test_without_prune_other_cases_are_kept(self, mock_CacheableSpiCase):
+        mock_CacheableSpiCase.get_rev_ids.return_value = {'Fred': 100}
+
+        index = update_case_index(self.wiki, ['Fred'])
+
+        self.assertEqual(list(index.cases), ['Fred', 'Wilma'])
+
+
+    def test_failed_case_is_skipped(self, mock_CacheableSpiCase):
+        mock_CacheableSpiCase.get_rev_ids.return_value = {'Fred': 101, 'Wilma': 201}
+        mock_CacheableSpiCase.get.side_effect = lambda wiki, name, rev_id: {
+            'Wilma': make_case('Wilma', 201, '9.9.9.9'),
+        }[name]
+
+        with self.assertLogs('api.case_index', level='ERROR'):
+            update_case_index(self.wiki, ['Fred', 'Wilma'])
+
+        index = self.saved_index()
+        self.assertEqual(index.rev_id('Fred'), 100)
+        self.assertEqual(index.rev_id('Wilma'), 201)
+
+
+    def test_saved_after_each_batch(self, mock_CacheableSpiCase):
+        mock_CacheableSpiCase.get_rev_ids.return_value = {'Fred': 101, 'Wilma': 201, 'Barney': 300}
+        mock_CacheableSpiCase.get.side_effect = lambda wiki, name, rev_id: make_case(name, rev_id)
+        saved = []
+
+        with patch('api.case_index.UPDATE_BATCH_SIZE', 2), \
+             patch('api.case_index.save_case_index', side_effect=lambda index: saved.append(len(index))):
+            update_case_index(self.wiki, ['Fred', 'Wilma', 'Barney'])
+
+        self.assertEqual(saved, [2, 3])
@@ -0,0 +1,112 @@
+from ipaddress import ip_address, ip_network
+import os
+import tempfile
+from unittest import TestCase
+
+from django.test import override_settings
+
+from api.prefix_table import get_prefix_table, load_prefix_table, PrefixMatch, PrefixTable
+
+
+LINES = ['# comment',
+         '',
+         '1.0.0.0\t8\t100',
+         '1.2.0.0\t16\t200',
+         '1.2.3.0/24 300_301',
+         '2600::/32 400',
+         ]
+
+
+class PrefixTableTest(TestCase):
+    def test_from_lines_reads_both_formats(self):
+        table = PrefixTable.from_lines(LINES)
+
+        self.assertEqual(len(table), 4)
+
+
+    def test_lookup_returns_longest_match(self):
+        table = PrefixTable.from_lines(LINES)
+
+        self.assertEqual(table.lookup(ip_address('1.2.3.4')), PrefixMatch(ip_network('1.2.3.0/24'), '300_301'))
+        self.assertEqual(table.lookup(ip_address('1.2.4.4')), PrefixMatch(ip_network('1.2.0.0/16'), '200'))
+        self.assertEqual(table.lookup(ip_address('1.3.0.1')), PrefixMatch(ip_network('1.0.0.0/8'), '100'))
+        self.assertEqual(table.lookup(ip_address('2600::1')), PrefixMatch(ip_network('2600::/32'), '400'))
+
+
+    def test_lookup_miss_returns_none(self):
+        table = PrefixTable.from_lines(LINES)
+
+        self.assertIsNone(table.lookup(ip_address('2.0.0.1')))
+        self.assertIsNone(table.lookup(ip_address('2601::1')))
+
+
+    def test_bad_lines_are_skipped(self):
+        with self.assertLogs('api.prefix_table', level='WARNING'):
+            table = PrefixTable.from_lines(['1.0.0.0 8 100', '1.0.0.0 junk 100', '1.2.3.4/8 100', 'junk'])
+
+        self.assertEqual(len(table), 1)
+
+
+    def test_last_duplicate_wins(self):
+        table = PrefixTable.from_lines(['1.0.0.0 8 100', '1.0.0.0/8 200'])
+
+        self.assertEqual(len(table), 1)
+        self.assertEqual(table.lookup(ip_address('1.0.0.1')).asn, '200')
+
+
+    def test_long_ipv6_prefixes(self):
+        table = PrefixTable.from_lines(['2600::/32 400', '2600::1:0/112 500', '2600::1/128 600'])
+
+        self.assertEqual(table.lookup(ip_address('2600::1')), PrefixMatch(ip_network('2600::1/128'), '600'))
+        self.assertEqual(table.lookup(ip_address('2600::1:1')), PrefixMatch(ip_network('2600::1:0/112'), '500'))
+        self.assertEqual(table.lookup(ip_address('2600::2')), PrefixMatch(ip_network('2600::/32'), '400'))
+
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'prefixes.pickle')
+            PrefixTable.from_lines(LINES).save(path)
+
+            table = PrefixTable.load(path)
+
+        self.assertEqual(len(table), 4)
+        self.assertEqual(table.lookup(ip_address('1.2.3.4')), PrefixMatch(ip_network('1.2.3.0/24'), '300_301'))
+
+
+class GetPrefixTableTest(TestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(temp_dir.cleanup)
+        self.path = os.path.join(temp_dir.name, 'prefixes.pickle')
+
+
+    def test_no_setting_returns_none(self):
+        with override_settings(API_PREFIX_TABLE_PATH=None):
+            self.assertIsNone(get_prefix_table())
+
+
+    def test_missing_file_returns_none(self):
+        with override_settings(API_PREFIX_TABLE_PATH=self.path):
+            self.assertIsNone(get_prefix_table())
+
+
+    def test_table_is_loaded_once_and_reloaded_when_modified(self):
+        PrefixTable.from_lines(['1.0.0.0 8 100']).save(self.path)
+
+        with override_settings(API_PREFIX_TABLE_PATH=self.path):
+            table = get_prefix_table()
+            self.assertIs(get_prefix_table(), table)
+            self.assertEqual(table.lookup(ip_address('1.0.0.1')).asn, '100')
+
+            PrefixTable.from_lines(['1.0.0.0 8 200']).save(self.path)
+            os.utime(self.path, (0, 0))
+            self.assertEqual(get_prefix_table().lookup(ip_address('1.0.0.1')).asn, '200')
+
+
+    def test_load_prefix_table_logs_bad_file(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'junk')
+
+        with override_settings(API_PREFIX_TABLE_PATH=self.path):
+            with self.assertLogs('api.prefix_table', level='ERROR'):
+                load_prefix_table()
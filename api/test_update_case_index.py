@@ -0,0 +1,36 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+from django.core.management import call_command
+
+from api.case_index import CaseIndex
+
+
+@patch('api.management.commands.update_case_index.Wiki', autospec=True)
+@patch('api.management.commands.update_case_index.update_case_index', autospec=True)
+@patch('api.management.commands.update_case_index.get_archived_case_names', autospec=True)
+@patch('api.management.commands.update_case_index.get_current_case_names', autospec=True)
+class UpdateCaseIndexCommandTest(TestCase):
+    # pylint: disable=invalid-name
+
+    def test_updates_open_and_archived_cases(self, mock_get_current_case_names, mock_get_archived_case_names,
+                                             mock_update_case_index, mock_Wiki):
+        mock_get_current_case_names.return_value = ['Wilma', 'Fred']
+        mock_get_archived_case_names.return_value = ['Fred', 'Barney']
+        mock_update_case_index.return_value = CaseIndex()
+
+        call_command('update_case_index')
+
+        mock_update_case_index.assert_called_once_with(mock_Wiki.return_value, ['Barney', 'Fred', 'Wilma'],
+                                                       prune=True)
+
+
+    def test_named_cases_only(self, mock_get_current_case_names, mock_get_archived_case_names,
+                              mock_update_case_index, mock_Wiki):
+        mock_update_case_index.return_value = CaseIndex()
+
+        call_command('update_case_index', 'Fred')
+
+        mock_get_current_case_names.assert_not_called()
+        mock_get_archived_case_names.assert_not_called()
+        mock_update_case_index.assert_called_once_with(mock_Wiki.return_value, ['Fred'])
@@ -1,10 +1,18 @@
+import json
 from unittest.mock import patch, NonCallableMock
-from ipaddress import IPv4Address, IPv6Address, IPv4Network, IPv6Network
+from ipaddress import ip_address, IPv4Address, IPv6Address, IPv4Network, IPv6Network
 
+from django.contrib.auth import get_user_model
 from django.test import TestCase
 from django.test import Client
 
-from api.views import CidrView, get_ranges, get_whois_data, find_smallest_range, int_to_bits
+import requests
+
+from api.case_index import CaseIndex
+from api.prefix_table import PrefixTable
+from api.views import (CidrView, candidate_keys, get_ranges, get_whois_data, find_smallest_range, iter_ranges,
+                       iter_whois_networks, WHOIS_CACHE_TIMEOUT, WHOIS_TIMEOUT)
+from spi.spi_utils import CacheableSpiCase, SpiIpInfo
 
 @patch('api.views.get_whois_data')
 class CidrViewTest(TestCase):
@@ -27,6 +35,147 @@ class CidrViewTest(TestCase):
             }]})
 
 
+@patch('api.views.get_whois_data')
+class CidrViewPostTest(TestCase):
+    def post(self, body, content_type):
+        return self.client.post('/api/cidr/', body, content_type=content_type)
+
+
+    def force_login(self):
+        user = get_user_model().objects.create_user('my-test-user')
+        self.client.force_login(user, backend='django.contrib.auth.backends.ModelBackend')
+
+
+    @staticmethod
+    def ndjson(response):
+        return [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+
+    def test_post_json_list_streams_ndjson_ranges(self, mock_get_whois_data):
+        values = {'100.0.0.1': {'asn_cidr': '100.0.0.0/24'},
+                  '200.0.0.2': {'asn_cidr': '200.0.0.0/24'},
+                  }
+        mock_get_whois_data.side_effect = lambda ip: values[ip]
+
+        response = self.post(json.dumps(['100.0.0.1', '100.0.0.2', '200.0.0.2']), 'application/json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertCountEqual(self.ndjson(response), [
+            {'asn_cidr': '100.0.0.0/24', 'observed_cidr': '100.0.0.0/30'},
+            {'asn_cidr': '200.0.0.0/24', 'observed_cidr': '200.0.0.2/32'},
+            ])
+
+
+    def test_post_json_object(self, mock_get_whois_data):
+        mock_get_whois_data.return_value = {'asn_cidr': '100.0.0.0/24'}
+
+        response = self.post(json.dumps({'ips': ['100.0.0.1']}), 'application/json')
+
+        self.assertEqual(self.ndjson(response), [{'asn_cidr': '100.0.0.0/24', 'observed_cidr': '100.0.0.1/32'}])
+
+
+    def test_post_ndjson(self, mock_get_whois_data):
+        mock_get_whois_data.return_value = {'asn_cidr': '100.0.0.0/24'}
+
+        response = self.post('"100.0.0.1"\n\n{"ip": "100.0.0.3"}\n', 'application/x-ndjson')
+
+        self.assertEqual(self.ndjson(response), [{'asn_cidr': '100.0.0.0/24', 'observed_cidr': '100.0.0.0/30'}])
+
+
+    def test_post_invalid_addresses_returns_400(self, mock_get_whois_data):
+        response = self.post(json.dumps(['100.0.0.1', 'junk', 42]), 'application/json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'invalid addresses: junk, 42'})
+        mock_get_whois_data.assert_not_called()
+
+
+    def test_post_bad_body_returns_400(self, mock_get_whois_data):
+        for body, content_type in [('{', 'application/json'),
+                                   ('{"ip": "1.2.3.4"}', 'application/json'),
+                                   ('1.2.3.4', 'text/plain')]:
+            with self.subTest(body=body, content_type=content_type):
+                response = self.post(body, content_type)
+
+                self.assertEqual(response.status_code, 400)
+        mock_get_whois_data.assert_not_called()
+
+
+    def test_post_too_many_addresses_returns_400(self, mock_get_whois_data):
+        self.force_login()
+        with patch('api.views.MAX_POSTED_IPS', 2):
+            response = self.post(json.dumps(['1.2.3.4'] * 3), 'application/json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'too many addresses (3); the limit is 2'})
+        mock_get_whois_data.assert_not_called()
+
+
+    def test_anonymous_post_has_lower_limit(self, mock_get_whois_data):
+        mock_get_whois_data.return_value = {'asn_cidr': '1.2.3.0/24'}
+
+        with patch('api.views.MAX_ANONYMOUS_POSTED_IPS', 2):
+            response = self.post(json.dumps(['1.2.3.4'] * 3), 'application/json')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {'error': 'too many addresses (3); the limit is 2'})
+
+            self.force_login()
+            response = self.post(json.dumps(['1.2.3.4'] * 3), 'application/json')
+            self.assertEqual(response.status_code, 200)
+
+
+@patch('api.views.get_case_index')
+class CaseIpViewTest(TestCase):
+    def setUp(self):
+        self.index = CaseIndex()
+        self.index.add(CacheableSpiCase('Fred', 100, [], [SpiIpInfo('1.2.3.4', '1 January 2020', 'Fred'),
+                                                          SpiIpInfo('1.2.0.0/16', '1 January 2020', 'Fred')]))
+        self.index.add(CacheableSpiCase('Wilma', 200, [], [SpiIpInfo('1.2.3.5', '1 January 2020', 'Wilma'),
+                                                           SpiIpInfo('2600::1', '1 January 2020', 'Wilma')]))
+
+
+    def test_get_returns_cases_for_each_ip(self, mock_get_case_index):
+        mock_get_case_index.return_value = self.index
+
+        response = self.client.get('/api/case-ips/', {'ip': ['1.2.3.0/24', '2600::1', '9.9.9.9']})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            'ips': {'1.2.3.0/24': {'Fred': ['1.2.0.0/16', '1.2.3.4/32'],
+                                   'Wilma': ['1.2.3.5/32']},
+                    '2600::1': {'Wilma': ['2600::1/128']},
+                    '9.9.9.9': {}}})
+
+
+    def test_get_with_invalid_ip_returns_400(self, mock_get_case_index):
+        mock_get_case_index.return_value = self.index
+
+        response = self.client.get('/api/case-ips/', {'ip': '1.2.3'})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('error', response.json())
+
+
+@patch('api.views.get_whois_data')
+class IterRangesTest(TestCase):
+    def test_ranges_are_yielded_before_later_lookups(self, mock_get_whois_data):
+        values = {'100.0.0.1': {'asn_cidr': '100.0.0.0/24'},
+                  '200.0.0.2': {'asn_cidr': '200.0.0.0/24'},
+                  }
+        mock_get_whois_data.side_effect = lambda ip: values[ip]
+
+        with patch('api.views.WHOIS_MAX_WORKERS', 1):
+            ranges = iter_ranges(['100.0.0.1', '200.0.0.2'])
+            first = next(ranges)
+            calls = mock_get_whois_data.call_count
+            rest = list(ranges)
+
+        self.assertEqual(first, {'asn_cidr': '100.0.0.0/24', 'observed_cidr': '100.0.0.1/32'})
+        self.assertEqual(calls, 1)
+        self.assertEqual(rest, [{'asn_cidr': '200.0.0.0/24', 'observed_cidr': '200.0.0.2/32'}])
+
+
 @patch('api.views.get_whois_data')
 class GetRangesTest(TestCase):
     def test_get_ranges_with_multiple_ips_in_the_same_range_returns_correct_ranges(self, mock_get_whois_data):
@@ -57,30 +206,132 @@ class GetRangesTest(TestCase):
             ])
 
 
-@patch('api.views.requests')
+@patch('api.views.http_session')
 class GetWhoisDataTest(TestCase):
-    def test_json_data_is_returned(self, mock_requests):
+    def test_json_data_is_returned(self, mock_http_session):
         whois_data = {
             "asn_cidr" : "1.2.3.0/24",
         }
-        mock_requests.get().json.return_value = whois_data
+        mock_http_session().get().json.return_value = whois_data
         data = get_whois_data('1.2.3.4')
         self.assertEqual(data, whois_data)
 
 
-    def test_backend_call_passes_correct_arguments(self, mock_requests):
+    def test_backend_call_passes_correct_arguments(self, mock_http_session):
         get_whois_data('1.2.3.4')
-        mock_requests.get.assert_called_once_with('https://whois-referral.toolforge.org/w/gateway.py',
-                                                  params = {
-                                                      'ip': '1.2.3.4',
-                                                      'lookup': 'true',
-                                                      'format': 'json',
-                                                  })
+        mock_http_session().get.assert_called_once_with('https://whois-referral.toolforge.org/w/gateway.py',
+                                                        params = {
+                                                            'ip': '1.2.3.4',
+                                                            'lookup': 'true',
+                                                            'format': 'json',
+                                                        },
+                                                        timeout=WHOIS_TIMEOUT)
 
 
-    def test_raise_for_status_is_called(self, mock_requests):
+    def test_raise_for_status_is_called(self, mock_http_session):
         get_whois_data('1.2.3.4')
-        mock_requests.get().raise_for_status.assert_called_once_with()
+        mock_http_session().get().raise_for_status.assert_called_once_with()
+
+
+def resolve_whois_networks(addresses):
+    resolved = {}
+    for batch, _ in iter_whois_networks(addresses):
+        resolved.update(batch)
+    return resolved
+
+
+@patch('api.views.cache', autospec=True)
+@patch('api.views.get_whois_data')
+class IterWhoisNetworksTest(TestCase):
+    # pylint: disable=invalid-name
+
+    def test_addresses_in_one_network_need_one_lookup(self, mock_get_whois_data, mock_cache):
+        mock_cache.get_many.return_value = {}
+        mock_get_whois_data.return_value = {'asn_cidr': '100.0.0.0/16'}
+        addresses = [ip_address('100.0.0.1'), ip_address('100.0.0.200'), ip_address('100.0.0.1')]
+
+        networks = resolve_whois_networks(addresses)
+
+        self.assertEqual(networks, {ip_address('100.0.0.1'): IPv4Network('100.0.0.0/16'),
+                                    ip_address('100.0.0.200'): IPv4Network('100.0.0.0/16')})
+        mock_get_whois_data.assert_called_once_with('100.0.0.1')
+        mock_cache.set_many.assert_called_once_with({'api.whois.100.0.0.0/16': {'asn_cidr': '100.0.0.0/16'}},
+                                                    WHOIS_CACHE_TIMEOUT)
+
+
+    def test_addresses_in_cached_networks_are_not_looked_up(self, mock_get_whois_data, mock_cache):
+        mock_cache.get_many.return_value = {'api.whois.100.0.0.0/16': {'asn_cidr': '100.0.0.0/16'},
+                                            'api.whois.2600::/32': {'asn_cidr': '2600::/32'}}
+
+        networks = resolve_whois_networks([ip_address('100.0.200.1'), ip_address('2600::1')])
+
+        self.assertEqual(networks, {ip_address('100.0.200.1'): IPv4Network('100.0.0.0/16'),
+                                    ip_address('2600::1'): IPv6Network('2600::/32')})
+        keys = mock_cache.get_many.call_args.args[0]
+        self.assertIn('api.whois.100.0.0.0/16', keys)
+        self.assertIn('api.whois.2600::/32', keys)
+        mock_get_whois_data.assert_not_called()
+        mock_cache.set_many.assert_not_called()
+
+
+    def test_prefix_table_is_consulted_first(self, mock_get_whois_data, mock_cache):
+        mock_cache.get_many.return_value = {}
+        mock_get_whois_data.return_value = {'asn_cidr': '200.0.0.0/16'}
+        table = PrefixTable.from_lines(['100.0.0.0 16 1234'])
+
+        with patch('api.views.get_prefix_table', return_value=table):
+            networks = resolve_whois_networks([ip_address('100.0.0.1'), ip_address('200.0.0.1')])
+
+        self.assertEqual(networks, {ip_address('100.0.0.1'): IPv4Network('100.0.0.0/16'),
+                                    ip_address('200.0.0.1'): IPv4Network('200.0.0.0/16')})
+        mock_get_whois_data.assert_called_once_with('200.0.0.1')
+
+
+    def test_failed_lookups_give_single_host_networks(self, mock_get_whois_data, mock_cache):
+        mock_cache.get_many.return_value = {}
+        mock_get_whois_data.side_effect = [requests.ConnectionError('oops'), {'asn_cidr': 'NA'}]
+
+        with self.assertLogs('api.views', level='WARNING'):
+            networks = resolve_whois_networks([ip_address('100.0.0.1'), ip_address('200.0.0.1')])
+
+        self.assertEqual(networks, {ip_address('100.0.0.1'): IPv4Network('100.0.0.1/32'),
+                                    ip_address('200.0.0.1'): IPv4Network('200.0.0.1/32')})
+        mock_cache.set_many.assert_not_called()
+
+
+    def test_cache_is_read_in_chunks(self, mock_get_whois_data, mock_cache):
+        mock_cache.get_many.return_value = {'api.whois.100.0.0.0/16': {'asn_cidr': '100.0.0.0/16'}}
+        addresses = [ip_address('100.0.0.1'), ip_address('100.0.0.2')]
+
+        with patch('api.views.WHOIS_CACHE_CHUNK_SIZE', 10):
+            networks = resolve_whois_networks(addresses)
+
+        self.assertEqual(networks, {a: IPv4Network('100.0.0.0/16') for a in addresses})
+        chunks = [c.args[0] for c in mock_cache.get_many.call_args_list]
+        self.assertTrue(all(len(chunk) <= 10 for chunk in chunks))
+        self.assertEqual(sorted(sum(chunks, [])), candidate_keys(addresses))
+        mock_get_whois_data.assert_not_called()
+
+
+class CandidateKeysTest(TestCase):
+    def test_keys_are_shared_within_a_bucket(self):
+        one = candidate_keys([ip_address('100.0.0.1')])
+        two = candidate_keys([ip_address('100.0.0.1'), ip_address('100.0.0.129')])
+
+        self.assertEqual(len(one), 25)
+        self.assertIn('api.whois.100.0.0.0/8', one)
+        self.assertIn('api.whois.100.0.0.0/24', one)
+        self.assertIn('api.whois.100.0.0.1/32', one)
+        # Only the networks more specific than the /24 bucket differ.
+        self.assertEqual(len(two), 25 + 8)
+
+
+    def test_ipv6(self):
+        keys = candidate_keys([ip_address('2600::1')])
+
+        self.assertEqual(len(keys), 49)
+        self.assertIn('api.whois.2600::/16', keys)
+        self.assertIn('api.whois.2600::/64', keys)
 
 
 class FindSmallestRangeTest(TestCase):
@@ -114,29 +365,3 @@ class FindSmallestRangeTest(TestCase):
                IPv6Address('2000::4'),
                IPv6Address('2000::5')]
         self.assertEqual(find_smallest_range(ips), IPv6Network('2000::/125'))
-
-
-class IntToBitsTest(TestCase):
-    def test_rases_value_error_on_overflow(self):
-        with self.assertRaises(ValueError, msg='9999 does not fit into 4 bits'):
-            int_to_bits(9999, 4)
-
-
-    def test_raises_value_error_on_negative_numbers(self):
-        with self.assertRaises(ValueError, msg='cannot convert negative values (-1)'):
-            int_to_bits(-1, 4)
-
-
-    def test_zero_is_correctly_converted(self):
-        self.assertEqual(int_to_bits(0, 8),
-                         [0, 0, 0, 0, 0, 0, 0, 0])
-
-
-    def test_positive_value_is_correctly_converted(self):
-        self.assertEqual(int_to_bits(42, 8),
-                         [0, 0, 1, 0, 1, 0, 1, 0])
-
-
-    def test_large_value_is_correctly_converted(self):
-        self.assertEqual(int_to_bits(1 << 127, 128),
-                         [1] + [0] * 127)
@@ -1,7 +1,8 @@
 from django.urls import path
-from api.views import CidrView
+from api.views import CaseIpView, CidrView
 
 urlpatterns = [
     # pylint: disable=line-too-long
     path('cidr/', CidrView.as_view(), name="api-cidr"),
+    path('case-ips/', CaseIpView.as_view(), name="api-case-ips"),
 ]
@@ -1,17 +1,53 @@
+from bisect import bisect_left
+import json
 import logging
 from collections import defaultdict
-from ipaddress import ip_address, ip_network, IPv4Network, IPv6Network
+from ipaddress import ip_address, ip_network
 
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.decorators import method_decorator
 from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 
 import requests
 
+from api.case_index import get_case_index
+from api.prefix_table import get_prefix_table
+from spi import icache as cache
+from spi.fetch_utils import http_session, map_as_completed
+from spi.ip_utils import common_network
+
 # pylint: disable=invalid-name
 
 logger = logging.getLogger('api.views')
 
+WHOIS_URL = 'https://whois-referral.toolforge.org/w/gateway.py'
+WHOIS_TIMEOUT = (5, 30)  # seconds (connect, read)
+WHOIS_CACHE_TIMEOUT = 7 * 24 * 60 * 60  # seconds
+
+# The gateway is a shared toolforge service; don't hammer it.
+WHOIS_MAX_WORKERS = 5
+
+# When looking for a cached range which covers an address, only
+# ranges with prefix lengths between these are considered.
+WHOIS_PREFIXLEN_LIMITS = {4: (8, 32), 6: (16, 64)}
+
+# Unresolved addresses are looked up in waves, one address per bucket
+# of this size per wave, so addresses which share a whois range
+# usually only cost one lookup between them.
+WHOIS_BUCKET_PREFIXLEN = {4: 24, 6: 48}
+
+# Candidate cache keys are fetched in chunks of this many.
+WHOIS_CACHE_CHUNK_SIZE = 1000
 
+# The most addresses CidrView.post() will take from a logged in user,
+# and from anyone else.  Every address can cost a whois lookup on a
+# shared service, so the anonymous limit is about what fits in a GET.
+MAX_POSTED_IPS = 10000
+MAX_ANONYMOUS_POSTED_IPS = 100
+
+
+@method_decorator(csrf_exempt, name='dispatch')
 class CidrView(View):
     """Given a set of IP addresses, returns a minimal set of CIDR ranges
     which cover the addresses.
@@ -36,6 +72,14 @@ class CidrView(View):
 
     The observed_cidr will always be a subset of the asn_cidr.
 
+    For long lists of addresses, POST them instead, either as JSON (a
+    list of address strings, or an object with an 'ips' list), or as
+    NDJSON (one address string, or {"ip": address} object, per line),
+    with the matching Content-Type.  The response is NDJSON, one range
+    per line, and each range is sent as soon as it's complete, rather
+    than when all the lookups are done.  Logged in users can POST up
+    to MAX_POSTED_IPS addresses; anyone else, MAX_ANONYMOUS_POSTED_IPS.
+
     """
     def get(self, request):
         ips = request.GET.getlist('ip')
@@ -45,16 +89,253 @@ class CidrView(View):
         })
 
 
-def get_ranges(ips):
-    networks = defaultdict(list)
+    def post(self, request):
+        max_ips = MAX_POSTED_IPS if request.user.is_authenticated else MAX_ANONYMOUS_POSTED_IPS
+        try:
+            ips = parse_posted_ips(request, max_ips)
+        except ValueError as ex:
+            return JsonResponse({'error': str(ex)}, status=400)
+        logger.debug("%d ips posted", len(ips))
+        lines = (json.dumps(data) + '\n' for data in iter_ranges(ips))
+        return StreamingHttpResponse(lines, content_type='application/x-ndjson')
+
+
+def parse_posted_ips(request, max_ips):
+    """Returns the list of IP address strings in a POST to CidrView.
+    Raises ValueError if the body can't be parsed, has more than
+    max_ips addresses, or has any invalid addresses.
+
+    """
+    content_type = request.content_type
+    try:
+        if content_type == 'application/json':
+            data = json.loads(request.body)
+            ips = data['ips'] if isinstance(data, dict) else data
+        elif content_type in ('application/x-ndjson', 'application/jsonl'):
+            items = [json.loads(line) for line in request.body.splitlines() if line.strip()]
+            ips = [item['ip'] if isinstance(item, dict) else item for item in items]
+        else:
+            raise ValueError(f'unsupported content type: {content_type}')
+    except (KeyError, TypeError, UnicodeDecodeError, json.JSONDecodeError) as ex:
+        raise ValueError(f'invalid request body: {ex}') from ex
+    if not isinstance(ips, list):
+        raise ValueError('expected a list of addresses')
+    if len(ips) > max_ips:
+        raise ValueError(f'too many addresses ({len(ips)}); the limit is {max_ips}')
+    invalid = []
     for ip in ips:
-        address = ip_address(ip)
-        whois_data = get_whois_data(ip)
+        try:
+            if not isinstance(ip, str):
+                raise ValueError(ip)
+            ip_address(ip)
+        except ValueError:
+            invalid.append(ip)
+    if invalid:
+        raise ValueError(f'invalid addresses: {", ".join(map(str, invalid[:10]))}')
+    return ips
+
+
+class CaseIpView(View):
+    """Given a set of IP addresses and/or CIDR ranges, returns the SPI
+    cases which mention any IPs or ranges overlapping each of them,
+    from the index maintained by the update_case_index management
+    command.  For example, /api/case-ips/?ip=100.0.0.0/24 might return:
+
+      {
+        'ips': {
+          '100.0.0.0/24': {
+            'Fred': ['100.0.0.1/32', '100.0.0.0/16'],
+            'Wilma': ['100.0.0.128/25']
+          }
+        }
+      }
+
+    """
+    def get(self, request):
+        ips = request.GET.getlist('ip')
+        logger.debug("ips = %s", ips)
+        try:
+            networks = {ip: ip_network(ip.strip(), strict=False) for ip in ips}
+        except ValueError as ex:
+            return JsonResponse({'error': str(ex)}, status=400)
+        index = get_case_index()
+        results = {}
+        for ip, network in networks.items():
+            cases = index.lookup(network)
+            results[ip] = {name: [str(n) for n in cases[name]] for name in sorted(cases)}
+        return JsonResponse({'ips': results})
+
+
+def get_ranges(ips):
+    return list(iter_ranges(ips))
+
+
+def iter_ranges(ips):
+    """Yields the same dicts as get_ranges() returns, each as soon as
+    all the addresses in its asn_cidr are known.
+
+    An asn_cidr is complete once none of the addresses still being
+    looked up fall inside it, since an address can only belong to a
+    network which contains it.
+
+    """
+    addresses = [ip_address(ip) for ip in ips]
+    remaining = {4: sorted({int(a) for a in addresses if a.version == 4}),
+                 6: sorted({int(a) for a in addresses if a.version == 6})}
+    pending = defaultdict(list)
+    for resolved, _ in iter_whois_networks(addresses):
+        for address, network in resolved.items():
+            pending[network].append(address)
+            values = remaining[address.version]
+            del values[bisect_left(values, int(address))]
+        for network in list(pending):
+            values = remaining[network.version]
+            i = bisect_left(values, int(network.network_address))
+            if i == len(values) or values[i] > int(network.broadcast_address):
+                yield range_data(network, pending.pop(network))
+
+
+def range_data(network, addresses):
+    return {'asn_cidr': str(network),
+            'observed_cidr': str(find_smallest_range(addresses)),
+            }
+
+
+def iter_whois_networks(addresses):
+    """Resolves the addresses (IPv[46]Address objects) to the asn_cidr
+    networks which whois says they belong to.  Yields (resolved,
+    unresolved) tuples as the work progresses, where resolved is a
+    dict mapping newly resolved addresses to their networks, and
+    unresolved is the set of addresses still to be resolved.
+
+    If there's a local prefix table (see api.prefix_table), that's
+    consulted first.  Then, networks are cached (under a key derived
+    from the network) for WHOIS_CACHE_TIMEOUT, and an address covered
+    by a cached network is resolved without a whois lookup.  The
+    remaining addresses are looked up concurrently, in waves.  If
+    whois doesn't give a usable asn_cidr, the address is its own
+    (single host) network.
+
+    """
+    unresolved = set(addresses)
+    table = get_prefix_table()
+    if table:
+        resolved = {}
+        for address in unresolved:
+            match = table.lookup(address)
+            if match:
+                resolved[address] = match.network
+        unresolved -= resolved.keys()
+        logger.info('resolved %d addresses from the prefix table', len(resolved))
+        yield resolved, unresolved
+    if not unresolved:
+        return
+
+    keys = candidate_keys(unresolved)
+    known = set()
+    for i in range(0, len(keys), WHOIS_CACHE_CHUNK_SIZE):
+        cached = cache.get_many(keys[i:i + WHOIS_CACHE_CHUNK_SIZE])
+        known.update(ip_network(data['asn_cidr']) for data in cached.values())
+    lookups = 0
+    while unresolved:
+        resolved = {}
+        for address in unresolved:
+            network = find_covering_network(address, known)
+            if network:
+                resolved[address] = network
+        unresolved -= resolved.keys()
+        yield resolved, unresolved
+
+        # One address from each bucket, so nearby addresses don't all
+        # get looked up at once; most of them will share a network.
+        wave = {}
+        for address in sorted(unresolved, key=lambda a: (a.version, a)):
+            bucket = ip_network(address).supernet(new_prefix=WHOIS_BUCKET_PREFIXLEN[address.version])
+            wave.setdefault(bucket, address)
+        in_flight = set(wave.values())
+        lookups += len(in_flight)
+        new_networks = {}
+        for address, whois_data in map_as_completed(lookup_whois, list(wave.values()), WHOIS_MAX_WORKERS):
+            in_flight.discard(address)
+            network = whois_network(address, whois_data)
+            if network:
+                known.add(network)
+                new_networks[whois_cache_key(network)] = {'asn_cidr': str(network)}
+                # Addresses with lookups of their own in flight wait for
+                # them, since they might be in a more specific network.
+                resolved = {a: network for a in unresolved - in_flight if a in network}
+            else:
+                resolved = {}
+            resolved[address] = network or ip_network(address)
+            unresolved -= resolved.keys()
+            yield resolved, unresolved
+        if new_networks:
+            cache.set_many(new_networks, WHOIS_CACHE_TIMEOUT)
+    logger.info('resolved %d addresses with %d whois lookups', len(set(addresses)), lookups)
+
+
+def candidate_keys(addresses):
+    """Returns a sorted list of the cache keys for the networks which
+    contain any of the addresses and which could be cached whois
+    networks.
+
+    The networks no more specific than an address's wave bucket are
+    the same for every address in the bucket, so they're only
+    generated once per bucket.
+
+    """
+    keys = set()
+    buckets = set()
+    for address in addresses:
+        low, high = WHOIS_PREFIXLEN_LIMITS[address.version]
+        bucket_prefixlen = WHOIS_BUCKET_PREFIXLEN[address.version]
+        host = ip_network(address)
+        bucket = host.supernet(new_prefix=bucket_prefixlen)
+        if bucket not in buckets:
+            buckets.add(bucket)
+            keys.update(whois_cache_key(bucket.supernet(new_prefix=n)) for n in range(low, bucket_prefixlen + 1))
+        keys.update(whois_cache_key(host.supernet(new_prefix=n)) for n in range(bucket_prefixlen + 1, high + 1))
+    return sorted(keys)
+
+
+def whois_cache_key(network):
+    return f'api.whois.{network}'
+
+
+def find_covering_network(address, networks):
+    """Returns the most specific of the networks which contains address,
+    or None.
+
+    """
+    return max((n for n in networks if n.version == address.version and address in n),
+               key=lambda n: n.prefixlen,
+               default=None)
+
+
+def lookup_whois(address):
+    """Returns the whois data for address, or None if the lookup fails.
+
+    """
+    try:
+        return get_whois_data(str(address))
+    except (requests.RequestException, ValueError) as ex:
+        logger.warning('whois lookup for %s failed: %s', address, ex)
+        return None
+
+
+def whois_network(address, whois_data):
+    """Returns the asn_cidr network from whois_data, or None if there
+    isn't one which contains address.
+
+    """
+    try:
         network = ip_network(whois_data['asn_cidr'])
-        networks[network].append(address)
-    return [{'asn_cidr': str(range),
-             'observed_cidr': str(find_smallest_range(ips)),
-             } for range, ips in networks.items()]
+        if address in network:
+            return network
+    except (KeyError, TypeError, ValueError):
+        pass
+    logger.warning('no usable asn_cidr for %s in %s', address, whois_data)
+    return None
 
 
 # Based on get_whois_data() from
@@ -70,7 +351,7 @@ def get_whois_data(ip):
         'lookup': 'true',
         'format': 'json'
     }
-    r = requests.get('https://whois-referral.toolforge.org/w/gateway.py', params=payload)
+    r = http_session().get(WHOIS_URL, params=payload, timeout=WHOIS_TIMEOUT)
     r.raise_for_status()
     return r.json()
 
@@ -81,68 +362,7 @@ def find_smallest_range(ips):
     addresses.
 
     There must be at least 1 address, and all the addresses must be of
-    the same type (v4 or v6).
-
-    """
-    lengths = {ip.max_prefixlen for ip in ips}
-    if len(lengths) == 0:
-        raise ValueError('empty ip list')
-    if len(lengths) > 1:
-        raise ValueError('multiple ip types')
-    ip_length = lengths.pop()
-    bit_vectors = []
-    for ip in ips:
-        bit_vectors.append(int_to_bits(int(ip), ip_length))
-
-    # bit_sets is the set of observed bits for each of the 32 or 128 bits
-    # in the addresses.  If we started with:
-    #
-    # IPv4Address('128.0.0.1')
-    # IPv4Address('128.0.0.3')
-    # IPv4Address('128.0.0.5')
-    #
-    # bit_sets would be:
-    #
-    # [{1},    {0},    {0},    {0},    {0},    {0},    {0},    {0},
-    #  {0},    {0},    {0},    {0},    {0},    {0},    {0},    {0},
-    #  {0},    {0},    {0},    {0},    {0},    {0},    {0},    {0},
-    #  {0},    {0},    {0},    {0},    {0},    {0, 1}, {0, 1}, {1}]
-    bit_sets = [set(bits) for bits in zip(*bit_vectors)]
-
-    network_number = 0
-    netmask = 0
-    in_mask = True
-    for s in bit_sets:
-        if in_mask and len(s) == 1:
-            bit = s.pop()
-            netmask += 1
-        else:
-            bit = 0
-            in_mask = False
-        network_number = (network_number << 1) + bit
-
-    if ip_length == 32:
-        return IPv4Network((network_number, netmask))
-    else:
-        return IPv6Network((network_number, netmask))
-
-
-def int_to_bits(i, n):
-    """Converts an integer (i) into a list of n bits.  Bits are high-order
-    first, zero-padded.
-
-    int_to_bits(5, 8) => [0, 0, 0, 0, 0, 1, 0, 1]
-
-    It is an error for the integer to not fit into n bits.
+    the same type (v4 or v6).  See spi.ip_utils.common_network().
 
     """
-    if i < 0:
-        raise ValueError(f'cannot convert negative values ({i})')
-    bits = []
-    temp = i
-    for _ in range(n):
-        bits.append(temp % 2)
-        temp >>= 1
-    if temp:
-        raise ValueError(f'{i} does not fit into {n} bits')
-    return list(reversed(bits))
+    return common_network(ips)
@@ -0,0 +1,280 @@
+"""A compact, columnar store for WikiContribs.
+
+Pickling a list of WikiContribs means pickling a datetime, several
+strings, and a tag list for every edit.  For accounts with hundreds
+of thousands of edits, that's hundreds of MB of Python objects, and
+unpickling takes seconds.  A ContribStore keeps each field in a
+column instead: rev_ids, timestamps (as integer microseconds since the
+epoch), and namespaces are typed arrays; user names, titles, comments
+and tags are interned in a single string table and stored as indexes
+into it.  to_bytes() turns this into a small binary blob which
+from_bytes() can reload with a handful of C-level array copies.
+
+A ContribStore is a Sequence of WikiContribs; the WikiContribs are
+built on demand, so existing code which iterates over a list of
+WikiContribs works unchanged.
+
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+from collections.abc import Sequence
+from datetime import datetime, timedelta, timezone
+import json
+import struct
+import sys
+
+from wiki_interface import WikiContrib
+
+
+MAGIC = b'WCS1'
+HEADER = struct.Struct('<4sBII')  # magic, flags, row count, tag id count
+FLAG_AWARE = 0x01  # timestamps are timezone-aware (UTC)
+NO_COMMENT = -1    # comment_ids value for a hidden comment
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+NAIVE_EPOCH = datetime(1970, 1, 1)
+
+
+class ContribStore(Sequence):  # pylint: disable=too-many-instance-attributes
+    """An immutable sequence of WikiContribs.
+
+    Like the lists of WikiContribs it replaces, it's expected to be in
+    reverse chronological order, but that's not enforced.  All the
+    timestamps must be either timezone-aware or naive; naive ones are
+    assumed to be UTC.
+
+    """
+    # The columns, in serialization order, with their array typecodes.
+    COLUMNS = (('rev_ids', 'q'),
+               ('timestamps', 'q'),
+               ('namespaces', 'h'),
+               ('user_ids', 'I'),
+               ('title_ids', 'I'),
+               ('comment_ids', 'i'),
+               ('is_live', 'B'),
+               ('tag_offsets', 'I'))
+
+    def __init__(self, contribs=()):
+        # The typecodes must match COLUMNS.
+        self.rev_ids = array('q')
+        self.timestamps = array('q')
+        self.namespaces = array('h')
+        self.user_ids = array('I')
+        self.title_ids = array('I')
+        self.comment_ids = array('i')
+        self.is_live = array('B')
+        self.tag_offsets = array('I', [0])
+        self.tag_ids = array('I')
+        self.strings = []
+        self.aware = None
+        self._string_ids = {}
+        self._append_all(contribs)
+
+
+    def _intern(self, string):
+        string_id = self._string_ids.get(string)
+        if string_id is None:
+            string_id = len(self.strings)
+            self.strings.append(string)
+            self._string_ids[string] = string_id
+        return string_id
+
+
+    def _append_all(self, contribs):
+        for contrib in contribs:
+            aware = contrib.timestamp.tzinfo is not None
+            if self.aware is None:
+                self.aware = aware
+            elif aware != self.aware:
+                raise ValueError(f'mixed naive and aware timestamps: {contrib}')
+            self.rev_ids.append(contrib.rev_id)
+            self.timestamps.append((contrib.timestamp - (EPOCH if aware else NAIVE_EPOCH))
+                                   // timedelta(microseconds=1))
+            self.namespaces.append(contrib.namespace)
+            self.user_ids.append(self._intern(contrib.user_name))
+            self.title_ids.append(self._intern(contrib.title))
+            self.comment_ids.append(NO_COMMENT if contrib.comment is None else self._intern(contrib.comment))
+            self.is_live.append(contrib.is_live)
+            self.tag_ids.extend(self._intern(tag) for tag in contrib.tags)
+            self.tag_offsets.append(len(self.tag_ids))
+
+
+    def prepended(self, contribs):
+        """Returns a new ContribStore with contribs followed by the
+        contents of this one.
+
+        Only the new contribs are handled individually; the existing
+        columns are copied wholesale, so this is cheap even for a
+        large store.
+
+        """
+        new = ContribStore()
+        new.strings = list(self.strings)
+        new._string_ids = {s: i for i, s in enumerate(new.strings)}  # pylint: disable=protected-access
+        new.aware = self.aware if self else None
+        new._append_all(contribs)  # pylint: disable=protected-access
+        new_tag_count = len(new.tag_ids)
+        for name, _ in self.COLUMNS:
+            if name != 'tag_offsets':
+                getattr(new, name).extend(getattr(self, name))
+        new.tag_offsets.extend(offset + new_tag_count for offset in self.tag_offsets[1:])
+        new.tag_ids.extend(self.tag_ids)
+        return new
+
+
+    @staticmethod
+    def concatenate(stores):
+        """Returns a ContribStore with the contents of all the stores, in
+        order.  Each store's string ids are remapped into a combined
+        string table.
+
+        """
+        stores = [s for s in stores if s]
+        if len(stores) == 1:
+            return stores[0]
+        result = ContribStore()
+        for store in stores:
+            if result.aware is None:
+                result.aware = store.aware
+            elif store.aware != result.aware:
+                raise ValueError('mixed naive and aware timestamps')
+            # pylint: disable=protected-access
+            mapping = [result._intern(string) for string in store.strings]
+            # Makes mapping[NO_COMMENT] (i.e. mapping[-1]) work.
+            mapping.append(NO_COMMENT)
+            tag_base = len(result.tag_ids)
+            for name in ('rev_ids', 'timestamps', 'namespaces', 'is_live'):
+                getattr(result, name).extend(getattr(store, name))
+            for name in ('user_ids', 'title_ids', 'comment_ids', 'tag_ids'):
+                getattr(result, name).extend(map(mapping.__getitem__, getattr(store, name)))
+            result.tag_offsets.extend(offset + tag_base for offset in store.tag_offsets[1:])
+        return result
+
+
+    def __len__(self):
+        return len(self.rev_ids)
+
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step == 1:
+                return self._slice(start, max(start, stop))
+            return ContribStore(self[i] for i in range(start, stop, step))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('ContribStore index out of range')
+        comment_id = self.comment_ids[index]
+        tags = self.tag_ids[self.tag_offsets[index]:self.tag_offsets[index + 1]]
+        return WikiContrib(self.rev_ids[index],
+                           self.timestamp_at(index),
+                           self.strings[self.user_ids[index]],
+                           self.namespaces[index],
+                           self.strings[self.title_ids[index]],
+                           None if comment_id == NO_COMMENT else self.strings[comment_id],
+                           bool(self.is_live[index]),
+                           [self.strings[t] for t in tags])
+
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+    def __eq__(self, other):
+        if isinstance(other, (ContribStore, list, tuple)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+
+    def __repr__(self):
+        return f'ContribStore({len(self)} contribs)'
+
+
+    def _slice(self, start, stop):
+        """Returns a new ContribStore with rows start:stop, copying
+        column slices.  The string table is shared.
+
+        """
+        new = ContribStore()
+        for name, _ in self.COLUMNS:
+            if name != 'tag_offsets':
+                setattr(new, name, getattr(self, name)[start:stop])
+        first_tag = self.tag_offsets[start]
+        new.tag_offsets = array('I', (offset - first_tag for offset in self.tag_offsets[start:stop + 1]))
+        new.tag_ids = self.tag_ids[first_tag:self.tag_offsets[stop]]
+        new.strings = self.strings
+        new.aware = self.aware if stop > start else None
+        return new
+
+
+    def window(self, start=None, end=None):
+        """Returns a ContribStore with just the contribs whose timestamps
+        are in the (inclusive) range start to end.  Either bound may be
+        None.  The store must be in reverse chronological order.
+
+        Naive bounds are assumed to be UTC.
+
+        """
+        def key(micros):
+            return -micros
+        first = 0 if end is None else bisect_left(self.timestamps, key(self._micros(end)), key=key)
+        last = len(self) if start is None else bisect_right(self.timestamps, key(self._micros(start)), key=key)
+        return self[first:last]
+
+
+    def _micros(self, timestamp):
+        if self.aware and timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        elif not self.aware and timestamp.tzinfo is not None:
+            timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+        return (timestamp - (EPOCH if self.aware else NAIVE_EPOCH)) // timedelta(microseconds=1)
+
+
+    def timestamp_at(self, index):
+        epoch = EPOCH if self.aware else NAIVE_EPOCH
+        return epoch + timedelta(microseconds=self.timestamps[index])
+
+
+    def to_bytes(self):
+        header = HEADER.pack(MAGIC, FLAG_AWARE if self.aware else 0, len(self), len(self.tag_ids))
+        columns = [getattr(self, name) for name, _ in self.COLUMNS] + [self.tag_ids]
+        if sys.byteorder == 'big':
+            columns = [array(c.typecode, c) for c in columns]
+            for column in columns:
+                column.byteswap()
+        strings = json.dumps(self.strings, ensure_ascii=False).encode('utf-8')
+        return b''.join([header] + [c.tobytes() for c in columns] + [strings])
+
+
+    @staticmethod
+    def from_bytes(data):
+        """The inverse of to_bytes().  Raises ValueError if the data isn't
+        a serialized ContribStore.
+
+        """
+        data = memoryview(data)
+        if len(data) < HEADER.size:
+            raise ValueError('ContribStore data too short')
+        magic, flags, count, tag_count = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError(f'bad ContribStore magic: {bytes(magic)!r}')
+        store = ContribStore()
+        store.aware = bool(flags & FLAG_AWARE) if count else None
+        offset = HEADER.size
+        lengths = [count] * (len(ContribStore.COLUMNS) - 1) + [count + 1, tag_count]
+        columns = [name for name, _ in ContribStore.COLUMNS] + ['tag_ids']
+        for name, length in zip(columns, lengths):
+            column = array(getattr(store, name).typecode)
+            size = length * column.itemsize
+            column.frombytes(data[offset:offset + size])
+            if sys.byteorder == 'big':
+                column.byteswap()
+            setattr(store, name, column)
+            offset += size
+        # The string id map is only needed for appending, which is done
+        # via prepended() (which builds its own), so don't pay to build
+        # it here.
+        store.strings = json.loads(bytes(data[offset:]).decode('utf-8'))
+        return store
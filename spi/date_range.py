@@ -0,0 +1,73 @@
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta, timezone
+
+
+@dataclass(frozen=True)
+class DateRange:
+    """A window of time, in the ordinary chronological sense: start is
+    the older bound and end is the newer one.  Either may be None,
+    meaning unbounded.  Both are UTC aware datetimes, and both are
+    inclusive.
+
+    Note that the Wiki methods follow the MediaWiki API convention,
+    where results are listed newest first, so *their* start is the
+    newer bound.  Use wiki_kwargs() to translate.
+
+    """
+    start: datetime = None
+    end: datetime = None
+
+    def __bool__(self):
+        return self.start is not None or self.end is not None
+
+
+    @staticmethod
+    def from_query(query, now=None):
+        """Build a DateRange from a request's query parameters.
+
+        start and end are dates (YYYY-MM-DD); end includes the whole of
+        that day.  Alternatively, days=N gives the N days up to now.
+        Raises ValueError if the parameters are invalid.
+
+        """
+        start = query.get('start')
+        end = query.get('end')
+        days = query.get('days')
+        if days and start:
+            raise ValueError('start and days are mutually exclusive')
+        start_dt = start and datetime.combine(date.fromisoformat(start), time.min, timezone.utc)
+        end_dt = end and datetime.combine(date.fromisoformat(end), time.max, timezone.utc)
+        if days:
+            days = int(days)
+            if days < 1:
+                raise ValueError(f'invalid days: {days}')
+            start_dt = (now or datetime.now(timezone.utc)) - timedelta(days=days)
+        if start_dt and end_dt and start_dt > end_dt:
+            raise ValueError(f'start ({start}) is after end ({end})')
+        return DateRange(start_dt or None, end_dt or None)
+
+
+    def contains(self, timestamp):
+        """Naive timestamps are assumed to be UTC."""
+        timestamp = _aware(timestamp)
+        return ((self.start is None or timestamp >= self.start) and
+                (self.end is None or timestamp <= self.end))
+
+
+    def ends_before(self, timestamp):
+        """Is timestamp newer than this range?"""
+        return self.end is not None and _aware(timestamp) > self.end
+
+
+    def wiki_kwargs(self):
+        """Returns the start and end keyword arguments for the Wiki
+        methods which take them.
+
+        """
+        return {'start': self.end, 'end': self.start}
+
+
+def _aware(timestamp):
+    if timestamp.tzinfo is None:
+        return timestamp.replace(tzinfo=timezone.utc)
+    return timestamp
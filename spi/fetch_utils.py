@@ -0,0 +1,156 @@
+"""Helpers for running blocking wiki/cache fetches concurrently.
+
+"""
+from concurrent.futures import as_completed, ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+from itertools import chain
+import logging
+
+from django.conf import settings
+from django_tools.middlewares import ThreadLocal
+import requests
+from requests.adapters import HTTPAdapter
+
+
+logger = logging.getLogger('spi.fetch_utils')
+
+
+def map_concurrently(func, items, max_workers=None, request=None):
+    """Call func(item) for each of the items on a pool of worker
+    threads.  Returns a list of the results, in the same order as the
+    items.  If any of the calls raises an exception, it is re-raised
+    here.
+
+    No more than max_workers calls are in progress at once.  If
+    max_workers is None, settings.SPI_MAX_FETCH_WORKERS is used.
+
+    The request (by default, the current one) is made available to
+    the workers (via django_tools' ThreadLocal), so things like
+    icache's use-cache parameter handling work the same as they do on
+    the main thread.  Pass it explicitly when this runs after the
+    view has returned (e.g. while a StreamingHttpResponse is being
+    consumed), since by then the middleware has forgotten it.
+
+    """
+    items = list(items)
+    if max_workers is None:
+        max_workers = settings.SPI_MAX_FETCH_WORKERS
+    func = _with_request(func, request)
+    if max_workers <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+
+    logger.debug('running %d calls with %d workers', len(items), max_workers)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(func, items))
+
+
+def map_as_completed(func, items, max_workers=None, request=None):
+    """Like map_concurrently(), but returns an iterator over (item,
+    result) tuples, in the order the calls finish, so the caller can
+    use each result as soon as it's ready.
+
+    """
+    items = list(items)
+    if max_workers is None:
+        max_workers = settings.SPI_MAX_FETCH_WORKERS
+    func = _with_request(func, request)
+    if max_workers <= 1 or len(items) <= 1:
+        for item in items:
+            yield item, func(item)
+        return
+
+    logger.debug('running %d calls with %d workers', len(items), max_workers)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(func, item): item for item in items}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+
+def _with_request(func, request=None):
+    """Returns a wrapper for func which makes request (by default, the
+    current one) visible to it, on whatever thread it's called.
+
+    """
+    if request is None:
+        request = ThreadLocal.get_current_request()
+
+    def call(item):
+        with _current_request(request):
+            return func(item)
+
+    return call
+
+
+@contextmanager
+def _current_request(request):
+    """Makes request the current request for this thread, and restores
+    whatever was current before on exit.
+
+    """
+    # pylint: disable=protected-access
+    previous = getattr(ThreadLocal._thread_locals, 'request', None)
+    ThreadLocal._thread_locals.request = request
+    try:
+        yield
+    finally:
+        if previous is None:
+            del ThreadLocal._thread_locals.request
+        else:
+            ThreadLocal._thread_locals.request = previous
+
+
+def iter_with_request(iterable, request):
+    """Yields the items of iterable, with request as the current request
+    while each one is being produced.  This is for iterables which are
+    consumed after the view has returned, such as the content of a
+    StreamingHttpResponse.
+
+    """
+    iterator = iter(iterable)
+    while True:
+        with _current_request(request):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def start_concurrently(iterables, max_workers=None, request=None):
+    """Start each of the iterables (i.e. fetch its first item) on a pool
+    of worker threads.  Returns a list of iterators, which produce the
+    same items as the corresponding iterables.
+
+    This is for lazy streams which do most of their work before
+    producing the first item (for example, pulling a user's
+    contributions out of the cache).  That start-up work runs
+    concurrently, but the rest of each stream is consumed lazily, by
+    the caller, so nothing is materialized in memory.
+
+    """
+    def start(iterable):
+        iterator = iter(iterable)
+        for first in iterator:
+            return chain([first], iterator)
+        return iter(())
+
+    return map_concurrently(start, iterables, max_workers, request)
+
+
+@lru_cache(maxsize=None)
+def http_session():
+    """Returns a process-wide requests.Session, for calls to external
+    (i.e. non-MediaWiki) services.  Sharing it means connections are
+    kept alive across calls and requests.
+
+    The connection pool is big enough for map_concurrently() to use
+    one connection per worker.
+
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(settings.SPI_MAX_FETCH_WORKERS, 1))
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers['User-Agent'] = settings.MEDIAWIKI_USER_AGENT
+    return session
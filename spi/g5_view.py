@@ -1,11 +1,18 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import datetime
 import itertools
 import logging
+from typing import List
 
+from django.http import HttpResponseBadRequest
 from django.shortcuts import render
 
+from spi import icache as cache
+from spi.date_range import DateRange
+from spi.fetch_utils import map_concurrently
+from spi.spi_utils import CacheableSpiCase
 from spi.spi_view import get_sock_names, SpiView
+from spi.user_utils import CacheableUserBlocks
 from wiki_interface import Wiki
 from wiki_interface.block_utils import UserBlockHistory
 
@@ -28,36 +35,125 @@ class G5Score:
     reason: str = ''
 
 
+# The cached summaries are versioned on the case's rev_id, but blocks
+# and new page creations don't edit the case, so entries also expire.
+# The precompute_g5 command should run more often than this.
+G5_CACHE_TIMEOUT = 6 * 60 * 60  # seconds
+
+
+@dataclass(frozen=True)
+class CacheableG5Summaries:
+    """The G5Summaries for a case, over all time.
+
+    These are expensive to compute, so the precompute_g5 management
+    command refreshes them in the background for all the open cases.
+    They're keyed by case name and versioned on the case's latest
+    rev_id, the same way as CacheableSpiCase.
+
+    """
+    case_name: str
+    rev_id: int
+    page_creations: List[G5Summary] = field(default_factory=list)
+
+
+    @staticmethod
+    def get(wiki, case_name):
+        """Returns the cached summaries, or None on a cache miss.
+
+        """
+        rev_id = CacheableSpiCase.get_rev_id(wiki, case_name)
+        return cache.get(CacheableG5Summaries.key(case_name), version=rev_id)
+
+
+    @staticmethod
+    def refresh(wiki, case_name):
+        """Computes the summaries and stores them in the cache, whether
+        or not they're already there.
+
+        """
+        rev_id = CacheableSpiCase.get_rev_id(wiki, case_name)
+        summaries = CacheableG5Summaries(case_name, rev_id, find_page_creations(wiki, case_name))
+        cache.set(CacheableG5Summaries.key(case_name), summaries, G5_CACHE_TIMEOUT, version=rev_id)
+        return summaries
+
+
+    @staticmethod
+    def key(case_name):
+        return f'spi.CacheableG5Summaries.{case_name}'
+
+
+def find_page_creations(wiki, case_name, date_range=DateRange()):
+    """Returns a list of G5Summaries, one for each existing page created
+    by a sock of case_name while the master was blocked.  Only pages
+    created in date_range are included.
+
+    """
+    socks = get_sock_names(wiki, case_name)
+    sock_names = [s.username for s in socks if s.valid]
+
+    # The block history isn't limited to date_range; a block placed
+    # before the start of the range can still be in effect during it.
+    history = UserBlockHistory(CacheableUserBlocks.get(wiki, case_name).data)
+
+    contribs = list(wiki.user_contributions(sock_names, show="new", **date_range.wiki_kwargs()))
+    blocked = history.blocked_mask(c.timestamp for c in contribs)
+    candidates = list(itertools.compress(contribs, blocked))
+
+    # Existence is checked in batches; the revision history has to
+    # be fetched one page at a time, so those calls run concurrently.
+    pages = wiki.get_pages(c.title for c in candidates)
+    creations = [(c, pages[c.title]) for c in candidates if c.title in pages and pages[c.title].exists()]
+    scores = map_concurrently(g5_score, [page for _, page in creations])
+    return [G5Summary(contrib.title,
+                      contrib.user_name,
+                      contrib.timestamp,
+                      score)
+            for (contrib, _), score in zip(creations, scores)]
+
+
+def g5_score(page):
+    revisions = list(itertools.islice(page.revisions(), 50))
+    if len(revisions) >= 50:
+        return G5Score("unlikely", "50 or more revisions")
+    editors = {r.user_name for r in revisions}
+    if len(editors) == 1:
+        return G5Score("likely", "only one editor")
+    return G5Score("unknown")
+
+
 class G5View(SpiView):
+    """Renders from the precomputed CacheableG5Summaries when they're
+    available, falling back to computing them live.
+
+    """
     def get(self, request, case_name):
-        socks = get_sock_names(self.wiki, case_name)
-        sock_names = [s.username for s in socks if s.valid]
-
-        history = UserBlockHistory(self.wiki.user_blocks(case_name))
-
-        page_creations = []
-        for contrib in self.wiki.user_contributions(sock_names, show="new"):
-            if history.is_blocked_at(contrib.timestamp):
-                title = contrib.title
-                page = self.wiki.page(title)
-                if page.exists():
-                    page_creations.append(G5Summary(title,
-                                                    contrib.user_name,
-                                                    contrib.timestamp,
-                                                    self.g5_score(page)))
+        try:
+            date_range = DateRange.from_query(request.GET)
+        except ValueError as ex:
+            return HttpResponseBadRequest(str(ex))
+
+        summaries = CacheableG5Summaries.get(self.wiki, case_name)
+        if summaries is not None:
+            page_creations = self.still_existing([s for s in summaries.page_creations
+                                                  if date_range.contains(s.timestamp)])
+        elif date_range:
+            # Cheaper than computing (and caching) the whole history.
+            page_creations = find_page_creations(self.wiki, case_name, date_range)
+        else:
+            page_creations = CacheableG5Summaries.refresh(self.wiki, case_name).page_creations
 
         context = {'case_name': case_name,
+                   'date_range': date_range,
                    'page_creations': page_creations,
                    }
         return render(request, 'spi/g5.html', context)
 
 
-    @staticmethod
-    def g5_score(page):
-        revisions = list(itertools.islice(page.revisions(), 50))
-        if len(revisions) >= 50:
-            return G5Score("unlikely", "50 or more revisions")
-        editors = {r.user_name for r in revisions}
-        if len(editors) == 1:
-            return G5Score("likely", "only one editor")
-        return G5Score("unknown")
+    def still_existing(self, page_creations):
+        """Drops the summaries for pages which have been deleted since
+        they were computed.  Admins reload the page as they work through
+        the list, so this has to be current.
+
+        """
+        pages = self.wiki.get_pages(s.title for s in page_creations)
+        return [s for s in page_creations if s.title in pages and pages[s.title].exists()]
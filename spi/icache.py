@@ -58,3 +58,27 @@ def get_or_set(key, default, *args, **kwargs):
     else:
         logger.info("get_or_set(%s) bypassed", key)
         return None
+
+
+def get_many(keys, *args, **kwargs):
+    if _use_cache():
+        t0 = time.time()
+        logger.debug("calling get_many(%d keys)", len(keys))
+        data = django_cache.get_many(keys, *args, **kwargs)
+        dt = time.time() - t0
+        logger.log(WARNING if dt > 0.1 else INFO, "get_many(%d keys) took %.3f sec", len(keys), dt)
+        return data
+    else:
+        logger.info("get_many(%d keys) bypassed", len(keys))
+        return {}
+
+
+def set_many(data, *args, **kwargs):
+    if _use_cache():
+        t0 = time.time()
+        logger.debug("calling set_many(%d keys)", len(data))
+        django_cache.set_many(data, *args, **kwargs)
+        dt = time.time() - t0
+        logger.log(WARNING if dt > 0.1 else INFO, "set_many(%d keys) took %.3f sec", len(data), dt)
+    else:
+        logger.info("set_many(%d keys) bypassed", len(data))
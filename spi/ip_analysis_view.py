@@ -1,30 +1,70 @@
 from collections import defaultdict
 from dataclasses import dataclass
+from ipaddress import ip_network, IPv4Address
 import logging
 from typing import List
 
+from django.http import HttpResponseBadRequest
 from django.shortcuts import render
 
+from spi.ip_utils import sort_key
 from spi.spi_utils import CacheableSpiCase, SpiIpInfo
 from spi.spi_view import SpiView
 
 
 logger = logging.getLogger('spi.views.ip_analysis_view')
 
+# Addresses are grouped into networks of (at most) this prefix length.
+GROUP_PREFIXLEN = {4: 24, 6: 64}
 
-@dataclass(frozen=True, order=True)
+
+@dataclass(frozen=True)
 class IpSummary:
-    ip_address: str
+    ip_address: object  # IPv[46]Address or IPv[46]Network
     spi_dates: List[SpiIpInfo]
 
+    def is_ipv4_address(self):
+        """Only single IPv4 addresses can be picked as the ends of a block
+        range in the UI.
+
+        """
+        return isinstance(self.ip_address, IPv4Address)
+
+
+@dataclass(frozen=True)
+class IpGroup:
+    network: object  # IPv[46]Network
+    ip_summaries: List[IpSummary]
+
+
+def group_network(address):
+    """Returns the network address (or range) is grouped under."""
+    network = ip_network(address)
+    return network.supernet(new_prefix=min(network.prefixlen, GROUP_PREFIXLEN[network.version]))
+
 
 class IpAnalysisView(SpiView):
     def get(self, request, case_name):
+        case = CacheableSpiCase.get(self.wiki, case_name)
+        infos = case.ip_addresses
+        query_range = request.GET.get('range')
+        if query_range:
+            try:
+                query_network = ip_network(query_range.strip(), strict=False)
+            except ValueError:
+                return HttpResponseBadRequest(f'Invalid range: {query_range}')
+            infos = [info for network, info in case.ip_index().overlapping(query_network)]
+
         ip_data = defaultdict(list)
-        for i in CacheableSpiCase.get(self.wiki, case_name).ip_addresses:
+        for i in infos:
             ip_data[i.ip_address].append(i.date)
-        summaries = [IpSummary(ip, sorted(ip_data[ip])) for ip in ip_data]
-        summaries.sort()
+
+        groups = defaultdict(list)
+        for ip in sorted(ip_data, key=sort_key):
+            groups[group_network(ip)].append(IpSummary(ip, sorted(ip_data[ip])))
+
         context = {'case_name': case_name,
-                   'ip_summaries': summaries}
+                   'range': query_range,
+                   'ip_groups': [IpGroup(network, summaries)
+                                 for network, summaries in sorted(groups.items(), key=lambda g: sort_key(g[0]))]}
         return render(request, 'spi/ip-analysis.html', context)
@@ -0,0 +1,110 @@
+"""Aggregating IP addresses into networks.
+
+Everything here works on the addresses as integers.  The smallest
+network containing two addresses is found from the highest bit in
+which they differ (i.e. the bit length of their XOR), so the smallest
+network containing a whole set of addresses only depends on its
+lowest and highest members.  Python ints are arbitrary precision, so
+IPv6 works the same way as IPv4.
+
+"""
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from ipaddress import ip_network, IPv4Network, IPv6Network
+
+
+MAX_PREFIXLEN = {4: 32, 6: 128}
+NETWORK_CLASSES = {4: IPv4Network, 6: IPv6Network}
+
+
+def common_network(addresses):
+    """Returns the IPv[46]Network with the longest prefix which contains
+    all of the addresses (IPv[46]Address objects).
+
+    Raises ValueError if there are no addresses, or if they're not all
+    the same version.
+
+    """
+    versions = {a.version for a in addresses}
+    if not versions:
+        raise ValueError('empty ip list')
+    if len(versions) > 1:
+        raise ValueError('multiple ip types')
+    version = versions.pop()
+    values = [int(a) for a in addresses]
+    return _network(version, *_common_prefix(min(values), max(values), MAX_PREFIXLEN[version]))
+
+
+def sort_key(address):
+    """A sort key for a mixture of IPv4 and IPv6 addresses and networks:
+    IPv4 first, then by (first) address, then larger networks first.
+
+    """
+    network = ip_network(address)
+    return network.version, int(network.network_address), network.prefixlen
+
+
+class IpIndex:
+    """An index of IP networks (each with an associated value), for
+    finding the ones which overlap a given address or network.
+
+    Two CIDR networks either are disjoint, or one contains the other.
+    So the entries which overlap a query network are the ones which
+    start inside it, which are a contiguous run of the entries sorted
+    by starting address, plus any of its supernets, of which there are
+    at most 32 (or 128).  That makes a query a bisection and a few
+    dict lookups.
+
+    """
+    def __init__(self, items=()):
+        """Items is an iterable of (network, value) tuples.  Networks may
+        be given as anything ipaddress.ip_network() accepts, including
+        addresses, which become single-host networks.
+
+        """
+        entries = sorted(((ip_network(n), v) for n, v in items), key=lambda e: sort_key(e[0]))
+        self._entries = {4: [], 6: []}
+        self._starts = {4: [], 6: []}
+        self._by_network = defaultdict(list)
+        for network, value in entries:
+            self._entries[network.version].append((network, value))
+            self._starts[network.version].append(int(network.network_address))
+            self._by_network[network].append(value)
+
+
+    def __len__(self):
+        return len(self._entries[4]) + len(self._entries[6])
+
+
+    def overlapping(self, network):
+        """Returns a list of the (network, value) entries whose networks
+        overlap network (an address or network), in sort_key() order.
+
+        """
+        network = ip_network(network)
+        start = int(network.network_address)
+        # Supernets which start at the same address are found by the
+        # bisection, so skip them here.
+        supernets = [(n, v)
+                     for prefixlen in range(network.prefixlen)
+                     for n in [network.supernet(new_prefix=prefixlen)]
+                     if int(n.network_address) < start
+                     for v in self._by_network.get(n, [])]
+        starts = self._starts[network.version]
+        first = bisect_left(starts, start)
+        last = bisect_right(starts, int(network.broadcast_address))
+        return supernets + self._entries[network.version][first:last]
+
+
+def _common_prefix(low, high, max_prefixlen):
+    """Returns (network number, prefix length) for the smallest network
+    containing both the integer addresses low and high.
+
+    """
+    host_bits = (low ^ high).bit_length()
+    return low >> host_bits << host_bits, max_prefixlen - host_bits
+
+
+def _network(version, value, prefixlen):
+    return NETWORK_CLASSES[version]((value, prefixlen))
+
@@ -4,6 +4,9 @@
  * IP range which covers those.
  */
 function updateBlockRange() {
+    if ($(".ip-radio").length == 0) {
+	return;
+    }
     var ip_1 = $(":radio[name='ip-1']:checked")[0].value;
     var ip_2 = $(":radio[name='ip-2']:checked")[0].value;
     var range = computeBlockRange(ip_1, ip_2);
@@ -59,9 +62,11 @@ function ipToBits(ip_string) {
 
 $(document).ready(
     function() {
-	// Check the first first-child and the last last-child radio buttons
-	$("#ip-list > li:first-child > :radio[name='ip-1']").prop('checked', true);
-	$("#ip-list > li:last-child > :radio[name='ip-2']").prop('checked', true);
+	// Check the first ip-1 and the last ip-2 radio buttons.  Only
+	// IPv4 addresses have them, so they're not necessarily in the
+	// first and last list items.
+	$(":radio[name='ip-1']").first().prop('checked', true);
+	$(":radio[name='ip-2']").last().prop('checked', true);
 
 	// Hook up event handler and force initial call
 	$(".ip-radio").bind("change", updateBlockRange);
@@ -0,0 +1,56 @@
+"""Refresh the cached G5 summaries for all the open SPI cases.
+
+Run this periodically (more often than G5_CACHE_TIMEOUT), either from
+a scheduled job, or with --interval to loop forever.
+
+"""
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+
+from spi.g5_view import CacheableG5Summaries
+from spi.spi_utils import get_current_case_names
+from wiki_interface import Wiki
+
+
+logger = logging.getLogger('spi.precompute_g5')
+
+
+class Command(BaseCommand):
+    help = 'Precompute the G5 summaries for the open SPI cases'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval',
+                            type=int,
+                            help='Repeat every INTERVAL seconds, instead of running once')
+        parser.add_argument('cases',
+                            nargs='*',
+                            help='Case names to refresh (default: all the open cases)')
+
+
+    def handle(self, *args, **options):
+        while True:
+            self.refresh_all(options['cases'])
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+
+    def refresh_all(self, case_names):
+        wiki = Wiki()
+        case_names = case_names or get_current_case_names(wiki)
+        logger.info('refreshing G5 summaries for %d cases', len(case_names))
+        t0 = time.time()
+        failures = 0
+        for case_name in case_names:
+            # One bad case shouldn't stop the rest from being refreshed.
+            try:
+                summaries = CacheableG5Summaries.refresh(wiki, case_name)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception('failed to refresh G5 summaries for %s', case_name)
+                failures += 1
+                continue
+            logger.info('%s: %d pages', case_name, len(summaries.page_creations))
+        logger.info('refreshed %d cases (%d failed) in %.1f sec',
+                    len(case_names) - failures, failures, time.time() - t0)
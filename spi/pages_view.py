@@ -1,12 +1,16 @@
-from collections import Counter, defaultdict
+from collections import Counter
 from dataclasses import dataclass
+from functools import partial
 import itertools
 import logging
 
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.http import HttpResponseBadRequest
 from django.shortcuts import render
 
-from spi.user_utils import CacheableUserContribs
+from spi.date_range import DateRange
+from spi.fetch_utils import map_concurrently
+from spi.user_utils import CacheableDeletedContribs, CacheableUserContribs
 from spi.spi_view import SpiView
 
 # pylint: disable=invalid-name
@@ -19,9 +23,14 @@ class PagesView(LoginRequiredMixin, SpiView):
     def get(self, request, case_name):
         user_names = request.GET.getlist('users')
         logger.debug("user_names = %s", user_names)
+        try:
+            date_range = DateRange.from_query(request.GET)
+        except ValueError as ex:
+            return HttpResponseBadRequest(str(ex))
 
         context = {'case_name': case_name,
-                   'page_data': self.get_page_data(self.wiki, user_names)}
+                   'date_range': date_range,
+                   'page_data': self.get_page_data(self.wiki, user_names, date_range)}
         return render(request, 'spi/pages.html', context)
 
 
@@ -33,7 +42,7 @@ class PagesView(LoginRequiredMixin, SpiView):
 
 
     @staticmethod
-    def get_page_data(wiki, user_names):
+    def get_page_data(wiki, user_names, date_range=DateRange()):
         """Returns a PageData object.
 
         The keys for each counter will be the current page titles including the
@@ -43,23 +52,44 @@ class PagesView(LoginRequiredMixin, SpiView):
         editor_counts: Distinct editors who have edited the page
         reverted_counts: Number of edits to this page that have been reverted.
 
-        Both active and deleted edits are included.
+        Both active and deleted edits are included, limited to those in
+        date_range.
 
         Only edit_counts is guaranteed to have the full set of keys
 
+        The per-user data is fetched and counted concurrently, then
+        merged.
 
         """
+        per_user_counts = map_concurrently(partial(PagesView.get_user_counts, wiki, date_range=date_range),
+                                           user_names)
         edit_counts = Counter()
-        editors = defaultdict(set)
-        reverted = defaultdict(int)
-        for user_name in user_names:
-            contribs = list(itertools.chain(CacheableUserContribs.get(wiki, user_name).data,
-                                            wiki.deleted_user_contributions(user_name)))
-            edit_counts.update(c.title for c in contribs)
-            for c in contribs:
-                editors[c.title].add(user_name)
-                if 'mw-reverted' in c.tags:
-                    reverted[c.title] += 1
-        editor_counts = Counter({k: len(v) for (k, v) in editors.items()})
-        reverted_counts = Counter(reverted)
+        editor_counts = Counter()
+        reverted_counts = Counter()
+        seen_users = set()
+        for user_name, (user_edit_counts, user_reverted_counts) in zip(user_names, per_user_counts):
+            edit_counts.update(user_edit_counts)
+            reverted_counts.update(user_reverted_counts)
+            if user_name not in seen_users:
+                seen_users.add(user_name)
+                editor_counts.update(user_edit_counts.keys())
         return PagesView.PageData(edit_counts, editor_counts, reverted_counts)
+
+
+    @staticmethod
+    def get_user_counts(wiki, user_name, date_range=DateRange()):
+        """Returns a tuple of Counters (edit_counts, reverted_counts),
+        keyed by page title, for a single user's active and deleted
+        edits.  The edits are counted in a single pass, without
+        building a list.
+
+        """
+        edit_counts = Counter()
+        reverted_counts = Counter()
+        contribs = itertools.chain(CacheableUserContribs.get(wiki, user_name, date_range).data,
+                                   CacheableDeletedContribs.get(wiki, user_name, date_range).data)
+        for c in contribs:
+            edit_counts[c.title] += 1
+            if 'mw-reverted' in c.tags:
+                reverted_counts[c.title] += 1
+        return edit_counts, reverted_counts
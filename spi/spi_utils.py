@@ -1,8 +1,9 @@
 from __future__ import annotations
 
 from dataclasses import dataclass, field
-from typing import List
-from ipaddress import IPv4Address, IPv4Network
+from functools import total_ordering
+from typing import List, Union
+from ipaddress import ip_address, ip_network, IPv4Address, IPv4Network, IPv6Address, IPv6Network
 from itertools import chain
 import logging
 import re
@@ -12,6 +13,7 @@ from mwparserfromhell import parse
 from mwparserfromhell.wikicode import Wikicode
 
 from spi import icache as cache
+from spi.ip_utils import common_network, IpIndex, sort_key
 
 
 logger = logging.getLogger('spi.spi_utils')
@@ -22,7 +24,7 @@ logger = logging.getLogger('spi.spi_utils')
 class ArchiveError(ValueError):
     pass
 
-class InvalidIpV4Error(ValueError):
+class InvalidIpError(ValueError):
     pass
 
 
@@ -57,10 +59,14 @@ class CacheableSpiCase:
 
 
     @staticmethod
-    def get(wiki, master_name):
-        titles = (f'Wikipedia:Sockpuppet investigations/{master_name}{suffix}' for suffix in ['', '/Archive'])
-        revisions = chain.from_iterable([wiki.page(t).revisions(count=1) for t in titles])
-        rev_id = max(r.rev_id for r in revisions)
+    def get(wiki, master_name, rev_id=None):
+        """Returns the CacheableSpiCase for master_name, from the cache
+        if it's there.  If the caller already knows the case's rev_id
+        (e.g. from get_rev_ids()), passing it saves looking it up again.
+
+        """
+        if rev_id is None:
+            rev_id = CacheableSpiCase.get_rev_id(wiki, master_name)
         key = f'spi.CacheableSpiCase.{master_name}'
         case = cache.get(key, version=rev_id)
         if case is None:
@@ -73,6 +79,46 @@ class CacheableSpiCase:
         return case
 
 
+    def ip_index(self):
+        """Returns an IpIndex of the ip_addresses, with the SpiIpInfos as
+        the values.
+
+        """
+        return IpIndex((info.network, info) for info in self.ip_addresses)
+
+
+    @staticmethod
+    def get_rev_id(wiki, master_name):
+        """Returns the latest rev_id of the case page and its archive.
+        Anything derived from the case can be cached with this as the
+        version.  Raises ValueError if neither page exists.
+
+        """
+        titles = (f'Wikipedia:Sockpuppet investigations/{master_name}{suffix}' for suffix in ['', '/Archive'])
+        revisions = chain.from_iterable([wiki.page(t).revisions(count=1) for t in titles])
+        return max(r.rev_id for r in revisions)
+
+
+    @staticmethod
+    def get_rev_ids(wiki, master_names):
+        """Returns a dict mapping each of master_names to what get_rev_id()
+        would return for it, using batched page info queries instead
+        of two queries per case.  Cases with neither page are left
+        out.
+
+        """
+        titles = {f'Wikipedia:Sockpuppet investigations/{name}{suffix}': name
+                  for name in master_names
+                  for suffix in ['', '/Archive']}
+        rev_ids = {}
+        for title, page in wiki.get_pages(titles).items():
+            rev_id = page.last_rev_id()
+            name = titles[title]
+            if rev_id and rev_id > rev_ids.get(name, 0):
+                rev_ids[name] = rev_id
+        return rev_ids
+
+
 @dataclass
 class SpiCase:
     parsed_docs: List[SpiParsedDocument]
@@ -145,8 +191,7 @@ class SpiCase:
 
         '''
         for day in self.days():
-            for ip_address in day.find_ips():
-                yield ip_address
+            yield from day.find_ips()
 
 
     def find_all_users(self):
@@ -239,6 +284,7 @@ class SpiCaseDay:
     def find_ips(self):
         '''Iterates over all the IPs mentioned in checkuser, checkip, or
         socklist templates.  Each ip is represented as an SpiIpInfo.
+        IPv4 and IPv6 addresses and CIDR ranges are all recognized.
         Order of iteration is not guaranteed, and templates are not
         deduplicated.
 
@@ -254,12 +300,12 @@ class SpiCaseDay:
             ip_str = template.get('1').value
             try:
                 yield SpiIpInfo(str(ip_str), date, self.page_title)
-            except InvalidIpV4Error:
+            except InvalidIpError:
                 pass
         for account in self.parse_socklist():
             try:
                 yield SpiIpInfo(account, date, self.page_title)
-            except InvalidIpV4Error:
+            except InvalidIpError:
                 pass
 
 
@@ -269,40 +315,58 @@ class SpiUserInfo:
     date: str
 
 
-@dataclass(order=True, unsafe_hash=True)
+@total_ordering
+@dataclass(unsafe_hash=True)
 class SpiIpInfo:
-    ip_address: IPv4Address
+    """ip_address is an IPv[46]Address for a single address, or an
+    IPv[46]Network for a range.  Infos sort by address (IPv4 first,
+    with a range before the addresses in it), then by date.
+
+    """
+    ip_address: Union[IPv4Address, IPv6Address, IPv4Network, IPv6Network]
     date: str
     page_title: str
 
     def __init__(self, ip_str, date, page_title):
+        ip_str = ip_str.strip()
         try:
-            self.ip_address = IPv4Address(ip_str)
+            if '/' in ip_str:
+                network = ip_network(ip_str, strict=False)
+                single = network.prefixlen == network.max_prefixlen
+                self.ip_address = network.network_address if single else network
+            else:
+                self.ip_address = ip_address(ip_str)
         except ValueError as error:
-            raise InvalidIpV4Error(str(error))
+            raise InvalidIpError(str(error)) from error
         self.date = date
         self.page_title = page_title
 
 
+    def __lt__(self, other):
+        if not isinstance(other, SpiIpInfo):
+            return NotImplemented
+        return (sort_key(self.ip_address), self.date, self.page_title) < \
+            (sort_key(other.ip_address), other.date, other.page_title)
+
+
+    @property
+    def network(self):
+        """The ip_address as an IPv[46]Network; a single address is a /32
+        (or /128).
+
+        """
+        return ip_network(self.ip_address)
+
+
+    def is_range(self):
+        return isinstance(self.ip_address, (IPv4Network, IPv6Network))
+
+
     @staticmethod
     def find_common_network(infos):
-        ips = [int(i.ip_address) for i in infos]
-        bits = [list(map(int, format(i, '032b'))) for i in ips]
-        slices = zip(*bits)
-        bit_sets = [set(s) for s in slices]
-        prefix = 0
-        prefix_length = 0
-        done = False
-        for bit_set in bit_sets:
-            prefix <<= 1
-            if done:
-                continue
-            if len(bit_set) > 1:
-                done = True
-                continue
-            prefix_length += 1
-            prefix |= bit_set.pop()
-        return IPv4Network((prefix, prefix_length))
+        """All the infos must be the same IP version."""
+        networks = [i.network for i in infos]
+        return common_network([n.network_address for n in networks] + [n.broadcast_address for n in networks])
 
 
 def get_current_case_names(wiki):
@@ -323,3 +387,18 @@ def get_current_case_names(wiki):
             if name and '/' not in name:
                 names.append(name)
     return names
+
+
+def get_archived_case_names(wiki):
+    """Return a list of the names of all the SPI cases which have an
+    archive page, as strings.  Like get_current_case_names(), cases
+    with '/' in them are left out.
+
+    """
+    names = []
+    for title in wiki.page_titles('Sockpuppet investigations/', namespace=4):
+        _, _, subpage = title.partition('/')
+        name, _, suffix = subpage.partition('/')
+        if name and suffix == 'Archive':
+            names.append(name)
+    return names
@@ -0,0 +1,162 @@
+from datetime import datetime, timezone
+from unittest import TestCase
+import pickle
+
+from spi.contrib_store import ContribStore
+from wiki_interface.data import WikiContrib
+
+
+def _dt(year, month, day, hour=0):
+    "Construct a UTC-aware datetime."
+    return datetime(year, month, day, hour, tzinfo=timezone.utc)
+
+
+CONTRIBS = [
+    WikiContrib(1003, _dt(2020, 1, 3, 12), 'Fred', 0, 'Foo', 'c3', tags=['t1', 't2']),
+    WikiContrib(1002, _dt(2020, 1, 2), 'Fred', 1, 'Talk:Foo', None),
+    WikiContrib(1001, _dt(2020, 1, 1), 'Fred', 0, 'Foo', '', is_live=False, tags=['t2']),
+]
+
+
+class ContribStoreTest(TestCase):
+    def test_empty_store(self):
+        store = ContribStore()
+
+        self.assertEqual(len(store), 0)
+        self.assertEqual(list(store), [])
+        self.assertFalse(store)
+
+
+    def test_store_produces_original_contribs(self):
+        store = ContribStore(CONTRIBS)
+
+        self.assertEqual(len(store), 3)
+        self.assertEqual(list(store), CONTRIBS)
+        self.assertEqual(store[0], CONTRIBS[0])
+        self.assertEqual(store[-1], CONTRIBS[-1])
+
+
+    def test_index_out_of_range_raises_index_error(self):
+        store = ContribStore(CONTRIBS)
+
+        with self.assertRaises(IndexError):
+            store[3]  # pylint: disable=pointless-statement
+
+
+    def test_slice(self):
+        store = ContribStore(CONTRIBS)
+
+        self.assertEqual(list(store[1:]), CONTRIBS[1:])
+        self.assertEqual(list(store[:1]), CONTRIBS[:1])
+        self.assertEqual(list(store[::2]), CONTRIBS[::2])
+        self.assertEqual(list(store[2:1]), [])
+
+
+    def test_slice_round_trip(self):
+        store = ContribStore(CONTRIBS)[:2]
+
+        self.assertEqual(list(ContribStore.from_bytes(store.to_bytes())), CONTRIBS[:2])
+        self.assertEqual(list(store.prepended(CONTRIBS[2:])), CONTRIBS[2:] + CONTRIBS[:2])
+
+
+    def test_window(self):
+        store = ContribStore(CONTRIBS)
+
+        self.assertEqual(list(store.window()), CONTRIBS)
+        self.assertEqual(list(store.window(start=_dt(2020, 1, 2))), CONTRIBS[:2])
+        self.assertEqual(list(store.window(end=_dt(2020, 1, 2))), CONTRIBS[1:])
+        self.assertEqual(list(store.window(_dt(2020, 1, 2), _dt(2020, 1, 2))), CONTRIBS[1:2])
+        self.assertEqual(list(store.window(start=_dt(2021, 1, 1))), [])
+
+
+    def test_window_with_naive_store(self):
+        contribs = [WikiContrib(2, datetime(2020, 1, 2), 'Fred', 0, 'Foo', ''),
+                    WikiContrib(1, datetime(2020, 1, 1), 'Fred', 0, 'Foo', '')]
+        store = ContribStore(contribs)
+
+        self.assertEqual(list(store.window(start=_dt(2020, 1, 2))), contribs[:1])
+
+
+    def test_strings_are_interned(self):
+        store = ContribStore(CONTRIBS)
+
+        self.assertEqual(sorted(store.strings), ['', 'Foo', 'Fred', 'Talk:Foo', 'c3', 't1', 't2'])
+
+
+    def test_naive_timestamps_are_preserved(self):
+        contribs = [WikiContrib(1001, datetime(2020, 1, 1), 'Fred', 0, 'Foo', '')]
+
+        store = ContribStore.from_bytes(ContribStore(contribs).to_bytes())
+
+        self.assertEqual(list(store), contribs)
+        self.assertIsNone(store.timestamp_at(0).tzinfo)
+
+
+    def test_mixed_naive_and_aware_timestamps_raises_value_error(self):
+        with self.assertRaises(ValueError):
+            ContribStore([WikiContrib(2, datetime(2020, 1, 2), 'Fred', 0, 'Foo', ''),
+                          WikiContrib(1, _dt(2020, 1, 1), 'Fred', 0, 'Foo', '')])
+
+
+    def test_bytes_round_trip(self):
+        store = ContribStore(CONTRIBS)
+
+        self.assertEqual(list(ContribStore.from_bytes(store.to_bytes())), CONTRIBS)
+
+
+    def test_empty_bytes_round_trip(self):
+        self.assertEqual(list(ContribStore.from_bytes(ContribStore().to_bytes())), [])
+
+
+    def test_from_bytes_with_bad_data_raises_value_error(self):
+        with self.assertRaises(ValueError):
+            ContribStore.from_bytes(b'not a contrib store')
+
+
+    def test_bytes_are_smaller_than_pickled_list(self):
+        contribs = [WikiContrib(i, _dt(2020, 1, 1), 'Fred', 0, f'Title {i % 10}', 'comment', tags=['t1'])
+                    for i in range(1000)]
+
+        self.assertLess(len(ContribStore(contribs).to_bytes()), len(pickle.dumps(contribs)))
+
+
+    def test_prepended(self):
+        store = ContribStore(CONTRIBS[1:])
+        new_contribs = [WikiContrib(1004, _dt(2020, 1, 4), 'Fred', 0, 'Bar', 'c4', tags=['t3']),
+                        CONTRIBS[0]]
+
+        new_store = store.prepended(new_contribs)
+
+        self.assertEqual(list(new_store), new_contribs + CONTRIBS[1:])
+        self.assertEqual(list(store), CONTRIBS[1:])
+
+
+    def test_prepended_to_loaded_store(self):
+        store = ContribStore.from_bytes(ContribStore(CONTRIBS[1:]).to_bytes())
+
+        new_store = store.prepended(CONTRIBS[:1])
+
+        self.assertEqual(list(ContribStore.from_bytes(new_store.to_bytes())), CONTRIBS)
+
+
+    def test_prepended_to_empty_loaded_store(self):
+        store = ContribStore.from_bytes(ContribStore().to_bytes())
+
+        self.assertEqual(list(store.prepended(CONTRIBS)), CONTRIBS)
+
+
+    def test_equals_list(self):
+        self.assertEqual(ContribStore(CONTRIBS), CONTRIBS)
+        self.assertNotEqual(ContribStore(CONTRIBS), CONTRIBS[1:])
+
+
+    def test_concatenate(self):
+        stores = [ContribStore(CONTRIBS[:1]),
+                  ContribStore(),
+                  ContribStore.from_bytes(ContribStore(CONTRIBS[1:]).to_bytes())]
+
+        self.assertEqual(list(ContribStore.concatenate(stores)), CONTRIBS)
+
+
+    def test_concatenate_nothing(self):
+        self.assertEqual(list(ContribStore.concatenate([])), [])
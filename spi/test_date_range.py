@@ -0,0 +1,63 @@
+from datetime import datetime, timedelta, timezone
+from unittest import TestCase
+
+from spi.date_range import DateRange
+
+
+def _dt(year, month, day, *args):
+    return datetime(year, month, day, *args, tzinfo=timezone.utc)
+
+
+class DateRangeTest(TestCase):
+    def test_from_empty_query_is_unbounded(self):
+        date_range = DateRange.from_query({})
+
+        self.assertEqual(date_range, DateRange())
+        self.assertFalse(date_range)
+
+
+    def test_from_query_with_start_and_end(self):
+        date_range = DateRange.from_query({'start': '2020-01-01', 'end': '2020-01-31'})
+
+        self.assertEqual(date_range.start, _dt(2020, 1, 1))
+        self.assertEqual(date_range.end, _dt(2020, 1, 31, 23, 59, 59, 999999))
+
+
+    def test_from_query_with_days(self):
+        now = _dt(2020, 4, 1)
+
+        date_range = DateRange.from_query({'days': '90'}, now=now)
+
+        self.assertEqual(date_range, DateRange(now - timedelta(days=90), None))
+
+
+    def test_from_query_with_invalid_parameters_raises_value_error(self):
+        for query in [{'start': 'junk'},
+                      {'days': 'junk'},
+                      {'days': '0'},
+                      {'days': '1', 'start': '2020-01-01'},
+                      {'start': '2020-02-01', 'end': '2020-01-01'}]:
+            with self.subTest(query=query):
+                with self.assertRaises(ValueError):
+                    DateRange.from_query(query)
+
+
+    def test_contains(self):
+        date_range = DateRange(_dt(2020, 1, 1), _dt(2020, 1, 31))
+
+        self.assertTrue(date_range.contains(_dt(2020, 1, 1)))
+        self.assertTrue(date_range.contains(datetime(2020, 1, 15)))
+        self.assertFalse(date_range.contains(_dt(2020, 2, 1)))
+        self.assertTrue(DateRange().contains(_dt(1999, 1, 1)))
+
+
+    def test_ends_before(self):
+        self.assertTrue(DateRange(end=_dt(2020, 1, 31)).ends_before(datetime(2020, 2, 1)))
+        self.assertFalse(DateRange(end=_dt(2020, 1, 31)).ends_before(_dt(2020, 1, 2)))
+        self.assertFalse(DateRange().ends_before(_dt(2020, 1, 2)))
+
+
+    def test_wiki_kwargs_swaps_bounds(self):
+        date_range = DateRange(_dt(2020, 1, 1), _dt(2020, 1, 31))
+
+        self.assertEqual(date_range.wiki_kwargs(), {'start': _dt(2020, 1, 31), 'end': _dt(2020, 1, 1)})
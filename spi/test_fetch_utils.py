@@ -0,0 +1,159 @@
+from unittest import TestCase
+from unittest.mock import Mock
+import threading
+
+from django_tools.middlewares import ThreadLocal
+
+from spi.fetch_utils import iter_with_request, map_as_completed, map_concurrently, start_concurrently
+
+
+class MapConcurrentlyTest(TestCase):
+    def test_empty_items_returns_empty_list(self):
+        self.assertEqual(map_concurrently(str, []), [])
+
+
+    def test_results_are_in_item_order(self):
+        self.assertEqual(map_concurrently(lambda i: i * 2, range(20), max_workers=4),
+                         [i * 2 for i in range(20)])
+
+
+    def test_calls_run_concurrently(self):
+        # Each call blocks until all have started; if the calls were
+        # serialized, this would time out.
+        barrier = threading.Barrier(3, timeout=5)
+        def func(item):
+            barrier.wait()
+            return item
+
+        self.assertEqual(map_concurrently(func, ['a', 'b', 'c'], max_workers=3), ['a', 'b', 'c'])
+
+
+    def test_max_workers_is_respected(self):
+        lock = threading.Lock()
+        active = []
+        peak = []
+        def func(item):
+            with lock:
+                active.append(item)
+                peak.append(len(active))
+            threading.Event().wait(0.01)
+            with lock:
+                active.remove(item)
+            return item
+
+        map_concurrently(func, range(10), max_workers=2)
+
+        self.assertLessEqual(max(peak), 2)
+
+
+    def test_exception_is_propagated(self):
+        def func(item):
+            if item == 3:
+                raise ValueError('bang')
+            return item
+
+        with self.assertRaisesRegex(ValueError, 'bang'):
+            map_concurrently(func, range(5), max_workers=2)
+
+
+    def test_current_request_is_visible_to_workers(self):
+        # pylint: disable=protected-access
+        request = Mock()
+        ThreadLocal._thread_locals.request = request
+        self.addCleanup(delattr, ThreadLocal._thread_locals, 'request')
+
+        seen = map_concurrently(lambda item: ThreadLocal.get_current_request(), range(2), max_workers=2)
+
+        self.assertEqual(seen, [request, request])
+
+
+    def test_explicit_request_is_visible_to_workers(self):
+        request = Mock()
+
+        seen = map_concurrently(lambda item: ThreadLocal.get_current_request(), range(3), max_workers=2,
+                                request=request)
+
+        self.assertEqual(seen, [request, request, request])
+        self.assertIsNone(ThreadLocal.get_current_request())
+
+
+    def test_explicit_request_is_visible_without_workers(self):
+        request = Mock()
+
+        seen = map_concurrently(lambda item: ThreadLocal.get_current_request(), range(3), max_workers=1,
+                                request=request)
+
+        self.assertEqual(seen, [request, request, request])
+        self.assertIsNone(ThreadLocal.get_current_request())
+
+
+class MapAsCompletedTest(TestCase):
+    def test_empty_items(self):
+        self.assertEqual(list(map_as_completed(str, [])), [])
+
+
+    def test_results_are_paired_with_items(self):
+        self.assertCountEqual(map_as_completed(lambda i: i * 2, range(20), max_workers=4),
+                              [(i, i * 2) for i in range(20)])
+
+
+    def test_results_are_in_completion_order(self):
+        slow_started = threading.Event()
+        fast_done = threading.Event()
+        def func(item):
+            if item == 'slow':
+                slow_started.set()
+                fast_done.wait(5)
+            else:
+                slow_started.wait(5)
+            return item
+
+        results = map_as_completed(func, ['slow', 'fast'], max_workers=2)
+
+        self.assertEqual(next(results), ('fast', 'fast'))
+        fast_done.set()
+        self.assertEqual(next(results), ('slow', 'slow'))
+
+
+    def test_exception_is_propagated(self):
+        def func(item):
+            raise ValueError('bang')
+
+        with self.assertRaisesRegex(ValueError, 'bang'):
+            list(map_as_completed(func, range(5), max_workers=2))
+
+
+class StartConcurrentlyTest(TestCase):
+    def test_iterators_produce_all_items(self):
+        iterators = start_concurrently([[1, 2, 3], [], iter('ab')], max_workers=3)
+
+        self.assertEqual([list(i) for i in iterators], [[1, 2, 3], [], ['a', 'b']])
+
+
+    def test_only_first_item_is_fetched_concurrently(self):
+        barrier = threading.Barrier(2, timeout=5)
+        consumed = []
+        def stream(name):
+            barrier.wait()
+            for i in range(3):
+                consumed.append((name, i))
+                yield i
+
+        iterators = start_concurrently([stream('a'), stream('b')], max_workers=2)
+
+        self.assertCountEqual(consumed, [('a', 0), ('b', 0)])
+        self.assertEqual([list(i) for i in iterators], [[0, 1, 2], [0, 1, 2]])
+
+
+class IterWithRequestTest(TestCase):
+    def test_request_is_current_while_items_are_produced(self):
+        request = Mock()
+        def stream():
+            for _ in range(2):
+                yield ThreadLocal.get_current_request()
+
+        items = iter_with_request(stream(), request)
+
+        self.assertIs(next(items), request)
+        self.assertIsNone(ThreadLocal.get_current_request())
+        self.assertEqual(list(items), [request])
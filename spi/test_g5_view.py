@@ -1,13 +1,25 @@
-from unittest.mock import patch
+from datetime import datetime, timezone
+from unittest.mock import MagicMock, patch
 
+from spi.g5_view import CacheableG5Summaries, G5Score, G5Summary, G5_CACHE_TIMEOUT
 from spi.test_spi_view import SpiViewTestCase
 from spi.spi_view import ValidatedUser
+from wiki_interface.block_utils import BlockEvent
+from wiki_interface.data import WikiContrib
 
 
 class G5ViewTest(SpiViewTestCase):
     #pylint: disable=arguments-differ
     def setUp(self):
         super().setUp('spi.g5_view')
+        case_patcher = patch('spi.g5_view.CacheableSpiCase', autospec=True)
+        self.mock_CacheableSpiCase = case_patcher.start()  # pylint: disable=invalid-name
+        self.mock_CacheableSpiCase.get_rev_id.return_value = 1234
+        self.addCleanup(case_patcher.stop)
+        cache_patcher = patch('spi.g5_view.cache', autospec=True)
+        self.mock_cache = cache_patcher.start()
+        self.mock_cache.get.return_value = None
+        self.addCleanup(cache_patcher.stop)
 
 
     @patch('spi.g5_view.get_sock_names', autospec=True)
@@ -21,3 +33,114 @@ class G5ViewTest(SpiViewTestCase):
         response = self.client.get('/spi/g5/Fred')
 
         self.assertEqual(response.status_code, 200)
+
+
+    @patch('spi.g5_view.get_sock_names', autospec=True)
+    def test_date_range_limits_contributions_but_not_blocks(self, mock_get_sock_names):
+        mock_get_sock_names.return_value = [ValidatedUser("User1", "20 June 2020", True)]
+        self.mock_wiki.user_blocks.return_value = []
+        self.mock_wiki.user_contributions.return_value = []
+
+        response = self.client.get('/spi/g5/Fred', {'days': '90'})
+
+        self.assertEqual(response.status_code, 200)
+        self.mock_wiki.user_blocks.assert_called_once_with('Fred', end=None)
+        kwargs = self.mock_wiki.user_contributions.call_args.kwargs
+        self.assertIsNone(kwargs['start'])
+        self.assertLess(kwargs['end'], datetime.now(timezone.utc))
+
+
+    def test_invalid_date_range_returns_400(self):
+        response = self.client.get('/spi/g5/Fred', {'days': 'junk'})
+
+        self.assertEqual(response.status_code, 400)
+
+
+    @patch('spi.g5_view.get_sock_names', autospec=True)
+    def test_only_pages_created_while_blocked_are_listed(self, mock_get_sock_names):
+        def dt(day):
+            return datetime(2020, 1, day, tzinfo=timezone.utc)
+        mock_get_sock_names.return_value = [ValidatedUser("User1", "20 June 2020", True)]
+        self.mock_wiki.user_blocks.return_value = [BlockEvent('Fred', dt(2), 1, dt(4))]
+        self.mock_wiki.user_contributions.return_value = [
+            WikiContrib(5, dt(5), 'User1', 0, 'After', ''),
+            WikiContrib(3, dt(3), 'User1', 0, 'During', ''),
+            WikiContrib(1, dt(1), 'User1', 0, 'Before', ''),
+        ]
+        page = self.mock_wiki.page.return_value
+        page.revisions.return_value = []
+        self.mock_wiki.get_pages.side_effect = lambda titles: {t: page for t in titles}
+
+        response = self.client.get('/spi/g5/Fred')
+
+        self.assertEqual([p.title for p in response.context['page_creations']], ['During'])
+
+
+    @patch('spi.g5_view.get_sock_names', autospec=True)
+    def test_deleted_pages_are_not_listed(self, mock_get_sock_names):
+        mock_get_sock_names.return_value = [ValidatedUser("User1", "20 June 2020", True)]
+        self.mock_wiki.user_blocks.return_value = [BlockEvent('Fred', datetime(2020, 1, 1, tzinfo=timezone.utc), 1)]
+        self.mock_wiki.user_contributions.return_value = [
+            WikiContrib(3, datetime(2020, 1, 3, tzinfo=timezone.utc), 'User1', 0, 'Exists', ''),
+            WikiContrib(2, datetime(2020, 1, 2, tzinfo=timezone.utc), 'User1', 0, 'Deleted', ''),
+        ]
+        pages = {'Exists': MagicMock(), 'Deleted': MagicMock()}
+        pages['Exists'].exists.return_value = True
+        pages['Exists'].revisions.return_value = [WikiContrib(3, None, 'User1', 0, 'Exists', '')]
+        pages['Deleted'].exists.return_value = False
+        self.mock_wiki.get_pages.return_value = pages
+
+        response = self.client.get('/spi/g5/Fred')
+
+        self.mock_wiki.get_pages.assert_called_once()
+        self.assertEqual(list(self.mock_wiki.get_pages.call_args.args[0]), ['Exists', 'Deleted'])
+        self.assertEqual([(p.title, p.score.rating) for p in response.context['page_creations']],
+                         [('Exists', 'likely')])
+
+
+    @patch('spi.g5_view.get_sock_names', autospec=True)
+    def test_cache_miss_computes_and_caches_summaries(self, mock_get_sock_names):
+        mock_get_sock_names.return_value = []
+        self.mock_wiki.user_blocks.return_value = []
+        self.mock_wiki.user_contributions.return_value = []
+
+        response = self.client.get('/spi/g5/Fred')
+
+        self.assertEqual(response.status_code, 200)
+        self.mock_cache.get.assert_called_once_with('spi.CacheableG5Summaries.Fred', version=1234)
+        self.mock_cache.set.assert_called_once_with('spi.CacheableG5Summaries.Fred',
+                                                    CacheableG5Summaries('Fred', 1234, []),
+                                                    G5_CACHE_TIMEOUT,
+                                                    version=1234)
+
+
+    @patch('spi.g5_view.get_sock_names', autospec=True)
+    def test_cache_miss_with_date_range_is_not_cached(self, mock_get_sock_names):
+        mock_get_sock_names.return_value = []
+        self.mock_wiki.user_blocks.return_value = []
+        self.mock_wiki.user_contributions.return_value = []
+
+        response = self.client.get('/spi/g5/Fred', {'days': '30'})
+
+        self.assertEqual(response.status_code, 200)
+        self.mock_cache.set.assert_not_called()
+
+
+    @patch('spi.g5_view.get_sock_names', autospec=True)
+    def test_cache_hit_renders_cached_summaries_which_still_exist(self, mock_get_sock_names):
+        def summary(title, day):
+            return G5Summary(title, 'User1', datetime(2020, 1, day, tzinfo=timezone.utc), G5Score('likely'))
+        self.mock_cache.get.return_value = CacheableG5Summaries('Fred', 1234, [summary('Exists', 3),
+                                                                               summary('Deleted', 2),
+                                                                               summary('Old', 1)])
+        pages = {'Exists': MagicMock(), 'Deleted': MagicMock()}
+        pages['Exists'].exists.return_value = True
+        pages['Deleted'].exists.return_value = False
+        self.mock_wiki.get_pages.return_value = pages
+
+        response = self.client.get('/spi/g5/Fred', {'start': '2020-01-02'})
+
+        self.assertEqual([p.title for p in response.context['page_creations']], ['Exists'])
+        self.assertEqual(list(self.mock_wiki.get_pages.call_args.args[0]), ['Exists', 'Deleted'])
+        mock_get_sock_names.assert_not_called()
+        self.mock_wiki.user_contributions.assert_not_called()
@@ -71,3 +71,26 @@ class IcacheTest(TestCase):
         self.assertEqual(len(cm.records), 3)
         for record in cm.records:
             self.assertEqual(record.levelname, 'WARNING')
+
+
+    def test_get_many_and_set_many_are_called_with_use_cache_missing(self, Thread_Local, django_cache):
+        type(Thread_Local.get_current_request()).GET = PropertyMock(return_value={})
+        django_cache.get_many.return_value = {'key': 'value'}
+
+        icache.set_many({'key': 'value'}, 60)
+        data = icache.get_many(['key'])
+
+        django_cache.set_many.assert_called_once_with({'key': 'value'}, 60)
+        django_cache.get_many.assert_called_once_with(['key'])
+        self.assertEqual(data, {'key': 'value'})
+
+
+    def test_get_many_and_set_many_are_not_called_with_use_cache_equals_0(self, Thread_Local, django_cache):
+        type(Thread_Local.get_current_request()).GET = PropertyMock(return_value={'use-cache': '0'})
+
+        icache.set_many({'key': 'value'})
+        data = icache.get_many(['key'])
+
+        django_cache.set_many.assert_not_called()
+        django_cache.get_many.assert_not_called()
+        self.assertEqual(data, {})
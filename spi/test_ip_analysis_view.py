@@ -1,5 +1,6 @@
 from unittest.mock import patch
 
+from spi.spi_utils import CacheableSpiCase, SpiIpInfo
 from spi.test_spi_view import SpiViewTestCase
 
 # pylint: disable=invalid-name
@@ -19,3 +20,47 @@ class IpAnalysisiewTest(SpiViewTestCase):
         response = self.client.get('/spi/ip-analysis/Ferd/')
 
         self.assertEqual(response.status_code, 200)
+
+
+    @patch('spi.ip_analysis_view.CacheableSpiCase', autospec=True)
+    def test_ips_are_grouped_by_network(self, mock_CacheableSpiCase):
+        mock_CacheableSpiCase.get.return_value = CacheableSpiCase('Ferd', 1, [], [
+            SpiIpInfo('2600:1000::1', '1 January 2020', 'Ferd'),
+            SpiIpInfo('1.2.3.5', '2 January 2020', 'Ferd'),
+            SpiIpInfo('1.2.3.4', '1 January 2020', 'Ferd'),
+            SpiIpInfo('1.2.4.0/22', '1 January 2020', 'Ferd'),
+            SpiIpInfo('1.2.3.4', '3 January 2020', 'Ferd'),
+        ])
+
+        response = self.client.get('/spi/ip-analysis/Ferd/')
+
+        self.assertEqual(response.status_code, 200)
+        groups = response.context['ip_groups']
+        self.assertEqual([str(g.network) for g in groups], ['1.2.3.0/24', '1.2.4.0/22', '2600:1000::/64'])
+        self.assertEqual([(str(s.ip_address), s.spi_dates) for s in groups[0].ip_summaries],
+                         [('1.2.3.4', ['1 January 2020', '3 January 2020']),
+                          ('1.2.3.5', ['2 January 2020'])])
+
+
+    @patch('spi.ip_analysis_view.CacheableSpiCase', autospec=True)
+    def test_range_selects_overlapping_ips(self, mock_CacheableSpiCase):
+        mock_CacheableSpiCase.get.return_value = CacheableSpiCase('Ferd', 1, [], [
+            SpiIpInfo('1.2.3.4', '1 January 2020', 'Ferd'),
+            SpiIpInfo('1.2.4.0/22', '1 January 2020', 'Ferd'),
+            SpiIpInfo('1.3.0.1', '1 January 2020', 'Ferd'),
+        ])
+
+        response = self.client.get('/spi/ip-analysis/Ferd/', {'range': '1.2.0.0/16'})
+
+        self.assertEqual(response.status_code, 200)
+        summaries = [s for g in response.context['ip_groups'] for s in g.ip_summaries]
+        self.assertEqual([str(s.ip_address) for s in summaries], ['1.2.3.4', '1.2.4.0/22'])
+
+
+    @patch('spi.ip_analysis_view.CacheableSpiCase', autospec=True)
+    def test_invalid_range_returns_400(self, mock_CacheableSpiCase):
+        mock_CacheableSpiCase.get.return_value = CacheableSpiCase('Ferd', 1, [], [])
+
+        response = self.client.get('/spi/ip-analysis/Ferd/', {'range': '1.2.3'})
+
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,97 @@
+from ipaddress import ip_address, IPv4Network, IPv6Network
+import random
+from unittest import TestCase
+
+from spi.ip_utils import common_network, sort_key, IpIndex
+
+
+def addresses(*strings):
+    return [ip_address(s) for s in strings]
+
+
+class CommonNetworkTest(TestCase):
+    def test_empty_raises_value_error(self):
+        with self.assertRaisesRegex(ValueError, 'empty ip list'):
+            common_network([])
+
+
+    def test_mixed_versions_raises_value_error(self):
+        with self.assertRaisesRegex(ValueError, 'multiple ip types'):
+            common_network(addresses('1.2.3.4', '2600::'))
+
+
+    def test_single_address(self):
+        self.assertEqual(common_network(addresses('1.2.3.4')), IPv4Network('1.2.3.4/32'))
+        self.assertEqual(common_network(addresses('2600::1')), IPv6Network('2600::1/128'))
+
+
+    def test_ipv4(self):
+        self.assertEqual(common_network(addresses('100.0.0.5', '100.0.0.1', '100.0.0.4')),
+                         IPv4Network('100.0.0.0/29'))
+        self.assertEqual(common_network(addresses('0.0.0.0', '255.255.255.255')), IPv4Network('0.0.0.0/0'))
+
+
+    def test_ipv6(self):
+        self.assertEqual(common_network(addresses('2000::1', '2000::5')), IPv6Network('2000::/125'))
+
+
+class SortKeyTest(TestCase):
+    def test_sort_key(self):
+        items = ['2600::1', '10.0.0.1', '10.0.0.0/24', '9.0.0.0/8', '10.0.0.0/8']
+
+        self.assertEqual(sorted(items, key=sort_key),
+                         ['9.0.0.0/8', '10.0.0.0/8', '10.0.0.0/24', '10.0.0.1', '2600::1'])
+
+
+class IpIndexTest(TestCase):
+    def setUp(self):
+        self.index = IpIndex([('10.0.0.0/8', 'a'),
+                              ('10.1.0.0/16', 'b'),
+                              ('10.1.2.3', 'c'),
+                              ('10.1.2.3', 'd'),
+                              ('10.2.0.1', 'e'),
+                              ('11.0.0.1', 'f'),
+                              ('2600::/32', 'g'),
+                              ('2600::1', 'h')])
+
+
+    def values(self, network):
+        return [v for n, v in self.index.overlapping(network)]
+
+
+    def test_len(self):
+        self.assertEqual(len(self.index), 8)
+
+
+    def test_address_finds_its_supernets(self):
+        self.assertEqual(self.values('10.1.2.3'), ['a', 'b', 'c', 'd'])
+
+
+    def test_range_finds_subnets_and_supernets(self):
+        self.assertEqual(self.values('10.1.0.0/16'), ['a', 'b', 'c', 'd'])
+        self.assertEqual(self.values('10.0.0.0/14'), ['a', 'b', 'c', 'd', 'e'])
+
+
+    def test_no_overlap(self):
+        self.assertEqual(self.values('12.0.0.0/8'), [])
+        self.assertEqual(self.values('2601::/16'), [])
+
+
+    def test_versions_are_separate(self):
+        self.assertEqual(self.values('::/0'), ['g', 'h'])
+        self.assertEqual(self.values('0.0.0.0/0'), ['a', 'b', 'c', 'd', 'e', 'f'])
+
+
+    def test_returns_networks(self):
+        self.assertEqual(self.index.overlapping('11.0.0.0/24'), [(IPv4Network('11.0.0.1/32'), 'f')])
+
+
+    def test_matches_brute_force(self):
+        rng = random.Random(42)
+        networks = [IPv4Network((rng.getrandbits(12) << 20, 32), strict=False).supernet(new_prefix=rng.randrange(4, 33))
+                    for _ in range(300)]
+        index = IpIndex((n, i) for i, n in enumerate(networks))
+        for _ in range(100):
+            query = IPv4Network((rng.getrandbits(12) << 20, 32)).supernet(new_prefix=rng.randrange(4, 33))
+            expected = sorted(i for i, n in enumerate(networks) if n.overlaps(query))
+            self.assertEqual(sorted(v for n, v in index.overlapping(query)), expected)
@@ -1,9 +1,10 @@
-from datetime import datetime
+from datetime import datetime, timezone
 from unittest.mock import patch
 
+from spi.date_range import DateRange
 from spi.pages_view import PagesView
 from spi.test_spi_view import SpiViewTestCase
-from spi.user_utils import CacheableUserContribs
+from spi.user_utils import CacheableDeletedContribs, CacheableUserContribs
 from wiki_interface.data import WikiContrib
 
 # pylint: disable=invalid-name
@@ -25,30 +26,34 @@ class PagesViewTest(SpiViewTestCase):
 
     @patch('spi.pages_view.CacheableUserContribs', spec=CacheableUserContribs)
     def test_get_page_data(self, mock_CacheableUserContribs):
-        mock_CacheableUserContribs.get.side_effect = [
-            CacheableUserContribs([
+        # Users are fetched concurrently, so the data is keyed by name
+        # rather than relying on call order.
+        contribs = {
+            'u1': CacheableUserContribs([
                 WikiContrib(103, datetime(2020, 1, 5), 'u1', 0, 'Title1', 'comment', tags=['mw-reverted']),
                 WikiContrib(103, datetime(2020, 1, 3), 'u1', 0, 'Title2', 'comment', tags=['mw-reverted']),
                 WikiContrib(103, datetime(2020, 1, 2), 'u1', 0, 'Title1', 'comment'),
             ]),
-            CacheableUserContribs([
+            'u2': CacheableUserContribs([
                 WikiContrib(103, datetime(2020, 1, 5), 'u2', 0, 'Title1', 'comment', tags=['mw-reverted', 'mobile edit']),
                 WikiContrib(103, datetime(2020, 1, 3), 'u2', 0, 'Title2', 'comment', tags=['mobile edit']),
                 WikiContrib(103, datetime(2020, 1, 2), 'u2', 0, 'Title3', 'comment'),
             ]),
-            CacheableUserContribs([
+            'u3': CacheableUserContribs([
                 WikiContrib(103, datetime(2020, 1, 5), 'u3', 0, 'Title1', 'comment'),
             ]),
-        ]
-        self.mock_wiki.deleted_user_contributions.side_effect = [
-            [WikiContrib(102, datetime(2020, 2, 2), 'u1', 0, 'Title1', 'comment', is_live=False),
-            ],
-            [WikiContrib(102, datetime(2020, 2, 2), 'u2', 0, 'Title2', 'comment', is_live=False),
-             WikiContrib(102, datetime(2020, 2, 1), 'u2', 0, 'Title3', 'comment', is_live=False),
-            ],
-            [WikiContrib(102, datetime(2020, 2, 2), 'u3', 0, 'Title4', 'comment', is_live=False),
-            ],
-        ]
+        }
+        deleted_contribs = {
+            'u1': [WikiContrib(102, datetime(2020, 2, 2), 'u1', 0, 'Title1', 'comment', is_live=False),
+                  ],
+            'u2': [WikiContrib(102, datetime(2020, 2, 2), 'u2', 0, 'Title2', 'comment', is_live=False),
+                   WikiContrib(102, datetime(2020, 2, 1), 'u2', 0, 'Title3', 'comment', is_live=False),
+                  ],
+            'u3': [WikiContrib(102, datetime(2020, 2, 2), 'u3', 0, 'Title4', 'comment', is_live=False),
+                  ],
+        }
+        mock_CacheableUserContribs.get.side_effect = lambda wiki, user_name, date_range: contribs[user_name]
+        self.mock_wiki.deleted_user_contributions.side_effect = lambda user_name, **kwargs: deleted_contribs[user_name]
 
         page_data = PagesView.get_page_data(self.mock_wiki, ['u1', 'u2', 'u3'])
 
@@ -91,5 +96,34 @@ class PagesViewTest(SpiViewTestCase):
 
         self.client.get('/spi/pages/Foo', {'users': ['u1']})
 
-        mock_CacheableUserContribs.get.assert_called_once_with(self.mock_wiki, 'u1')
-        self.mock_wiki.deleted_user_contributions.assert_called_once_with('u1')
+        mock_CacheableUserContribs.get.assert_called_once_with(self.mock_wiki, 'u1', DateRange())
+        self.mock_wiki.deleted_user_contributions.assert_called_once_with('u1', end=None)
+
+
+    @patch('spi.pages_view.CacheableDeletedContribs', spec=CacheableDeletedContribs)
+    @patch('spi.pages_view.CacheableUserContribs', spec=CacheableUserContribs)
+    def test_date_range_is_passed_to_back_end(self, mock_CacheableUserContribs, mock_CacheableDeletedContribs):
+        mock_CacheableUserContribs.get.return_value = CacheableUserContribs([])
+        mock_CacheableDeletedContribs.get.return_value = CacheableDeletedContribs([])
+        self.force_login()
+
+        self.client.get('/spi/pages/Foo', {'users': ['u1'], 'start': '2020-01-01', 'end': '2020-01-31'})
+
+        date_range = DateRange(datetime(2020, 1, 1, tzinfo=timezone.utc),
+                               datetime(2020, 1, 31, 23, 59, 59, 999999, tzinfo=timezone.utc))
+        mock_CacheableUserContribs.get.assert_called_once_with(self.mock_wiki, 'u1', date_range)
+        mock_CacheableDeletedContribs.get.assert_called_once_with(self.mock_wiki, 'u1', date_range)
+
+
+    @patch('spi.pages_view.CacheableUserContribs', spec=CacheableUserContribs)
+    def test_get_page_data_counts_duplicate_user_as_one_editor(self, mock_CacheableUserContribs):
+        mock_CacheableUserContribs.get.return_value = CacheableUserContribs([
+            WikiContrib(103, datetime(2020, 1, 5), 'u1', 0, 'Title1', 'comment'),
+        ])
+        self.mock_wiki.deleted_user_contributions.return_value = []
+
+        page_data = PagesView.get_page_data(self.mock_wiki, ['u1', 'u1'])
+
+        self.assertEqual(page_data.edit_counts, {'Title1': 2})
+        self.assertEqual(page_data.editor_counts, {'Title1': 1})
+        self.assertEqual(page_data.reverted_counts, {})
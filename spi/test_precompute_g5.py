@@ -0,0 +1,47 @@
+from unittest import TestCase
+from unittest.mock import call, patch
+
+from django.core.management import call_command
+
+from spi.g5_view import CacheableG5Summaries
+
+
+@patch('spi.management.commands.precompute_g5.Wiki', autospec=True)
+@patch('spi.management.commands.precompute_g5.CacheableG5Summaries', autospec=True)
+@patch('spi.management.commands.precompute_g5.get_current_case_names', autospec=True)
+class PrecomputeG5Test(TestCase):
+    # pylint: disable=invalid-name
+
+    def test_refreshes_all_open_cases(self, mock_get_current_case_names, mock_CacheableG5Summaries, mock_Wiki):
+        mock_get_current_case_names.return_value = ['Fred', 'Wilma']
+        mock_CacheableG5Summaries.refresh.side_effect = lambda wiki, name: CacheableG5Summaries(name, 1)
+
+        call_command('precompute_g5')
+
+        wiki = mock_Wiki.return_value
+        self.assertEqual(mock_CacheableG5Summaries.refresh.call_args_list, [call(wiki, 'Fred'),
+                                                                           call(wiki, 'Wilma')])
+
+
+    def test_named_cases_only(self, mock_get_current_case_names, mock_CacheableG5Summaries, mock_Wiki):
+        mock_CacheableG5Summaries.refresh.side_effect = lambda wiki, name: CacheableG5Summaries(name, 1)
+
+        call_command('precompute_g5', 'Barney')
+
+        mock_get_current_case_names.assert_not_called()
+        mock_CacheableG5Summaries.refresh.assert_called_once_with(mock_Wiki.return_value, 'Barney')
+
+
+    def test_failure_does_not_stop_other_cases(self, mock_get_current_case_names, mock_CacheableG5Summaries,
+                                               mock_Wiki):
+        mock_get_current_case_names.return_value = ['Fred', 'Wilma']
+        mock_CacheableG5Summaries.refresh.side_effect = [ValueError('no case'), CacheableG5Summaries('Wilma', 1)]
+
+        with self.assertLogs('spi.precompute_g5', level='ERROR'):
+            call_command('precompute_g5')
+
+        self.assertEqual(mock_CacheableG5Summaries.refresh.call_count, 2)
+        # One anonymous Wiki is shared by all the cases, including the
+        # ones after a failure.
+        mock_Wiki.assert_called_once_with()
+        mock_get_current_case_names.assert_called_once_with(mock_Wiki.return_value)
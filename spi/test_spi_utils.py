@@ -1,14 +1,14 @@
 from unittest import TestCase
-from unittest.mock import patch, call, NonCallableMock
+from unittest.mock import patch, call, Mock, NonCallableMock
 from textwrap import dedent
-from ipaddress import IPv4Network
+from ipaddress import IPv4Address, IPv4Network, IPv6Address, IPv6Network
 from datetime import datetime
 import mwparserfromhell
 
 from wiki_interface import Wiki
 from wiki_interface.data import WikiContrib
 from spi.spi_utils import (SpiSourceDocument, SpiCase, SpiCaseDay, SpiIpInfo, SpiUserInfo, CacheableSpiCase,
-                           ArchiveError, get_current_case_names)
+                           ArchiveError, get_current_case_names, get_archived_case_names)
 
 
 def make_code(text):
@@ -189,6 +189,17 @@ class CacheableSpiCaseTest(TestCase):
         cache.set.assert_not_called()
         self.assertEqual(case.rev_id, 2020_07_29)
 
+    @patch('spi.spi_utils.cache')
+    def test_known_rev_id_is_not_fetched_again(self, cache):
+        wiki = NonCallableMock(Wiki)
+        cache.get.return_value = CacheableSpiCase('Fred', 2020_07_29)
+
+        case = CacheableSpiCase.get(wiki, 'Fred', rev_id=2020_07_29)
+
+        wiki.page.assert_not_called()
+        cache.get.assert_called_once_with('spi.CacheableSpiCase.Fred', version=2020_07_29)
+        self.assertEqual(case.rev_id, 2020_07_29)
+
 
 class SpiCaseTest(TestCase):
     def test_for_master_with_no_data(self):
@@ -566,7 +577,7 @@ class SpiCaseDayTest(TestCase):
                                SpiIpInfo('5.6.7.8', '21 March 2019', 'title')])
 
 
-    def test_find_ips_silently_skips_non_v4_addresses(self):
+    def test_find_ips_includes_v6_addresses(self):
         text = '''
         ===21 March 2019===
         {{checkip|1.2.3.4}}
@@ -574,6 +585,30 @@ class SpiCaseDayTest(TestCase):
         '''
         day = SpiCaseDay(make_code(text), 'title')
         ips = list(day.find_ips())
+        self.assertEqual(ips, [SpiIpInfo('1.2.3.4', '21 March 2019', 'title'),
+                               SpiIpInfo('5:6::7', '21 March 2019', 'title')])
+
+
+    def test_find_ips_includes_ranges(self):
+        text = '''
+        ===21 March 2019===
+        {{checkip|1.2.3.0/24}}
+        {{checkip| 2600:1000::/32 }}
+        '''
+        day = SpiCaseDay(make_code(text), 'title')
+        ips = list(day.find_ips())
+        self.assertEqual([ip.ip_address for ip in ips], [IPv4Network('1.2.3.0/24'), IPv6Network('2600:1000::/32')])
+
+
+    def test_find_ips_silently_skips_invalid_addresses(self):
+        text = '''
+        ===21 March 2019===
+        {{checkip|1.2.3.4}}
+        {{checkip|1.2.3}}
+        {{checkip|1.2.3.0/33}}
+        '''
+        day = SpiCaseDay(make_code(text), 'title')
+        ips = list(day.find_ips())
         self.assertEqual(ips, [SpiIpInfo('1.2.3.4', '21 March 2019', 'title')])
 
 
@@ -723,9 +758,31 @@ class SpiUserInfoTest(TestCase):
 
 
 class SpiIpInfoTest(TestCase):
-    def test_constructor_raises_value_error_if_not_valid_ip_v4_address(self):
+    def test_constructor_raises_value_error_if_not_valid_ip_address(self):
         with self.assertRaises(ValueError):
-            SpiIpInfo('1:2:3:4::5', '1 January 2019', 'title')
+            SpiIpInfo('1.2.3.4.5', '1 January 2019', 'title')
+
+
+    def test_constructor_accepts_v6_address(self):
+        info = SpiIpInfo('1:2:3:4::5', '1 January 2019', 'title')
+        self.assertEqual(info.ip_address, IPv6Address('1:2:3:4::5'))
+        self.assertFalse(info.is_range())
+
+
+    def test_constructor_accepts_range(self):
+        info = SpiIpInfo('1.2.3.4/24', '1 January 2019', 'title')
+        self.assertEqual(info.ip_address, IPv4Network('1.2.3.0/24'))
+        self.assertTrue(info.is_range())
+
+
+    def test_constructor_treats_full_length_prefix_as_address(self):
+        info = SpiIpInfo('1.2.3.4/32', '1 January 2019', 'title')
+        self.assertEqual(info.ip_address, IPv4Address('1.2.3.4'))
+
+
+    def test_network(self):
+        self.assertEqual(SpiIpInfo('1.2.3.4', '1 January 2019', 'title').network, IPv4Network('1.2.3.4/32'))
+        self.assertEqual(SpiIpInfo('1.2.3.0/24', '1 January 2019', 'title').network, IPv4Network('1.2.3.0/24'))
 
 
     def test_eq(self):
@@ -746,6 +803,11 @@ class SpiIpInfoTest(TestCase):
         self.assertLess(info1, info2)
 
 
+    def test_lt_mixed_versions_and_ranges(self):
+        infos = [SpiIpInfo(ip, '1 January 2019', 'title') for ip in ['1::1', '1.2.3.5', '1.2.3.4', '1.2.3.0/24']]
+        self.assertEqual([str(i.ip_address) for i in sorted(infos)], ['1.2.3.0/24', '1.2.3.4', '1.2.3.5', '1::1'])
+
+
     @staticmethod
     def test_hashable():
         info = SpiIpInfo('1.2.3.4', '1 January 2019', 'title')
@@ -762,6 +824,48 @@ class SpiIpInfoTest(TestCase):
         self.assertEqual(network, IPv4Network('1.2.3.0/27'))
 
 
+    def test_find_common_network_with_range(self):
+        infos = [
+            SpiIpInfo('1.2.3.4', '1 January 2019', 'title'),
+            SpiIpInfo('1.2.4.0/24', '1 January 2019', 'title')]
+        network = SpiIpInfo.find_common_network(infos)
+        self.assertEqual(network, IPv4Network('1.2.0.0/21'))
+
+
+class GetRevIdsTest(TestCase):
+    def test_get_rev_ids_uses_latest_of_case_and_archive(self):
+        wiki = NonCallableMock(Wiki)
+        pages = {'Wikipedia:Sockpuppet investigations/Fred': 100,
+                 'Wikipedia:Sockpuppet investigations/Fred/Archive': 200,
+                 'Wikipedia:Sockpuppet investigations/Joe': 300,
+                 'Wikipedia:Sockpuppet investigations/Joe/Archive': 0,
+                 'Wikipedia:Sockpuppet investigations/Nobody': 0,
+                 'Wikipedia:Sockpuppet investigations/Nobody/Archive': 0}
+        wiki.get_pages.return_value = {title: NonCallableMock(last_rev_id=Mock(return_value=rev_id))
+                                       for title, rev_id in pages.items()}
+
+        rev_ids = CacheableSpiCase.get_rev_ids(wiki, ['Fred', 'Joe', 'Nobody'])
+
+        self.assertEqual(rev_ids, {'Fred': 200, 'Joe': 300})
+        wiki.get_pages.assert_called_once()
+        self.assertCountEqual(wiki.get_pages.call_args.args[0], pages)
+
+
+class GetArchivedCaseNamesTest(TestCase):
+    def test_get_archived_case_names(self):
+        wiki = NonCallableMock(Wiki)
+        wiki.page_titles.return_value = ['Wikipedia:Sockpuppet investigations/Fred',
+                                         'Wikipedia:Sockpuppet investigations/Fred/Archive',
+                                         'Wikipedia:Sockpuppet investigations/Joe/Archive',
+                                         'Wikipedia:Sockpuppet investigations/SPI/Clerks',
+                                         'Wikipedia:Sockpuppet investigations/1.2.3.0/24/Archive']
+
+        names = get_archived_case_names(wiki)
+
+        wiki.page_titles.assert_called_once_with('Sockpuppet investigations/', namespace=4)
+        self.assertEqual(names, ['Fred', 'Joe'])
+
+
 class GetCurrentCaseNamesTest(TestCase):
     # pylint: disable=invalid-name
 
@@ -0,0 +1,102 @@
+from dataclasses import replace
+from datetime import datetime, timezone
+from unittest import TestCase
+
+from spi.contrib_store import ContribStore
+from spi.timecard import CELLS, HOURS, similarity_matrix, Timecard
+from wiki_interface.data import WikiContrib
+
+
+def contrib(*args):
+    return WikiContrib(1, datetime(*args, tzinfo=timezone.utc), 'Fred', 0, 'Foo', '')
+
+
+# 2020-01-05 was a Sunday, 2020-01-11 a Saturday.
+CONTRIBS = [contrib(2020, 1, 11, 23, 30),
+            contrib(2020, 1, 5, 2, 45),
+            contrib(2020, 1, 5, 2, 15)]
+
+
+def timecard(cells):
+    """Build a Timecard from a {(day, hour): count} dict."""
+    return Timecard(cells.get(divmod(cell, HOURS), 0) for cell in range(CELLS))
+
+
+class TimecardTest(TestCase):
+    def test_empty(self):
+        card = Timecard()
+
+        self.assertEqual(card.total(), 0)
+        self.assertEqual(card.to_points(), [])
+
+
+    def test_wrong_size_raises_value_error(self):
+        with self.assertRaises(ValueError):
+            Timecard([1, 2, 3])
+
+
+    def test_from_contribs(self):
+        card = Timecard.from_contribs(CONTRIBS)
+
+        self.assertEqual(card, timecard({(0, 2): 2, (6, 23): 1}))
+        self.assertEqual(card.count(0, 2), 2)
+        self.assertEqual(card.rows()[6][23], 1)
+
+
+    def test_from_contrib_store_matches_from_contribs(self):
+        self.assertEqual(Timecard.from_contribs(ContribStore(CONTRIBS)), Timecard.from_contribs(CONTRIBS))
+
+
+    def test_from_naive_contribs_assumes_utc(self):
+        naive = [replace(c, timestamp=c.timestamp.replace(tzinfo=None)) for c in CONTRIBS]
+
+        self.assertEqual(Timecard.from_contribs(naive), Timecard.from_contribs(CONTRIBS))
+        self.assertEqual(Timecard.from_contribs(ContribStore(naive)), Timecard.from_contribs(CONTRIBS))
+
+
+    def test_utc_offset_wraps_around_the_week(self):
+        card = Timecard.from_contribs(CONTRIBS, utc_offset=1)
+
+        self.assertEqual(card, timecard({(0, 3): 2, (0, 0): 1}))
+        self.assertEqual(card, Timecard.from_contribs(CONTRIBS).shifted(1))
+
+
+    def test_negative_shift(self):
+        card = Timecard.from_contribs(CONTRIBS).shifted(-3)
+
+        self.assertEqual(card, timecard({(6, 23): 2, (6, 20): 1}))
+
+
+    def test_to_points(self):
+        points = Timecard.from_contribs(CONTRIBS).to_points()
+
+        self.assertEqual(points, [{'x': 2, 'y': 1, 'r': 20}, {'x': 23, 'y': 7, 'r': 10}])
+
+
+class SimilarityTest(TestCase):
+    def test_identical_distributions_are_similar(self):
+        card = timecard({(1, 10): 3, (2, 11): 1})
+        busier = timecard({(1, 10): 30, (2, 11): 10})
+
+        self.assertAlmostEqual(card.similarity(busier), 1.0)
+
+
+    def test_disjoint_timecards_are_not_similar(self):
+        self.assertEqual(timecard({(1, 10): 3}).similarity(timecard({(1, 11): 3})), 0.0)
+
+
+    def test_empty_timecard_is_not_similar(self):
+        self.assertEqual(timecard({(1, 10): 3}).similarity(Timecard()), 0.0)
+
+
+    def test_similarity_matrix(self):
+        cards = [timecard({(1, 10): 1}), timecard({(1, 10): 1, (1, 11): 1}), Timecard()]
+
+        matrix = similarity_matrix(cards)
+
+        self.assertEqual(len(matrix), 3)
+        for i, row in enumerate(matrix):
+            for j, score in enumerate(row):
+                self.assertAlmostEqual(score, cards[i].similarity(cards[j]))
+        self.assertAlmostEqual(matrix[0][1], 2 ** -0.5)
+        self.assertEqual(matrix[2][2], 0.0)
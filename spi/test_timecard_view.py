@@ -1,15 +1,78 @@
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
 from unittest.mock import patch
 
 from spi.test_spi_view import SpiViewTestCase
+from spi.timecard_view import TIMECARD_CACHE_TIMEOUT
+from wiki_interface.data import WikiContrib
 
 # pylint: disable=invalid-name
 # pylint: disable=duplicate-code
 
 
+class FakeXtoolsHandler(BaseHTTPRequestHandler):
+    """Serves the timecards in the server's timecards dict, keyed by
+    user name.  A timecard of None gets a 500 response; a user in the
+    server's slow set gets a response after a long delay.
+
+    """
+    def do_GET(self):
+        user_name = self.path.rsplit('/', 1)[-1]
+        self.server.requests.append(user_name)
+        if user_name in self.server.slow:
+            time.sleep(0.5)
+        timecard = self.server.timecards.get(user_name)
+        if timecard is None:
+            self.send_response(500)
+            self.end_headers()
+            return
+        body = json.dumps({'timecard': timecard}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+class FakeXtoolsServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # The client gives up on slow responses, so writing them fails.
+        pass
+
+
 class TimecardViewTest(SpiViewTestCase):
     #pylint: disable=arguments-differ
     def setUp(self):
         super().setUp('spi.timecard_view')
+        self.server = FakeXtoolsServer(('127.0.0.1', 0), FakeXtoolsHandler)
+        self.server.timecards = {}
+        self.server.slow = set()
+        self.server.requests = []
+        threading.Thread(target=self.server.serve_forever, args=(0.01,), daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        host, port = self.server.server_address
+        base_patcher = patch('spi.timecard_view.TIMECARD_BASE',
+                             f'http://{host}:{port}/api/user/timecard/en.wikipedia.org')
+        base_patcher.start()
+        self.addCleanup(base_patcher.stop)
+        timeout_patcher = patch('spi.timecard_view.TIMECARD_TIMEOUT', 0.1)
+        timeout_patcher.start()
+        self.addCleanup(timeout_patcher.stop)
+        cache_patcher = patch('spi.timecard_view.cache', autospec=True)
+        self.mock_cache = cache_patcher.start()
+        self.mock_cache.get.return_value = None
+        self.addCleanup(cache_patcher.stop)
 
 
     @patch('spi.ip_analysis_view.CacheableSpiCase', autospec=True)
@@ -21,3 +84,73 @@ class TimecardViewTest(SpiViewTestCase):
         response = self.client.get('/spi/timecard/Fred')
 
         self.assertEqual(response.status_code, 200)
+
+
+    def test_timecards_come_from_xtools_and_are_cached(self):
+        self.server.timecards = {
+            'Fred': [{'day_of_week': 1, 'hour': 2, 'value': 5, 'scale': 10},
+                     {'day_of_week': 1, 'hour': 24, 'value': 5}],
+            'Wilma': [{'day_of_week': 7, 'hour': 23, 'value': 1, 'scale': 20}],
+        }
+
+        response = self.client.get('/spi/timecard/Fred', {'users': ['Fred', 'Wilma']})
+
+        self.assertEqual(response.context['data'], {'Fred': [{'x': 2, 'y': 1, 'r': 10}],
+                                                    'Wilma': [{'x': 23, 'y': 7, 'r': 20}]})
+        self.assertCountEqual(self.server.requests, ['Fred', 'Wilma'])
+        self.mock_cache.set.assert_any_call('spi.timecard.Fred', [{'x': 2, 'y': 1, 'r': 10}],
+                                            TIMECARD_CACHE_TIMEOUT)
+        self.mock_wiki.user_contributions.assert_not_called()
+
+
+    def test_cached_timecards_are_not_fetched(self):
+        self.mock_cache.get.return_value = [{'x': 2, 'y': 1, 'r': 10}]
+
+        response = self.client.get('/spi/timecard/Fred', {'users': ['Fred']})
+
+        self.assertEqual(response.context['data'], {'Fred': [{'x': 2, 'y': 1, 'r': 10}]})
+        self.assertEqual(self.server.requests, [])
+
+
+    def test_xtools_errors_fall_back_to_local_timecard(self):
+        self.server.slow = {'Wilma'}
+        self.server.timecards = {'Wilma': []}
+        # 2020-01-05 was a Sunday.
+        self.mock_wiki.user_contributions.return_value = [
+            WikiContrib(3, datetime(2020, 1, 11, 23, 30, tzinfo=timezone.utc), 'Fred', 0, 'Foo', ''),
+            WikiContrib(2, datetime(2020, 1, 5, 2, 45, tzinfo=timezone.utc), 'Fred', 0, 'Foo', ''),
+            WikiContrib(1, datetime(2020, 1, 5, 2, 15, tzinfo=timezone.utc), 'Fred', 0, 'Foo', ''),
+        ]
+
+        with self.assertLogs('spi.views.timecard_view', level='WARNING'):
+            response = self.client.get('/spi/timecard/Fred', {'users': ['Fred', 'Wilma']})
+
+        expected = [{'x': 2, 'y': 1, 'r': 20}, {'x': 23, 'y': 7, 'r': 10}]
+        self.assertEqual(response.context['data'], {'Fred': expected, 'Wilma': expected})
+        self.mock_cache.set.assert_not_called()
+
+
+    def test_local_timecards_and_similarities(self):
+        self.mock_wiki.user_contributions.return_value = [
+            WikiContrib(1, datetime(2020, 1, 5, 2, 15, tzinfo=timezone.utc), 'Fred', 0, 'Foo', ''),
+        ]
+
+        response = self.client.get('/spi/timecard/Fred', {'users': ['Fred', 'Wilma'], 'local': '1', 'tz': '-3'})
+
+        self.assertEqual(response.context['data'], {'Fred': [{'x': 23, 'y': 7, 'r': 20}],
+                                                    'Wilma': [{'x': 23, 'y': 7, 'r': 20}]})
+        self.assertEqual(response.context['similarities'], [('Fred', [1.0, 1.0]), ('Wilma', [1.0, 1.0])])
+        self.assertEqual(self.server.requests, [])
+
+
+    def test_invalid_tz_returns_400(self):
+        response = self.client.get('/spi/timecard/Fred', {'users': ['Fred'], 'local': '1', 'tz': 'junk'})
+
+        self.assertEqual(response.status_code, 400)
+
+
+    def test_invalid_local_returns_400(self):
+        response = self.client.get('/spi/timecard/Fred', {'users': ['Fred'], 'local': 'yes'})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.server.requests, [])
@@ -1,9 +1,11 @@
-from datetime import datetime
+from datetime import datetime, timezone
+from unittest import TestCase
 from unittest.mock import call, patch
 
 from lxml import etree
 
-from spi.timeline_view import TimelineEvent
+from spi.date_range import DateRange
+from spi.timeline_view import TimelineEvent, TimelineCursor
 from spi.test_spi_view import SpiViewTestCase
 from spi.user_utils import CacheableUserContribs
 from wiki_interface.block_utils import BlockEvent
@@ -115,25 +117,28 @@ class TimelineViewTest(SpiViewTestCase):
 
     @patch('spi.timeline_view.CacheableUserContribs', spec=CacheableUserContribs)
     def test_context_includes_tag_table(self, mock_CacheableUserContribs):
-        mock_CacheableUserContribs.get.side_effect = [
-            CacheableUserContribs([
+        # Users are fetched concurrently, so the data is keyed by name
+        # rather than relying on call order.
+        contribs = {
+            'Fred': CacheableUserContribs([
                 WikiContrib(1001, datetime(2020, 1, 1), 'Fred', 0, 'Title', 'comment', tags=[]),
                 WikiContrib(1002, datetime(2020, 1, 2), 'Fred', 0, 'Title', 'comment', tags=['tag1', 'tag2', 'tag3']),
                 WikiContrib(1003, datetime(2020, 1, 3), 'Fred', 0, 'Title', 'comment', tags=['tag1', 'tag2', 'tag4']),
             ]),
-            CacheableUserContribs([
+            'Wilma': CacheableUserContribs([
                 WikiContrib(2001, datetime(2020, 1, 4), 'Wilma', 0, 'Title', 'comment', tags=['tag1', 'tag3']),
                 WikiContrib(2002, datetime(2020, 1, 5), 'Wilma', 0, 'Title', 'comment', tags=['tag1', 'tag2']),
             ]),
-        ]
+        }
+        mock_CacheableUserContribs.get.side_effect = lambda wiki, user_name, date_range: contribs[user_name]
         self.force_login()
 
         response = self.client.get('/spi/timeline/Foo', {'users': ['Fred', 'Wilma']})
 
         mock_CacheableUserContribs.get.assert_has_calls([
-            call(self.mock_wiki, 'Fred'),
-            call(self.mock_wiki, 'Wilma')
-        ])
+            call(self.mock_wiki, 'Fred', DateRange()),
+            call(self.mock_wiki, 'Wilma', DateRange())
+        ], any_order=True)
         self.assertEqual(response.context['tag_table'],
                          [('Fred', [('tag1', 2), ('tag2', 2), ('tag3', 1), ('tag4', 1)]),
                           ('Wilma', [('tag1', 2), ('tag2', 1), ('tag3', 1), ('tag4', 0)])]
@@ -171,3 +176,247 @@ class TimelineViewTest(SpiViewTestCase):
         self.assertEqual(response.context['events'], [
             TimelineEvent(datetime(2020, 1, 1), 1, 'Fred', 'create', 'create', 'Title', '<comment hidden>', ''),
         ])
+
+
+    @patch('spi.timeline_view.CacheableUserContribs', spec=CacheableUserContribs)
+    def test_events_from_multiple_users_are_merged_in_order(self, mock_CacheableUserContribs):
+        contribs = {
+            'Fred': CacheableUserContribs([
+                WikiContrib(1003, datetime(2020, 1, 5), 'Fred', 0, 'Title', 'comment'),
+                WikiContrib(1001, datetime(2020, 1, 1), 'Fred', 0, 'Title', 'comment'),
+            ]),
+            'Wilma': CacheableUserContribs([
+                WikiContrib(2002, datetime(2020, 1, 4), 'Wilma', 0, 'Title', 'comment'),
+                WikiContrib(2001, datetime(2020, 1, 2), 'Wilma', 0, 'Title', 'comment'),
+            ]),
+        }
+        mock_CacheableUserContribs.get.side_effect = lambda wiki, user_name, date_range: contribs[user_name]
+        self.mock_wiki.user_blocks.side_effect = lambda user_name, **kwargs: (
+            [BlockEvent(user_name, datetime(2020, 1, 3), 3001)] if user_name == 'Wilma' else [])
+        self.force_login()
+
+        response = self.client.get('/spi/timeline/Foo', {'users': ['Fred', 'Wilma']})
+
+        # pylint: disable=line-too-long
+        self.assertEqual(response.context['events'], [
+            TimelineEvent(datetime(2020, 1, 5), 1003, 'Fred', 'edit', '', 'Title', 'comment', ''),
+            TimelineEvent(datetime(2020, 1, 4), 2002, 'Wilma', 'edit', '', 'Title', 'comment', ''),
+            TimelineEvent(datetime(2020, 1, 3), 3001, 'Wilma', 'block', '', 'indef', '', ''),
+            TimelineEvent(datetime(2020, 1, 2), 2001, 'Wilma', 'edit', '', 'Title', 'comment', ''),
+            TimelineEvent(datetime(2020, 1, 1), 1001, 'Fred', 'edit', '', 'Title', 'comment', ''),
+        ])
+
+
+    def test_streaming_response_renders_events(self):
+        self.mock_wiki.user_contributions.return_value = [
+            WikiContrib(1002, datetime(2020, 1, 2), 'Fred', 0, 'Title2', 'comment', tags=['tag1']),
+            WikiContrib(1001, datetime(2020, 1, 1), 'Fred', 0, 'Title1', 'comment', tags=[]),
+        ]
+        self.mock_wiki.user_blocks.return_value = [
+            BlockEvent('Fred', datetime(2020, 2, 1), 1003)]
+        self.force_login()
+
+        response = self.client.get('/spi/timeline/Foo', {'users': ['Fred'], 'stream': '1'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        tree = etree.HTML(b''.join(response.streaming_content))
+        rows = tree.cssselect('#events tr')
+        self.assertEqual([r.cssselect('td')[1].xpath('string(div[1])') for r in rows],
+                         ['block', 'edit', 'edit'])
+        self.assertEqual([r.cssselect('td')[0].xpath('string(.)').strip() for r in rows],
+                         ['2020-02-01 00:00:00', '2020-01-02 00:00:00', '2020-01-01 00:00:00'])
+
+
+    @patch('spi.icache.django_cache')
+    def test_streaming_response_honors_use_cache(self, mock_django_cache):
+        self.mock_wiki.user_contributions.return_value = [
+            WikiContrib(1001, datetime(2020, 1, 1), 'Fred', 0, 'Title1', 'comment', tags=[]),
+        ]
+        self.force_login()
+
+        response = self.client.get('/spi/timeline/Foo', {'users': ['Fred'], 'stream': '1', 'use-cache': '0'})
+        content = b''.join(response.streaming_content)
+
+        self.assertIn(b'Title1', content)
+        self.mock_wiki.user_contributions.assert_called()
+        self.assertEqual(mock_django_cache.method_calls, [])
+
+
+    def test_streaming_response_renders_tag_table_after_events(self):
+        self.mock_wiki.user_contributions.return_value = [
+            WikiContrib(1002, datetime(2020, 1, 2), 'Fred', 0, 'Title', 'comment', tags=['tag1', 'tag2']),
+            WikiContrib(1001, datetime(2020, 1, 1), 'Fred', 0, 'Title', 'comment', tags=['tag1']),
+        ]
+        self.force_login()
+
+        response = self.client.get('/spi/timeline/Foo', {'users': ['Fred'], 'stream': '1'})
+
+        content = b''.join(response.streaming_content)
+        self.assertGreater(content.index(b'id="tag-card"'), content.index(b'id="events"'))
+        tree = etree.HTML(content)
+        cells = tree.cssselect('#tag-card tbody tr td')
+        self.assertEqual([c.text.strip() for c in cells], ['Fred', '2', '1'])
+
+
+
+    def test_date_range_limits_events(self):
+        # With nothing cached, only the range is fetched.
+        self.mock_wiki.user_contributions.return_value = [
+            WikiContrib(1003, datetime(2020, 1, 3), 'Fred', 0, 'Title', 'comment'),
+        ]
+        self.force_login()
+
+        response = self.client.get('/spi/timeline/Foo', {'users': ['Fred'], 'start': '2020-01-02'})
+
+        start = datetime(2020, 1, 2, tzinfo=timezone.utc)
+        self.assertEqual(response.context['date_range'], DateRange(start, None))
+        self.assertEqual(response.context['events'], [
+            TimelineEvent(datetime(2020, 1, 3), 1003, 'Fred', 'edit', '', 'Title', 'comment', ''),
+        ])
+        self.mock_wiki.user_contributions.assert_called_once_with('Fred', start=None, end=start)
+        self.mock_wiki.deleted_user_contributions.assert_called_once_with('Fred', end=None)
+        self.mock_wiki.user_blocks.assert_called_once_with('Fred', end=None)
+        self.mock_wiki.user_log_events.assert_called_once_with('Fred', end=None)
+
+
+    def test_invalid_date_range_returns_400(self):
+        self.force_login()
+
+        response = self.client.get('/spi/timeline/Foo', {'users': ['Fred'], 'start': 'junk'})
+
+        self.assertEqual(response.status_code, 400)
+
+
+    def test_invalid_stream_returns_400(self):
+        self.force_login()
+
+        response = self.client.get('/spi/timeline/Foo', {'users': ['Fred'], 'stream': 'yes'})
+
+        self.assertEqual(response.status_code, 400)
+
+
+class TimelineCursorTest(TestCase):
+    def test_encode_decode_round_trip(self):
+        cursor = TimelineCursor(datetime(2020, 1, 2, 3, 4, 5, tzinfo=timezone.utc), 1234, 2)
+
+        self.assertEqual(TimelineCursor.decode(cursor.encode()), cursor)
+
+
+    def test_decode_garbage_raises_value_error(self):
+        with self.assertRaises(ValueError):
+            TimelineCursor.decode('garbage')
+
+
+    def test_decode_naive_timestamp_raises_value_error(self):
+        cursor = TimelineCursor(datetime(2020, 1, 2, 3, 4, 5), 1234, 2)
+
+        with self.assertRaises(ValueError):
+            TimelineCursor.decode(cursor.encode())
+
+
+    def test_skip_seen_skips_newer_and_counted_events(self):
+        events = [
+            TimelineEvent(datetime(2020, 1, 3, tzinfo=timezone.utc), 3, 'Fred', 'edit', '', 'Title', ''),
+            TimelineEvent(datetime(2020, 1, 2, tzinfo=timezone.utc), 2, 'Fred', 'edit', '', 'Title', ''),
+            TimelineEvent(datetime(2020, 1, 2, tzinfo=timezone.utc), 2, 'Fred', 'block', '', 'Title', ''),
+            TimelineEvent(datetime(2020, 1, 1, tzinfo=timezone.utc), 1, 'Fred', 'edit', '', 'Title', ''),
+        ]
+        cursor = TimelineCursor(datetime(2020, 1, 2, tzinfo=timezone.utc), 2, 1)
+
+        self.assertEqual(list(cursor.skip_seen(events)), events[2:])
+
+
+class TimelineApiViewTest(SpiViewTestCase):
+    #pylint: disable=arguments-differ
+    def setUp(self):
+        super().setUp('spi.timeline_view')
+        self.force_login()
+
+
+    def get_all_pages(self, params):
+        events = []
+        cursor = None
+        for _ in range(100):
+            response = self.client.get('/spi/timeline-api/Foo', {**params, **({'cursor': cursor} if cursor else {})})
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            events.extend(data['events'])
+            cursor = data['cursor']
+            if cursor is None:
+                break
+        else:
+            self.fail('too many pages')
+        return events
+
+
+    def test_single_page(self):
+        self.mock_wiki.user_contributions.return_value = [
+            WikiContrib(1002, datetime(2020, 1, 2, tzinfo=timezone.utc), 'Fred', 0, 'Title', 'comment', tags=['t1', 't2']),
+        ]
+
+        response = self.client.get('/spi/timeline-api/Foo', {'users': ['Fred']})
+
+        self.assertEqual(response.json(), {
+            'events': [{'timestamp': '2020-01-02T00:00:00Z',
+                        'id': 1002,
+                        'user_name': 'Fred',
+                        'description': 'edit',
+                        'details': '',
+                        'title': 'Title',
+                        'comment': 'comment',
+                        'extra': 't1, t2'}],
+            'cursor': None,
+        })
+
+
+    @patch('spi.timeline_view.CacheableUserContribs', spec=CacheableUserContribs)
+    def test_paging_returns_all_events_in_order(self, mock_CacheableUserContribs):
+        contribs = {
+            'Fred': CacheableUserContribs([
+                WikiContrib(1005, datetime(2020, 1, 5, tzinfo=timezone.utc), 'Fred', 0, 'Title', 'comment'),
+                WikiContrib(1003, datetime(2020, 1, 3, tzinfo=timezone.utc), 'Fred', 0, 'Title', 'comment'),
+                WikiContrib(1001, datetime(2020, 1, 1, tzinfo=timezone.utc), 'Fred', 0, 'Title', 'comment'),
+            ]),
+            'Wilma': CacheableUserContribs([
+                WikiContrib(2004, datetime(2020, 1, 4, tzinfo=timezone.utc), 'Wilma', 0, 'Title', 'comment'),
+                WikiContrib(2002, datetime(2020, 1, 2, tzinfo=timezone.utc), 'Wilma', 0, 'Title', 'comment'),
+            ]),
+        }
+        mock_CacheableUserContribs.get.side_effect = lambda wiki, user_name, date_range: contribs[user_name]
+
+        events = self.get_all_pages({'users': ['Fred', 'Wilma'], 'limit': 2})
+
+        self.assertEqual([e['id'] for e in events], [1005, 2004, 1003, 2002, 1001])
+        # After the first page, nothing newer than the cursor is asked for.
+        ends = [c.args[2].end for c in mock_CacheableUserContribs.get.call_args_list if c.args[1] == 'Fred']
+        self.assertEqual(ends, [None,
+                                datetime(2020, 1, 4, tzinfo=timezone.utc),
+                                datetime(2020, 1, 2, tzinfo=timezone.utc)])
+
+
+    def test_paging_handles_events_with_same_timestamp_and_id(self):
+        self.mock_wiki.user_contributions.return_value = [
+            WikiContrib(1, datetime(2020, 1, 2, tzinfo=timezone.utc), 'Fred', 0, 'Title', 'comment'),
+        ]
+        self.mock_wiki.user_log_events.return_value = [
+            LogEvent(1, datetime(2020, 1, 2, tzinfo=timezone.utc), 'Fred', 'Title', 'create', 'create', 'c1'),
+            LogEvent(1, datetime(2020, 1, 2, tzinfo=timezone.utc), 'Fred', 'Title', 'create', 'create', 'c2'),
+        ]
+
+        events = self.get_all_pages({'users': ['Fred'], 'limit': 1})
+
+        self.assertCountEqual([(e['description'], e['comment']) for e in events],
+                              [('edit', 'comment'), ('create', 'c1'), ('create', 'c2')])
+
+
+    def test_invalid_cursor_returns_400(self):
+        response = self.client.get('/spi/timeline-api/Foo', {'users': ['Fred'], 'cursor': 'garbage'})
+
+        self.assertEqual(response.status_code, 400)
+
+
+    def test_invalid_limit_returns_400(self):
+        response = self.client.get('/spi/timeline-api/Foo', {'users': ['Fred'], 'limit': '0'})
+
+        self.assertEqual(response.status_code, 400)
@@ -1,115 +1,365 @@
 from unittest import TestCase
 from unittest.mock import patch, NonCallableMock
-from datetime import datetime
+from datetime import datetime, timezone
 
 from wiki_interface import Wiki, WikiContrib
-from spi.user_utils import CacheableUserContribs
+from wiki_interface.block_utils import BlockEvent, UnblockEvent
+from wiki_interface.data import LogEvent
+from spi.contrib_store import ContribStore
+from spi.date_range import DateRange
+from spi.user_utils import (CacheableDeletedContribs, CacheableLogHistory, CacheableUserBlocks,
+                            CacheableUserContribs, CacheableUserLogEvents, CONTRIBS_TIMEOUT, DELETED_CONTRIBS_TIMEOUT,
+                            EMPTY_CONTRIBS_TIMEOUT, LOG_HISTORY_TIMEOUT)
+
+
+class FakeCache:
+    """Just enough of spi.icache, backed by a dict."""
+    def __init__(self, data=None):
+        self.data = dict(data or {})
+        self.get_many_calls = []
+        self.set_many_calls = []
+        self.timeouts = {}
+
+
+    def get(self, key):
+        return self.data.get(key)
+
+
+    def set(self, key, value, timeout=None):
+        self.data[key] = value
+        self.timeouts[key] = timeout
+
+
+    def get_many(self, keys):
+        self.get_many_calls.append(list(keys))
+        return {k: self.data[k] for k in keys if k in self.data}
+
+
+    def set_many(self, data, timeout=None):
+        self.set_many_calls.append(dict(data))
+        self.data.update(data)
+        self.timeouts.update(dict.fromkeys(data, timeout))
+
+
+def contrib(year, month, day, is_live=True):
+    return WikiContrib(year * 10000 + month * 100 + day, datetime(year, month, day), 'Fred', 0, 'Foo', '', is_live)
+
+
+PREFIX = 'spi.CacheableUserContribs.Fred'
 
 
 class CacheableUserContribsTest(TestCase):
-    @patch('spi.user_utils.cache')
-    def test_construct(self, cache):
+    def setUp(self):
+        patcher = patch('spi.user_utils.cache', FakeCache())
+        self.cache = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.wiki = NonCallableMock(Wiki)
+
+
+    def set_cached(self, manifest, head, segments=None):
+        self.cache.data[f'{PREFIX}.manifest'] = manifest
+        self.cache.data[f'{PREFIX}.head'] = ContribStore(head).to_bytes()
+        for month, contribs in (segments or {}).items():
+            self.cache.data[f'{PREFIX}.{month}'] = ContribStore(contribs).to_bytes()
+
+
+    def cached_store(self, suffix):
+        return ContribStore.from_bytes(self.cache.data[f'{PREFIX}.{suffix}'])
+
+
+    def test_construct(self):
         contribs = CacheableUserContribs()
 
-        cache.get.assert_not_called()
-        cache.set.assert_not_called()
+        self.assertEqual(self.cache.get_many_calls, [])
+        self.assertEqual(self.cache.set_many_calls, [])
         self.assertEqual(contribs.data, [])
 
 
-    @patch('spi.user_utils.cache')
-    def test_get_returns_empty_contribs_list_with_no_contribs_and_empty_cache(self, cache):
-        wiki = NonCallableMock(Wiki)
-        cache.get.return_value = []
-        wiki.user_contributions.return_value = []
+    def test_get_returns_empty_contribs_list_with_no_contribs_and_empty_cache(self):
+        self.wiki.user_contributions.return_value = []
 
-        contribs = CacheableUserContribs.get(wiki, 'Fred')
+        contribs = CacheableUserContribs.get(self.wiki, 'Fred')
 
-        key = 'spi.CacheableUserContribs.Fred'
-        expected_contribs = CacheableUserContribs([])
-        cache.get.assert_called_once_with(key, default=[])
-        cache.set.assert_not_called()
-        wiki.user_contributions.assert_called_once_with('Fred', end=None)
-        self.assertEqual(contribs, expected_contribs)
+        self.assertEqual(self.cache.get_many_calls, [[f'{PREFIX}.manifest', f'{PREFIX}.head']])
+        self.wiki.user_contributions.assert_called_once_with('Fred', end=None)
+        self.assertEqual(contribs, CacheableUserContribs([]))
+        self.assertEqual(self.cache.data[f'{PREFIX}.manifest'], [])
+        self.assertEqual(self.cached_store('head'), [])
+        self.assertEqual(self.cache.timeouts[f'{PREFIX}.head'], EMPTY_CONTRIBS_TIMEOUT)
 
 
-    @patch('spi.user_utils.cache')
-    def test_get_returns_correct_data_with_wiki_data_and_empty_cache(self, cache):
-        wiki = NonCallableMock(Wiki)
-        cache.get.return_value = []
-        wiki.user_contributions.return_value = [
-            WikiContrib(1000, datetime(2020, 1, 1), 'Fred', 0, 'Foo', ''),
-        ]
+    def test_get_with_cached_empty_history_does_not_call_wiki(self):
+        self.set_cached([], [])
 
-        contribs = CacheableUserContribs.get(wiki, 'Fred')
+        contribs = CacheableUserContribs.get(self.wiki, 'Fred')
 
-        expected_contribs = CacheableUserContribs([WikiContrib(1000, datetime(2020, 1, 1), 'Fred', 0, 'Foo', '')])
-        key = 'spi.CacheableUserContribs.Fred'
-        cache.get.assert_called_once_with(key, default=[])
-        cache.set.assert_called_once_with(key, expected_contribs.data)
-        wiki.user_contributions.assert_called_once_with('Fred', end=None)
-        self.assertEqual(contribs, expected_contribs)
+        self.wiki.user_contributions.assert_not_called()
+        self.assertEqual(list(contribs.data), [])
 
 
-    @patch('spi.user_utils.cache')
-    def test_get_returns_correct_data_with_no_wiki_data_and_valid_cache(self, cache):
-        wiki = NonCallableMock(Wiki)
-        cache.get.return_value = [WikiContrib(2020_01_01, datetime(2020, 1, 1), 'Fred', 0, 'Foo', '')]
-        wiki.user_contributions.return_value = []
+    def test_get_returns_correct_data_with_wiki_data_and_empty_cache(self):
+        self.wiki.user_contributions.return_value = [contrib(2020, 1, 1)]
 
-        contribs = CacheableUserContribs.get(wiki, 'Fred')
+        contribs = CacheableUserContribs.get(self.wiki, 'Fred')
 
-        expected_contribs = CacheableUserContribs([WikiContrib(2020_01_01, datetime(2020, 1, 1), 'Fred', 0, 'Foo', '')])
-        key = 'spi.CacheableUserContribs.Fred'
-        cache.get.assert_called_once_with(key, default=[])
-        cache.set.assert_not_called()
-        wiki.user_contributions.assert_called_once_with('Fred', end='2020-01-01T00:00:00')
-        self.assertEqual(contribs, expected_contribs)
+        self.wiki.user_contributions.assert_called_once_with('Fred', end=None)
+        self.assertEqual(list(contribs.data), [contrib(2020, 1, 1)])
+        self.assertEqual(self.cache.data[f'{PREFIX}.manifest'], [])
+        self.assertEqual(self.cached_store('head'), [contrib(2020, 1, 1)])
 
 
-    @patch('spi.user_utils.cache')
-    def test_get_checks_for_contribs_newer_than_cached_data(self, cache):
-        wiki = NonCallableMock(Wiki)
-        cache.get.return_value = [WikiContrib(2020_01_01, datetime(2020, 1, 1), 'Fred', 0, 'Foo', '')]
-        wiki.user_contributions.return_value = [WikiContrib(2020_01_02, datetime(2020, 1, 2), 'Fred', 0, 'Foo', '')]
+    def test_get_returns_correct_data_with_no_wiki_data_and_valid_cache(self):
+        self.set_cached([], [contrib(2020, 1, 1)])
+        self.wiki.user_contributions.return_value = []
+
+        contribs = CacheableUserContribs.get(self.wiki, 'Fred')
+
+        self.assertEqual(self.cache.set_many_calls, [])
+        self.wiki.user_contributions.assert_called_once_with('Fred', end='2020-01-01T00:00:00')
+        self.assertEqual(list(contribs.data), [contrib(2020, 1, 1)])
+
+
+    def test_get_eliminates_last_new_data_item_that_duplicates_first_cached_item(self):
+        self.set_cached([], [contrib(2020, 1, 3), contrib(2020, 1, 2), contrib(2020, 1, 1)])
+        self.wiki.user_contributions.return_value = [contrib(2020, 1, 5), contrib(2020, 1, 4), contrib(2020, 1, 3)]
+
+        contribs = CacheableUserContribs.get(self.wiki, 'Fred')
+
+        expected = [contrib(2020, 1, d) for d in (5, 4, 3, 2, 1)]
+        self.wiki.user_contributions.assert_called_once_with('Fred', end='2020-01-03T00:00:00')
+        self.assertEqual(list(contribs.data), expected)
+        self.assertEqual(self.cached_store('head'), expected)
+
+
+    def test_get_seals_old_months_into_segments(self):
+        self.wiki.user_contributions.return_value = [contrib(2020, 3, 1),
+                                                     contrib(2020, 2, 2),
+                                                     contrib(2020, 2, 1),
+                                                     contrib(2019, 12, 1)]
+
+        contribs = CacheableUserContribs.get(self.wiki, 'Fred')
+
+        self.assertEqual(list(contribs.data), self.wiki.user_contributions.return_value)
+        self.assertEqual(self.cache.data[f'{PREFIX}.manifest'], ['2020-02', '2019-12'])
+        self.assertEqual(self.cached_store('head'), [contrib(2020, 3, 1)])
+        self.assertEqual(self.cached_store('2020-02'), [contrib(2020, 2, 2), contrib(2020, 2, 1)])
+        self.assertEqual(self.cached_store('2019-12'), [contrib(2019, 12, 1)])
+        self.assertEqual(set(self.cache.timeouts.values()), {CONTRIBS_TIMEOUT})
+
+
+    def test_get_only_rewrites_head_and_manifest_on_update(self):
+        self.set_cached(['2020-01'], [contrib(2020, 2, 1)], {'2020-01': [contrib(2020, 1, 1)]})
+        self.wiki.user_contributions.return_value = [contrib(2020, 2, 2), contrib(2020, 2, 1)]
+
+        contribs = CacheableUserContribs.get(self.wiki, 'Fred')
+
+        self.assertEqual(list(contribs.data), [contrib(2020, 2, 2), contrib(2020, 2, 1), contrib(2020, 1, 1)])
+        self.assertEqual(len(self.cache.set_many_calls), 1)
+        self.assertEqual(set(self.cache.set_many_calls[0]), {f'{PREFIX}.head', f'{PREFIX}.manifest'})
+
+
+    def test_get_with_start_only_fetches_needed_segments(self):
+        self.set_cached(['2020-02', '2020-01'],
+                        [contrib(2020, 3, 1)],
+                        {'2020-02': [contrib(2020, 2, 20), contrib(2020, 2, 1)],
+                         '2020-01': [contrib(2020, 1, 1)]})
+        self.wiki.user_contributions.return_value = []
+        date_range = DateRange(start=datetime(2020, 2, 15, tzinfo=timezone.utc))
+
+        contribs = CacheableUserContribs.get(self.wiki, 'Fred', date_range)
+
+        self.assertEqual(self.cache.get_many_calls[1], [f'{PREFIX}.2020-02'])
+        self.assertEqual(list(contribs.data), [contrib(2020, 3, 1), contrib(2020, 2, 20)])
+
+
+    def test_get_with_start_and_empty_cache_only_fetches_range(self):
+        self.wiki.user_contributions.return_value = [contrib(2020, 3, 1), contrib(2020, 2, 20)]
+        date_range = DateRange(start=datetime(2020, 2, 15, tzinfo=timezone.utc),
+                               end=datetime(2020, 3, 2, tzinfo=timezone.utc))
+
+        contribs = CacheableUserContribs.get(self.wiki, 'Fred', date_range)
+
+        self.wiki.user_contributions.assert_called_once_with('Fred', start=date_range.end, end=date_range.start)
+        self.assertEqual(list(contribs.data), [contrib(2020, 3, 1), contrib(2020, 2, 20)])
+        self.assertEqual(self.cache.set_many_calls, [])
+
+
+    def test_get_with_end_only_fetches_needed_segments(self):
+        self.set_cached(['2020-02', '2020-01'],
+                        [contrib(2020, 3, 1)],
+                        {'2020-02': [contrib(2020, 2, 20), contrib(2020, 2, 1)],
+                         '2020-01': [contrib(2020, 1, 1)]})
+        date_range = DateRange(end=datetime(2020, 1, 15, tzinfo=timezone.utc))
+
+        contribs = CacheableUserContribs.get(self.wiki, 'Fred', date_range)
+
+        self.assertEqual(self.cache.get_many_calls[1], [f'{PREFIX}.2020-01'])
+        self.assertEqual(list(contribs.data), [contrib(2020, 1, 1)])
+
+
+    def test_get_with_end_covered_by_cache_does_not_call_wiki(self):
+        self.set_cached(['2020-01'], [contrib(2020, 2, 1)], {'2020-01': [contrib(2020, 1, 2), contrib(2020, 1, 1)]})
+        date_range = DateRange(end=datetime(2020, 1, 1, 12, tzinfo=timezone.utc))
 
-        contribs = CacheableUserContribs.get(wiki, 'Fred')
+        contribs = CacheableUserContribs.get(self.wiki, 'Fred', date_range)
 
-        expected_contribs = CacheableUserContribs([
-            WikiContrib(2020_01_02, datetime(2020, 1, 2), 'Fred', 0, 'Foo', ''),
-            WikiContrib(2020_01_01, datetime(2020, 1, 1), 'Fred', 0, 'Foo', ''),
-        ])
-        key = 'spi.CacheableUserContribs.Fred'
-        cache.get.assert_called_once_with(key, default=[])
-        cache.set.assert_called_once_with(key, expected_contribs.data)
-        wiki.user_contributions.assert_called_once_with('Fred', end='2020-01-01T00:00:00')
-        self.assertEqual(contribs, expected_contribs)
+        self.wiki.user_contributions.assert_not_called()
+        self.assertEqual(list(contribs.data), [contrib(2020, 1, 1)])
 
 
-    @patch('spi.user_utils.cache')
-    def test_get_eliminates_last_new_data_item_that_duplicates_first_cached_item(self, cache):
+    def test_get_rebuilds_if_segment_missing(self):
+        self.set_cached(['2020-01'], [contrib(2020, 2, 1)])
+        self.wiki.user_contributions.return_value = [contrib(2020, 2, 1), contrib(2020, 1, 1)]
+
+        with self.assertLogs('spi.views', level='WARNING'):
+            contribs = CacheableUserContribs.get(self.wiki, 'Fred')
+
+        self.wiki.user_contributions.assert_called_once_with('Fred', end=None)
+        self.assertEqual(list(contribs.data), [contrib(2020, 2, 1), contrib(2020, 1, 1)])
+        self.assertEqual(self.cached_store('2020-01'), [contrib(2020, 1, 1)])
+
+
+def deleted(year, month, day):
+    return contrib(year, month, day, is_live=False)
+
+
+class CacheableDeletedContribsTest(TestCase):
+    def setUp(self):
+        patcher = patch('spi.user_utils.cache', FakeCache())
+        self.cache = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.wiki = NonCallableMock(Wiki)
+        self.wiki.can_view_deleted.return_value = True
+
+
+    def test_get_with_empty_cache_fetches_everything(self):
+        self.wiki.deleted_user_contributions.return_value = [deleted(2020, 1, 2), deleted(2020, 1, 1)]
+
+        contribs = CacheableDeletedContribs.get(self.wiki, 'Fred')
+
+        key = 'spi.CacheableDeletedContribs.admin.Fred'
+        self.wiki.deleted_user_contributions.assert_called_once_with('Fred', end=None)
+        self.assertEqual(list(contribs.data), [deleted(2020, 1, 2), deleted(2020, 1, 1)])
+        self.assertEqual(ContribStore.from_bytes(self.cache.data[key]), contribs.data)
+        self.assertEqual(self.cache.timeouts[key], DELETED_CONTRIBS_TIMEOUT)
+
+
+    def test_get_only_fetches_newer_revisions(self):
+        self.cache.data['spi.CacheableDeletedContribs.admin.Fred'] = ContribStore([deleted(2020, 1, 2)]).to_bytes()
+        self.wiki.deleted_user_contributions.return_value = [deleted(2020, 1, 3), deleted(2020, 1, 2)]
+
+        contribs = CacheableDeletedContribs.get(self.wiki, 'Fred')
+
+        self.wiki.deleted_user_contributions.assert_called_once_with('Fred', end=datetime(2020, 1, 2))
+        self.assertEqual(list(contribs.data), [deleted(2020, 1, 3), deleted(2020, 1, 2)])
+
+
+    def test_get_with_cached_empty_history_does_not_call_wiki(self):
+        self.cache.data['spi.CacheableDeletedContribs.user.Fred'] = ContribStore().to_bytes()
+        self.wiki.can_view_deleted.return_value = False
+
+        contribs = CacheableDeletedContribs.get(self.wiki, 'Fred')
+
+        self.wiki.deleted_user_contributions.assert_not_called()
+        self.assertEqual(list(contribs.data), [])
+
+
+    def test_admin_and_non_admin_data_are_cached_separately(self):
+        self.cache.data['spi.CacheableDeletedContribs.admin.Fred'] = ContribStore([deleted(2020, 1, 2)]).to_bytes()
+        self.wiki.can_view_deleted.return_value = False
+        self.wiki.deleted_user_contributions.return_value = []
+
+        contribs = CacheableDeletedContribs.get(self.wiki, 'Fred')
+
+        self.assertEqual(list(contribs.data), [])
+        self.assertIn('spi.CacheableDeletedContribs.user.Fred', self.cache.data)
+
+
+    def test_get_with_date_range(self):
+        self.cache.data['spi.CacheableDeletedContribs.admin.Fred'] = ContribStore(
+            [deleted(2020, 1, 3), deleted(2020, 1, 2), deleted(2020, 1, 1)]).to_bytes()
+        date_range = DateRange(end=datetime(2020, 1, 2, 12, tzinfo=timezone.utc))
+
+        contribs = CacheableDeletedContribs.get(self.wiki, 'Fred', date_range)
+
+        self.wiki.deleted_user_contributions.assert_not_called()
+        self.assertEqual(list(contribs.data), [deleted(2020, 1, 2), deleted(2020, 1, 1)])
+
+
+def _dt(year, month, day):
+    return datetime(year, month, day, tzinfo=timezone.utc)
+
+
+class CacheableUserBlocksTest(TestCase):
+    def setUp(self):
+        patcher = patch('spi.user_utils.cache', FakeCache())
+        self.cache = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.wiki = NonCallableMock(Wiki)
+
+
+    def test_get_with_empty_cache_fetches_everything(self):
+        self.wiki.user_blocks.return_value = [UnblockEvent('Fred', _dt(2020, 1, 2), 2),
+                                              BlockEvent('Fred', _dt(2020, 1, 1), 1)]
+
+        blocks = CacheableUserBlocks.get(self.wiki, 'Fred')
+
+        key = 'spi.CacheableUserBlocks.Fred'
+        self.wiki.user_blocks.assert_called_once_with('Fred', end=None)
+        self.assertEqual(blocks.data, self.wiki.user_blocks.return_value)
+        self.assertEqual(blocks.max_log_id, 2)
+        self.assertEqual(self.cache.data[key], blocks)
+        self.assertEqual(self.cache.timeouts[key], LOG_HISTORY_TIMEOUT)
+
+
+    def test_get_only_keeps_events_with_new_log_ids(self):
+        self.cache.data['spi.CacheableUserBlocks.Fred'] = CacheableUserBlocks(
+            [BlockEvent('Fred', _dt(2020, 1, 1), 1)], 1)
+        self.wiki.user_blocks.return_value = [UnblockEvent('Fred', _dt(2020, 1, 1), 2),
+                                              BlockEvent('Fred', _dt(2020, 1, 1), 1)]
+
+        blocks = CacheableUserBlocks.get(self.wiki, 'Fred')
+
+        self.wiki.user_blocks.assert_called_once_with('Fred', end=_dt(2020, 1, 1))
+        self.assertEqual(blocks, CacheableUserBlocks([UnblockEvent('Fred', _dt(2020, 1, 1), 2),
+                                                      BlockEvent('Fred', _dt(2020, 1, 1), 1)], 2))
+
+
+    def test_get_does_not_rewrite_cache_with_nothing_new(self):
+        cached = CacheableUserBlocks([BlockEvent('Fred', _dt(2020, 1, 1), 1)], 1)
+        self.cache.data['spi.CacheableUserBlocks.Fred'] = cached
+        self.wiki.user_blocks.return_value = [BlockEvent('Fred', _dt(2020, 1, 1), 1)]
+
+        blocks = CacheableUserBlocks.get(self.wiki, 'Fred')
+
+        self.assertEqual(blocks, cached)
+        self.assertEqual(self.cache.timeouts, {})
+
+
+    def test_get_with_date_range(self):
+        self.cache.data['spi.CacheableUserBlocks.Fred'] = CacheableUserBlocks(
+            [UnblockEvent('Fred', _dt(2020, 3, 1), 2), BlockEvent('Fred', _dt(2020, 1, 1), 1)], 2)
+
+        blocks = CacheableUserBlocks.get(self.wiki, 'Fred', DateRange(_dt(2020, 1, 1), _dt(2020, 2, 1)))
+
+        self.wiki.user_blocks.assert_not_called()
+        self.assertEqual(blocks.data, [BlockEvent('Fred', _dt(2020, 1, 1), 1)])
+
+
+class CacheableLogHistoryTest(TestCase):
+    def test_base_class_cannot_be_instantiated(self):
+        with self.assertRaises(TypeError):
+            CacheableLogHistory()
+
+
+class CacheableUserLogEventsTest(TestCase):
+    @patch('spi.user_utils.cache', new_callable=FakeCache)
+    def test_get(self, cache):
         wiki = NonCallableMock(Wiki)
-        cache.get.return_value = [
-            WikiContrib(2020_01_03, datetime(2020, 1, 3), 'Fred', 0, 'Foo', ''),
-            WikiContrib(2020_01_02, datetime(2020, 1, 2), 'Fred', 0, 'Foo', ''),
-            WikiContrib(2020_01_01, datetime(2020, 1, 1), 'Fred', 0, 'Foo', ''),
-            ]
-        wiki.user_contributions.return_value = [
-            WikiContrib(2020_01_05, datetime(2020, 1, 5), 'Fred', 0, 'Foo', ''),
-            WikiContrib(2020_01_04, datetime(2020, 1, 4), 'Fred', 0, 'Foo', ''),
-            WikiContrib(2020_01_03, datetime(2020, 1, 3), 'Fred', 0, 'Foo', ''),
-            ]
-
-        contribs = CacheableUserContribs.get(wiki, 'Fred')
-
-        expected_contribs = CacheableUserContribs([
-            WikiContrib(2020_01_05, datetime(2020, 1, 5), 'Fred', 0, 'Foo', ''),
-            WikiContrib(2020_01_04, datetime(2020, 1, 4), 'Fred', 0, 'Foo', ''),
-            WikiContrib(2020_01_03, datetime(2020, 1, 3), 'Fred', 0, 'Foo', ''),
-            WikiContrib(2020_01_02, datetime(2020, 1, 2), 'Fred', 0, 'Foo', ''),
-            WikiContrib(2020_01_01, datetime(2020, 1, 1), 'Fred', 0, 'Foo', ''),
-            ])
-        key = 'spi.CacheableUserContribs.Fred'
-        cache.get.assert_called_once_with(key, default=[])
-        cache.set.assert_called_once_with(key, expected_contribs.data)
-        wiki.user_contributions.assert_called_once_with('Fred', end='2020-01-03T00:00:00')
-        self.assertEqual(contribs, expected_contribs)
+        wiki.user_log_events.return_value = iter([LogEvent(7, _dt(2020, 1, 1), 'Fred', 'Foo', 'create', 'create', '')])
+
+        events = CacheableUserLogEvents.get(wiki, 'Fred')
+
+        wiki.user_log_events.assert_called_once_with('Fred', end=None)
+        self.assertEqual(events.data, [LogEvent(7, _dt(2020, 1, 1), 'Fred', 'Foo', 'create', 'create', '')])
+        self.assertEqual(cache.data['spi.CacheableUserLogEvents.Fred'], events)
@@ -0,0 +1,144 @@
+"""Timecards computed from users' contributions.
+
+A timecard is a 7x24 matrix of edit counts, by day of week and hour
+of day.  It's stored flattened, as 168 cells in day-major order with
+Sunday as day 0, so cell = day * 24 + hour.  In that layout, shifting
+every edit by N hours is just rotating the cells by N, and the cell
+for a timestamp is (hours since the epoch + offset) % 168.
+
+For a ContribStore, the hours are computed straight from its column
+of integer timestamps, without building any WikiContribs or datetimes,
+so timecards for tens of thousands of edits are cheap.
+
+"""
+from array import array
+from collections import Counter
+from datetime import timezone
+import math
+
+from spi.contrib_store import ContribStore
+
+
+DAYS = 7
+HOURS = 24
+CELLS = DAYS * HOURS
+MICROS_PER_HOUR = 60 * 60 * 1_000_000
+
+# 1970-01-01 was a Thursday, i.e. day 4.
+EPOCH_CELL = 4 * HOURS
+
+# The largest radius in to_points().
+MAX_SCALE = 20
+
+
+class Timecard:
+    def __init__(self, counts=None):
+        """Counts is an iterable of CELLS edit counts, in cell order.
+        If it's omitted, the timecard is empty.
+
+        """
+        self.counts = array('I', counts) if counts is not None else array('I', bytes(4 * CELLS))
+        if len(self.counts) != CELLS:
+            raise ValueError(f'a timecard has {CELLS} cells, not {len(self.counts)}')
+
+
+    @staticmethod
+    def from_contribs(contribs, utc_offset=0):
+        """Build a Timecard from an iterable of WikiContribs.  Naive
+        timestamps are assumed to be UTC.
+
+        utc_offset (in whole hours) is added to every timestamp, so
+        the timecard is in that timezone's local time.
+
+        """
+        if isinstance(contribs, ContribStore):
+            hours = (micros // MICROS_PER_HOUR for micros in contribs.timestamps)
+        else:
+            hours = (int(c.timestamp.replace(tzinfo=c.timestamp.tzinfo or timezone.utc).timestamp()) // 3600
+                     for c in contribs)
+        base = EPOCH_CELL + utc_offset
+        cells = Counter((hour + base) % CELLS for hour in hours)
+        return Timecard(cells.get(cell, 0) for cell in range(CELLS))
+
+
+    def __eq__(self, other):
+        if isinstance(other, Timecard):
+            return self.counts == other.counts
+        return NotImplemented
+
+
+    def __repr__(self):
+        return f'Timecard({self.total()} edits)'
+
+
+    def count(self, day, hour):
+        return self.counts[day * HOURS + hour]
+
+
+    def total(self):
+        return sum(self.counts)
+
+
+    def rows(self):
+        """Returns the counts as a list of DAYS lists of HOURS counts."""
+        return [self.counts[day * HOURS:(day + 1) * HOURS].tolist() for day in range(DAYS)]
+
+
+    def shifted(self, hours):
+        """Returns a new Timecard with every edit moved hours later."""
+        hours %= CELLS
+        return Timecard(self.counts[-hours:] + self.counts[:-hours] if hours else self.counts)
+
+
+    def to_points(self, max_scale=MAX_SCALE):
+        """Returns the non-empty cells as a list of {'x': hour, 'y': day,
+        'r': scale} dicts, the format TimecardView uses for xtools data.
+        Days are numbered 1 (Sunday) to 7, and the scale is relative to
+        the busiest cell, which gets max_scale.
+
+        """
+        peak = max(self.counts)
+        return [{'x': cell % HOURS, 'y': cell // HOURS + 1, 'r': round(count / peak * max_scale)}
+                for cell, count in enumerate(self.counts)
+                if count]
+
+
+    def unit_vector(self):
+        """Returns the counts as a list of floats with unit length, or
+        all zeros if the timecard is empty.
+
+        """
+        norm = math.sqrt(sum(c * c for c in self.counts))
+        if not norm:
+            return [0.0] * CELLS
+        return [c / norm for c in self.counts]
+
+
+    def similarity(self, other):
+        """Returns the cosine similarity of the two timecards, from 0 (no
+        hours in common) to 1 (identical distributions, regardless of
+        the number of edits).  An empty timecard has 0 similarity to
+        everything.
+
+        """
+        return _dot(self.unit_vector(), other.unit_vector())
+
+
+def similarity_matrix(timecards):
+    """Returns the pairwise similarities of a list of Timecards, as a
+    list of lists, i.e. result[i][j] = timecards[i].similarity(timecards[j]).
+
+    Each timecard is only normalized once, so this is quick even for
+    dozens of timecards.
+
+    """
+    vectors = [t.unit_vector() for t in timecards]
+    matrix = [[0.0] * len(vectors) for _ in vectors]
+    for i, v in enumerate(vectors):
+        for j in range(i, len(vectors)):
+            matrix[i][j] = matrix[j][i] = _dot(v, vectors[j])
+    return matrix
+
+
+def _dot(u, v):
+    return math.fsum(map(float.__mul__, u, v))
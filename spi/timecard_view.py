@@ -1,32 +1,89 @@
 import logging
-import requests
-
 
+from django.http import HttpResponseBadRequest
 from django.shortcuts import render
-from django.views import View
-from wiki_interface import Wiki  #pylint: disable=unused-import
+import requests
+
+from spi import icache as cache
+from spi.fetch_utils import http_session, map_concurrently
+from spi.spi_view import SpiView
+from spi.timecard import similarity_matrix, Timecard
+from spi.user_utils import CacheableUserContribs
 
 
 logger = logging.getLogger('spi.views.timecard_view')
 
 TIMECARD_BASE = 'https://xtools.wmflabs.org/api/user/timecard/en.wikipedia.org'
+TIMECARD_TIMEOUT = (5, 20)  # seconds (connect, read)
+TIMECARD_CACHE_TIMEOUT = 24 * 60 * 60  # seconds
 
 
-class TimecardView(View):
+class TimecardView(SpiView):
+    """By default, the timecards come from xtools, fetched concurrently,
+    and cached for TIMECARD_CACHE_TIMEOUT.  If xtools fails, the
+    timecard is computed from the user's (cached) contributions
+    instead.
+
+    With local=1, all the timecards are computed from the cached
+    contributions, without calling xtools, and the context also gets
+    a table of pairwise similarity scores.  tz=N shifts the local
+    timecards by N hours from UTC.
+
+    Each timecard is a list of {'x': hour, 'y': day of week, 'r': scale}
+    dicts, where day 1 is Sunday.
+
+    """
     def get(self, request, case_name):
         user_names = request.GET.getlist('users')
-        data = {}
-        for name in user_names:
-            response = requests.get('%s/%s' % (TIMECARD_BASE, name))
-            if response.status_code == requests.codes.ok: # pylint: disable=no-member
-                timecard = response.json()['timecard']
-                data[name] = [{'x': t['hour'], 'y': t['day_of_week'], 'r': t['scale']}
-                              for t in timecard
-                              if 'scale' in t]
-            else:
-                data[name] = []
-
+        try:
+            utc_offset = int(request.GET.get('tz', '0'))
+        except ValueError:
+            return HttpResponseBadRequest(f'invalid tz: {request.GET["tz"]}')
+        try:
+            local = int(request.GET.get('local', '0'))
+        except ValueError:
+            return HttpResponseBadRequest(f'invalid local: {request.GET["local"]}')
         context = {'case_name': case_name,
                    'users': user_names,
-                   'data': data}
+                   }
+
+        if local:
+            timecards = map_concurrently(lambda name: self.get_local_timecard(name, utc_offset), user_names)
+            context['data'] = {name: t.to_points() for name, t in zip(user_names, timecards)}
+            context['similarities'] = list(zip(user_names, similarity_matrix(timecards)))
+        else:
+            context['data'] = dict(zip(user_names, map_concurrently(self.get_timecard, user_names)))
         return render(request, 'spi/timecard.html', context)
+
+
+    def get_timecard(self, user_name):
+        key = f'spi.timecard.{user_name}'
+        timecard = cache.get(key)
+        if timecard is None:
+            try:
+                timecard = get_xtools_timecard(user_name)
+            except (requests.RequestException, ValueError) as ex:
+                logger.warning('xtools timecard failed for %s (%s), computing locally', user_name, ex)
+                return self.get_local_timecard(user_name).to_points()
+            cache.set(key, timecard, TIMECARD_CACHE_TIMEOUT)
+        return timecard
+
+
+    def get_local_timecard(self, user_name, utc_offset=0):
+        return Timecard.from_contribs(CacheableUserContribs.get(self.wiki, user_name).data, utc_offset)
+
+
+def get_xtools_timecard(user_name):
+    """Raises requests.RequestException if xtools can't be reached or
+    returns an error, and ValueError if the response can't be parsed.
+
+    """
+    response = http_session().get(f'{TIMECARD_BASE}/{user_name}', timeout=TIMECARD_TIMEOUT)
+    response.raise_for_status()
+    try:
+        timecard = response.json()['timecard']
+        return [{'x': t['hour'], 'y': t['day_of_week'], 'r': t['scale']}
+                for t in timecard
+                if 'scale' in t]
+    except (KeyError, TypeError) as ex:
+        raise ValueError(f'unexpected xtools response: {ex}') from ex
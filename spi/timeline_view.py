@@ -1,13 +1,23 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 from collections import defaultdict
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass
 from datetime import datetime
+from functools import partial
+from itertools import dropwhile, islice
 import heapq
+import json
 import logging
 
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.http import HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
+from django.template.backends.utils import csrf_input_lazy, csrf_token_lazy
+from django.template.loader import get_template
 
-from spi.user_utils import CacheableUserContribs
+from spi.date_range import DateRange
+from spi.fetch_utils import iter_with_request, map_concurrently, start_concurrently
+from spi.user_utils import (CacheableDeletedContribs, CacheableUserBlocks, CacheableUserContribs,
+                            CacheableUserLogEvents)
 from spi.spi_view import SpiView
 from wiki_interface.block_utils import BlockEvent, UnblockEvent
 
@@ -39,75 +49,210 @@ class TimelineEvent:
     comment: str
     extra: str = ''
 
+    def key(self):
+        return (self.timestamp, self.id)
+
+
+@dataclass(frozen=True)
+class TimelineCursor:
+    """A position in the (reverse chronological) merged timeline.
+
+    Timestamp and id identify the last event returned.  It's possible
+    (if unlikely) for several events to have the same timestamp and
+    id; count is the number of those which have already been
+    returned.
+
+    """
+    timestamp: datetime
+    id: int
+    count: int = 1
+
+    def key(self):
+        return (self.timestamp, self.id)
+
+
+    def encode(self):
+        """Returns an opaque string suitable for use in a URL."""
+        data = json.dumps([self.timestamp.isoformat(), self.id, self.count])
+        return urlsafe_b64encode(data.encode()).decode()
+
+
+    @staticmethod
+    def decode(cursor_string):
+        """The inverse of encode().  Raises ValueError if the string is
+        not a valid cursor.
+
+        """
+        try:
+            timestamp, item_id, count = json.loads(urlsafe_b64decode(cursor_string.encode()))
+            timestamp = datetime.fromisoformat(timestamp)
+            if timestamp.tzinfo is None:
+                raise ValueError('naive cursor timestamp')
+            return TimelineCursor(timestamp, int(item_id), int(count))
+        except (TypeError, ValueError) as ex:
+            raise ValueError(f'invalid cursor: {cursor_string}') from ex
+
+
+    def skip_seen(self, events):
+        """Given an iterable over TimelineEvents in reverse chronological
+        order, returns an iterator over the ones after this cursor.
+        Only the events at exactly this cursor's position are counted.
+
+        """
+        remaining = self.count
+        for event in dropwhile(lambda e: e.key() > self.key(), events):
+            if remaining and event.key() == self.key():
+                remaining -= 1
+                continue
+            yield event
+
+
+TAG_HEADINGS = {'mobile edit': ['mobile'],
+                'mobile web edit': ['mobile', 'web'],
+                'visualeditor': ['visual'],
+                'AWB': ['AWB'],
+                'mw-reverted': ['mw-', 'rev'],
+                'mw-undo': ['mw-', 'undo'],
+                'wikieditor': ['wiki', 'ed'],
+                'mw-rollback': ['mw-', 'roll'],
+                'visualeditor-wikitext': ['vis', 'wiki', 'text'],
+                'advanced mobile edit': ['adv', 'mobile'],
+                'mobile app edit': ['mobile', 'app'],
+                'twinkle': ['twink'],
+                'RedWarn': ['red', 'warn'],
+                'removal of COI template': ['rm', 'coi'],
+                'mw-blank': ['mw-', 'blank'],
+                'removal of speedy deletion templates': ['rm', 'csd'],
+}
+
+# Number of template output fragments to buffer before sending a
+# chunk in streaming mode.
+STREAM_BUFFER_SIZE = 200
+
 
 class TimelineView(LoginRequiredMixin, SpiView):
+    """With stream=1 in the query string, the page is sent as a
+    StreamingHttpResponse.  The events are merged lazily and rendered
+    as they're produced, and the tag counts are rendered after the
+    last event.  Otherwise, all the events are collected before the
+    page is rendered.
+
+    The start, end, and days query parameters limit the events to a
+    date range; see DateRange.from_query().
+
+    """
     def get(self, request, case_name):
         user_names = request.GET.getlist('users')
         logger.debug("user_names = %s", user_names)
+        try:
+            date_range = DateRange.from_query(request.GET)
+            streaming = int(request.GET.get('stream', '0'))
+        except ValueError as ex:
+            return HttpResponseBadRequest(str(ex))
 
         self.tag_data = {}  # pylint: disable=attribute-defined-outside-init
-        per_user_streams = [self.get_event_stream_for_user(self.wiki, user) for user in user_names]
-        events = list(heapq.merge(*per_user_streams, reverse=True))
-        # At this point, i.e. after the merge() output is consumed,
-        # self.tag_data will be valid.
+        streams = [stream
+                   for user in user_names
+                   for stream in self.get_event_streams_for_user(self.wiki, user, date_range)]
+
+        if streaming:
+            return self.get_streaming_response(request, case_name, user_names, date_range, streams)
+
+        # Each stream is an independent series of API (or cache)
+        # calls, so fetch them all concurrently before merging.
+        prefetched_streams = map_concurrently(list, streams)
+        events = list(heapq.merge(*prefetched_streams, reverse=True))
+        # At this point, i.e. after all the streams have been
+        # consumed, self.tag_data will be valid.
+        context = {'case_name': case_name,
+                   'user_names': user_names,
+                   'date_range': date_range,
+                   'events': events,
+                   'streaming': False,
+                   **self.get_tag_context(user_names),
+        }
+        return render(request, 'spi/timeline.html', context)
+
+
+    def get_streaming_response(self, request, case_name, user_names, date_range, streams):
+        """Returns a StreamingHttpResponse.
+
+        The page header goes out before any wiki calls are made.  When
+        the template gets to the event list, the streams are started
+        concurrently, but only consumed as fast as rows are rendered.
+
+        """
+        # The events are produced after this returns, when the
+        # middleware has already forgotten the request, so it's passed
+        # along explicitly; otherwise per-request settings (like
+        # use-cache) would be lost.
+        def events():
+            yield from heapq.merge(*start_concurrently(streams, request=request), reverse=True)
+
+        context = {'request': request,
+                   'csrf_input': csrf_input_lazy(request),
+                   'csrf_token': csrf_token_lazy(request),
+                   'case_name': case_name,
+                   'user_names': user_names,
+                   'date_range': date_range,
+                   'events': iter_with_request(events(), request),
+                   'streaming': True,
+                   # Only valid after events() is exhausted, so the
+                   # template calls this after rendering the events.
+                   'get_tag_context': partial(self.get_tag_context, user_names),
+        }
+        template = get_template('spi/timeline.html', using='jinja2').template
+        stream = template.stream(context)
+        stream.enable_buffering(STREAM_BUFFER_SIZE)
+        return StreamingHttpResponse(stream)
+
+
+    def get_tag_context(self, user_names):
+        """Returns the tag-count part of the template context.  This
+        depends on self.tag_data, so may only be called after all the
+        edit streams have been consumed.
+
+        """
         tags = set()
         for tag_counts in self.tag_data.values():
             for tag in tag_counts:
                 tags.add(tag)
 
-        tag_headings = {'mobile edit': ['mobile'],
-                        'mobile web edit': ['mobile', 'web'],
-                        'visualeditor': ['visual'],
-                        'AWB': ['AWB'],
-                        'mw-reverted': ['mw-', 'rev'],
-                        'mw-undo': ['mw-', 'undo'],
-                        'wikieditor': ['wiki', 'ed'],
-                        'mw-rollback': ['mw-', 'roll'],
-                        'visualeditor-wikitext': ['vis', 'wiki', 'text'],
-                        'advanced mobile edit': ['adv', 'mobile'],
-                        'mobile app edit': ['mobile', 'app'],
-                        'twinkle': ['twink'],
-                        'RedWarn': ['red', 'warn'],
-                        'removal of COI template': ['rm', 'coi'],
-                        'mw-blank': ['mw-', 'blank'],
-                        'removal of speedy deletion templates': ['rm', 'csd'],
-        }
-
         tag_list = sorted(tags)
         tag_table = []
         for user in user_names:
             counts = [(tag, self.tag_data[user][tag]) for tag in tag_list]
             tag_table.append((user, counts))
 
-        context = {'case_name': case_name,
-                   'user_names': user_names,
-                   'events': events,
-                   'tag_list': tag_list,
-                   'tag_table': tag_table,
-                   'tag_headings': tag_headings,
+        return {'tag_list': tag_list,
+                'tag_table': tag_table,
+                'tag_headings': TAG_HEADINGS,
         }
-        return render(request, 'spi/timeline.html', context)
 
 
-    def get_event_stream_for_user(self, wiki, user):
-        """Returns an iterable over TimelineEvents.
+    def get_event_streams_for_user(self, wiki, user, date_range=DateRange()):
+        """Returns a list of iterables over TimelineEvents, one for each
+        kind of event (edits, blocks, log entries).  Each iterable is
+        in reverse chronological order, limited to date_range.
+
+        The iterables are lazy; no wiki calls are made until they are
+        consumed.
 
         """
-        user_streams = [self.get_contribs_for_user(wiki, user),
-                        self.get_blocks_for_user(wiki, user),
-                        self.get_log_events_for_user(wiki, user)]
-        return heapq.merge(*user_streams, reverse=True)
+        return [self.get_contribs_for_user(wiki, user, date_range),
+                self.get_blocks_for_user(wiki, user, date_range),
+                self.get_log_events_for_user(wiki, user, date_range)]
 
 
-    def get_contribs_for_user(self, wiki, user_name):
+    def get_contribs_for_user(self, wiki, user_name, date_range=DateRange()):
         """Returns an interable over TimelineEvents.
 
         As a side effect, updates self.tag_data.
 
         """
         self.tag_data[user_name] = defaultdict(int)
-        active = CacheableUserContribs.get(wiki, user_name).data
-        deleted = wiki.deleted_user_contributions(user_name)
+        active = CacheableUserContribs.get(wiki, user_name, date_range).data
+        deleted = CacheableDeletedContribs.get(wiki, user_name, date_range).data
         for contrib in heapq.merge(active, deleted, reverse=True):
             for tag in contrib.tags:
                 self.tag_data[user_name][tag] += 1
@@ -123,11 +268,11 @@ class TimelineView(LoginRequiredMixin, SpiView):
 
 
     @staticmethod
-    def get_blocks_for_user(wiki, user_name):
+    def get_blocks_for_user(wiki, user_name, date_range=DateRange()):
         """Returns an interable over TimelineEvents.
 
         """
-        for block in wiki.user_blocks(user_name):
+        for block in CacheableUserBlocks.get(wiki, user_name, date_range).data:
             if isinstance(block, BlockEvent):
                 yield TimelineEvent(block.timestamp,
                                     block.id,
@@ -154,11 +299,11 @@ class TimelineView(LoginRequiredMixin, SpiView):
                                     '')
 
     @staticmethod
-    def get_log_events_for_user(wiki, user_name):
+    def get_log_events_for_user(wiki, user_name, date_range=DateRange()):
         """Returns an iterable over TimelineEvents.
 
         """
-        for event in wiki.user_log_events(user_name):
+        for event in CacheableUserLogEvents.get(wiki, user_name, date_range).data:
             yield TimelineEvent(event.timestamp,
                                 event.log_id,
                                 event.user_name,
@@ -166,3 +311,84 @@ class TimelineView(LoginRequiredMixin, SpiView):
                                 event.action,
                                 event.title,
                                 '<comment hidden>' if event.comment is None else event.comment)
+
+
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+
+
+class TimelineApiView(TimelineView):
+    """Returns the same events as TimelineView, as JSON, one page at a
+    time.
+
+    Query parameters are users (repeated, as for TimelineView), limit
+    (the page size), cursor, and the date range parameters (start,
+    end, days).  The response is:
+
+      {
+        'events': [...],
+        'cursor': '...'
+      }
+
+    To get the next page, repeat the request passing back the returned
+    cursor.  On the last page, cursor is null.
+
+    The cursor's timestamp becomes the end of the date range, so each
+    page only fetches (from the cache, in most cases) and merges the
+    events at or before the cursor, and the merge stops once the page
+    is full.  Fetching N pages doesn't re-merge all the earlier pages
+    each time.
+
+    """
+    def get(self, request, case_name):
+        user_names = request.GET.getlist('users')
+        try:
+            limit = min(int(request.GET.get('limit', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+            cursor = request.GET.get('cursor') and TimelineCursor.decode(request.GET['cursor'])
+            date_range = DateRange.from_query(request.GET)
+        except ValueError as ex:
+            return JsonResponse({'error': str(ex)}, status=400)
+        if limit < 1:
+            return JsonResponse({'error': f'invalid limit: {limit}'}, status=400)
+
+        if cursor:
+            # Everything newer than the cursor has already been
+            # returned.  Events at exactly the cursor's timestamp are
+            # still needed; skip_seen() sorts those out.
+            end = min(date_range.end, cursor.timestamp) if date_range.end else cursor.timestamp
+            date_range = DateRange(date_range.start, end)
+
+        self.tag_data = {}  # pylint: disable=attribute-defined-outside-init
+        streams = [stream
+                   for user in user_names
+                   for stream in self.get_event_streams_for_user(self.wiki, user, date_range)]
+        events = heapq.merge(*start_concurrently(streams), reverse=True)
+        if cursor:
+            events = cursor.skip_seen(events)
+
+        page = list(islice(events, limit + 1))
+        next_cursor = None
+        if len(page) > limit:
+            page.pop()
+            next_cursor = self.get_next_cursor(cursor, page)
+
+        return JsonResponse({'events': [asdict(e) for e in page],
+                             'cursor': next_cursor and next_cursor.encode(),
+        })
+
+
+    @staticmethod
+    def get_next_cursor(cursor, page):
+        """Returns the TimelineCursor which follows the (non-empty) page of
+        events returned using cursor.
+
+        """
+        last_key = page[-1].key()
+        count = 0
+        for event in reversed(page):
+            if event.key() != last_key:
+                break
+            count += 1
+        if count == len(page) and cursor and cursor.key() == last_key:
+            count += cursor.count
+        return TimelineCursor(*last_key, count)
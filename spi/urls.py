@@ -3,7 +3,7 @@ from spi.index_view import IndexView
 from spi.ip_analysis_view import IpAnalysisView
 from spi.sock_select_view import SockSelectView
 from spi.timecard_view import TimecardView
-from spi.timeline_view import TimelineView
+from spi.timeline_view import TimelineView, TimelineApiView
 from spi.pages_view import PagesView
 from spi.g5_view import G5View
 from spi.cu_log_view import CuLogView
@@ -15,6 +15,7 @@ urlpatterns = [
     path('sock-select/<case_name>/', SockSelectView.as_view(), name="spi-sock-select"),
     path('timecard/<case_name>', TimecardView.as_view(), name="spi-timecard"),
     path('timeline/<case_name>', TimelineView.as_view(), name="spi-timeline"),
+    path('timeline-api/<case_name>', TimelineApiView.as_view(), name="spi-timeline-api"),
     path('g5/<case_name>', G5View.as_view(), name="spi-g5"),
     path('pages/<case_name>', PagesView.as_view(), name="spi-pages"),
     path('cu-log/<case_name>', CuLogView.as_view(), name="spi-cu-log"),
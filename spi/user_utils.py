@@ -1,34 +1,308 @@
+from abc import ABC, abstractmethod
 from dataclasses import dataclass, field
-from typing import List
-from itertools import chain
+from itertools import groupby
+from typing import List, Sequence
 import logging
 
 from spi import icache as cache
+from spi.contrib_store import ContribStore
+from spi.date_range import DateRange
 from wiki_interface import WikiContrib
 
 
 logger = logging.getLogger('spi.views')
 
 
+# Sealed segments are never rewritten, and the head and manifest are
+# updated incrementally, so they can all be kept for a long time.  (They
+# expire together; losing any of them forces a full rebuild.)  An empty
+# history has nothing to update from, so it's only kept briefly.
+CONTRIBS_TIMEOUT = 30 * 24 * 60 * 60  # seconds
+EMPTY_CONTRIBS_TIMEOUT = 5 * 60  # seconds
+
+
+def contrib_month(contrib):
+    return contrib.timestamp.strftime('%Y-%m')
+
+
 @dataclass(frozen=True)
 class CacheableUserContribs:
-    data: List[WikiContrib] = field(default_factory=list)
+    """Data is a sequence of WikiContribs, in reverse chronological order.
+    When this comes from get(), it's a ContribStore.
+
+    The cached history for a user is split into segments, one per
+    calendar month, each stored as a ContribStore under its own key:
+
+      spi.CacheableUserContribs.{user}.manifest -- the sealed months, newest first
+      spi.CacheableUserContribs.{user}.head     -- the newest month
+      spi.CacheableUserContribs.{user}.{YYYY-MM} -- one sealed month
+
+    New contribs only ever go into the head.  When the head spans more
+    than one month, the older months are sealed into their own
+    segments, which are never rewritten.  So an update costs a write
+    proportional to a month of edits, not the whole history.
+
+    """
+    data: Sequence[WikiContrib] = field(default_factory=list)
 
 
     @staticmethod
-    def get(wiki, user_name):
-        key = f'spi.CacheableUserContribs.{user_name}'
-        data = cache.get(key, default=[])
-        logger.info('got %d from cache (%s)', len(data), key)
-        end_time = data[0].timestamp.isoformat() if data else None
+    def get(wiki, user_name, date_range=DateRange()):
+        """If date_range is bounded, the returned data is limited to that
+        range.  Segments for months outside the range aren't fetched,
+        and if the cache already has contribs newer than the end of
+        the range, the wiki isn't consulted at all.
+
+        If nothing is cached and the range has a start, only the range
+        is fetched.  The cache can only hold a complete history, so
+        that partial history isn't cached.
+
+        """
+        prefix = f'spi.CacheableUserContribs.{user_name}'
+        manifest, head, segments = CacheableUserContribs.load(prefix, date_range.start, date_range.end)
+        logger.info('got %d (head) + %d (%d segments) from cache (%s)',
+                    len(head), sum(len(s) for s in segments), len(segments), prefix)
+
+        if manifest is None and date_range.start is not None:
+            logger.info('cache for %s is empty, fetching %s', prefix, date_range)
+            return CacheableUserContribs(ContribStore(wiki.user_contributions(user_name,
+                                                                              **date_range.wiki_kwargs())))
+
+        if head and date_range.ends_before(head[0].timestamp):
+            logger.info('cache for %s covers %s', prefix, date_range)
+        elif manifest is not None and not head:
+            logger.info('cache for %s is an empty history', prefix)
+        else:
+            manifest, head, segments = CacheableUserContribs.update(wiki, user_name, prefix,
+                                                                    manifest, head, segments)
+        data = ContribStore.concatenate([head] + segments)
+        if date_range:
+            data = data.window(date_range.start, date_range.end)
+        return CacheableUserContribs(data)
+
+
+    @staticmethod
+    def update(wiki, user_name, prefix, manifest, head, segments):
+        """Fetch any contribs newer than the head, and write the changes
+        back to the cache.  Returns the new (manifest, head, segments).
+
+        A manifest of None means nothing was cached.  If the user has no
+        contribs at all, an empty history is cached, briefly.
+
+        """
+        cold = manifest is None
+        manifest = manifest or []
+        end_time = head[0].timestamp.isoformat() if head else None
         new_data = list(wiki.user_contributions(user_name, end=end_time))
         if new_data:
-            logger.info('got %d new for %s', len(new_data), key)
-            if data and new_data[-1].rev_id == data[0].rev_id:
+            logger.info('got %d new for %s', len(new_data), prefix)
+            if head and new_data[-1].rev_id == head[0].rev_id:
                 logger.info('pop')
                 new_data.pop()
         if new_data:
-            data = list(chain(new_data, data))
-            logger.info('setting %s in cache (%d entries)', key, len(data))
-            cache.set(key, data)
-        return CacheableUserContribs(data)
+            head = head.prepended(new_data)
+            head, sealed = CacheableUserContribs.seal(head)
+            updates = {f'{prefix}.{month}': store.to_bytes() for month, store in sealed}
+            manifest = [month for month, _ in sealed] + manifest
+            updates[f'{prefix}.head'] = head.to_bytes()
+            updates[f'{prefix}.manifest'] = manifest
+            logger.info('setting %s in cache (%d head entries, %d new segments)',
+                        prefix, len(head), len(sealed))
+            cache.set_many(updates, CONTRIBS_TIMEOUT)
+            segments = [store for _, store in sealed] + segments
+        elif cold:
+            logger.info('setting empty history for %s in cache', prefix)
+            cache.set_many({f'{prefix}.head': head.to_bytes(), f'{prefix}.manifest': manifest},
+                           EMPTY_CONTRIBS_TIMEOUT)
+        return manifest, head, segments
+
+
+    @staticmethod
+    def load(prefix, start=None, end=None):
+        """Returns a (manifest, head, segments) tuple.  Segments is a list
+        of ContribStores, in manifest order, limited to the months from
+        start to end (either of which may be None).
+
+        If anything is missing from the cache, returns (None, an empty
+        ContribStore, []), which forces a full rebuild.
+
+        """
+        manifest_key = f'{prefix}.manifest'
+        head_key = f'{prefix}.head'
+        cached = cache.get_many([manifest_key, head_key])
+        if manifest_key not in cached or head_key not in cached:
+            return None, ContribStore(), []
+        manifest = cached[manifest_key]
+        head = ContribStore.from_bytes(cached[head_key])
+
+        start_month = start and start.strftime('%Y-%m')
+        end_month = end and end.strftime('%Y-%m')
+        keys = [f'{prefix}.{month}' for month in manifest
+                if (not start_month or month >= start_month) and (not end_month or month <= end_month)]
+        blobs = cache.get_many(keys) if keys else {}
+        if len(blobs) != len(keys):
+            logger.warning('%d of %d segments missing for %s, rebuilding',
+                           len(keys) - len(blobs), len(keys), prefix)
+            return None, ContribStore(), []
+        return manifest, head, [ContribStore.from_bytes(blobs[key]) for key in keys]
+
+
+    @staticmethod
+    def seal(head):
+        """Splits off the months in head older than the newest one.
+
+        Returns a (head, sealed) tuple, where sealed is a list of
+        (month, ContribStore) pairs, newest first.
+
+        """
+        newest_month = contrib_month(head[0])
+        split = next((i for i, contrib in enumerate(head) if contrib_month(contrib) != newest_month),
+                     len(head))
+        if split == len(head):
+            return head, []
+        sealed = [(month, ContribStore(contribs))
+                  for month, contribs in groupby(head[split:], key=contrib_month)]
+        return head[:split], sealed
+
+
+DELETED_CONTRIBS_TIMEOUT = 60 * 60  # seconds
+
+
+@dataclass(frozen=True)
+class CacheableDeletedContribs:
+    """Data is a sequence of (deleted) WikiContribs, in the order
+    returned by Wiki.deleted_user_contributions().  When this comes
+    from get(), it's a ContribStore.
+
+    The cache is keyed by user and by whether the viewer can see
+    deleted revisions, so admins and non-admins never share data.
+    Updates only fetch revisions newer than the newest cached one.
+    That misses older revisions which get deleted (or undeleted)
+    later, so entries expire after DELETED_CONTRIBS_TIMEOUT and are
+    then rebuilt from scratch.
+
+    """
+    data: Sequence[WikiContrib] = field(default_factory=list)
+
+
+    @staticmethod
+    def get(wiki, user_name, date_range=DateRange()):
+        level = 'admin' if wiki.can_view_deleted() else 'user'
+        key = f'spi.CacheableDeletedContribs.{level}.{user_name}'
+        blob = cache.get(key)
+        data = ContribStore.from_bytes(blob) if blob else ContribStore()
+        logger.info('got %d from cache (%s)', len(data), key)
+
+        newest = max((c.timestamp for c in data), default=None)
+        if newest and date_range.ends_before(newest):
+            logger.info('cache for %s covers %s', key, date_range)
+        elif blob is None or newest:
+            cached_ids = {c.rev_id for c in data if c.timestamp == newest}
+            new_data = [c for c in wiki.deleted_user_contributions(user_name, end=newest)
+                        if c.rev_id not in cached_ids]
+            if new_data or blob is None:
+                logger.info('got %d new for %s', len(new_data), key)
+                data = ContribStore(sorted([*new_data, *data], reverse=True))
+                cache.set(key, data.to_bytes(), DELETED_CONTRIBS_TIMEOUT)
+
+        if date_range:
+            data = ContribStore(c for c in data if date_range.contains(c.timestamp))
+        return CacheableDeletedContribs(data)
+
+
+# All the cached log histories share this timeout.  Entries are
+# updated incrementally, so this only bounds how long a change to an
+# existing log entry (i.e. revision deletion or suppression) can go
+# unnoticed.
+LOG_HISTORY_TIMEOUT = 24 * 60 * 60  # seconds
+
+
+@dataclass(frozen=True)
+class CacheableLogHistory(ABC):
+    """Base class for cached, per-user log histories.
+
+    Data is a list of log events, in reverse chronological order;
+    max_log_id is the highest log id seen.  Updates only fetch events
+    at or after the newest cached timestamp, and keep the ones with log
+    ids higher than max_log_id.
+
+    Subclasses implement fetch() and log_id().
+
+    """
+    data: List = field(default_factory=list)
+    max_log_id: int = 0
+
+
+    @classmethod
+    def get(cls, wiki, user_name, date_range=DateRange()):
+        key = f'spi.{cls.__name__}.{user_name}'
+        history = cache.get(key)
+        if history is None:
+            history = cls()
+            cached = False
+        else:
+            logger.info('got %d from cache (%s)', len(history.data), key)
+            cached = True
+
+        if history.data and date_range.ends_before(history.data[0].timestamp):
+            logger.info('cache for %s covers %s', key, date_range)
+        else:
+            end = history.data[0].timestamp if history.data else None
+            new_data = [e for e in cls.fetch(wiki, user_name, end)
+                        if cls.log_id(e) > history.max_log_id]
+            if new_data or not cached:
+                logger.info('got %d new for %s', len(new_data), key)
+                history = cls(new_data + history.data,
+                              max((cls.log_id(e) for e in new_data), default=history.max_log_id))
+                cache.set(key, history, LOG_HISTORY_TIMEOUT)
+
+        if date_range:
+            return cls([e for e in history.data if date_range.contains(e.timestamp)], history.max_log_id)
+        return history
+
+
+    @staticmethod
+    @abstractmethod
+    def fetch(wiki, user_name, end):
+        """Returns the user's events, newest first, back to end (which
+        may be None).
+
+        """
+
+
+    @staticmethod
+    @abstractmethod
+    def log_id(event):
+        """Returns the event's log id."""
+
+
+@dataclass(frozen=True)
+class CacheableUserBlocks(CacheableLogHistory):
+    """Data is a list of BlockEvents and UnblockEvents, as returned by
+    Wiki.user_blocks().
+
+    """
+    @staticmethod
+    def fetch(wiki, user_name, end):
+        return wiki.user_blocks(user_name, end=end)
+
+
+    @staticmethod
+    def log_id(event):
+        return event.id
+
+
+@dataclass(frozen=True)
+class CacheableUserLogEvents(CacheableLogHistory):
+    """Data is a list of LogEvents, as returned by
+    Wiki.user_log_events().
+
+    """
+    @staticmethod
+    def fetch(wiki, user_name, end):
+        return list(wiki.user_log_events(user_name, end=end))
+
+
+    @staticmethod
+    def log_id(event):
+        return event.log_id
@@ -16,8 +16,8 @@ from pathlib import Path
 import re
 import sys
 import datetime
+import hashlib
 import tools_app.git
-from uuid import uuid4
 import spi_config
 
 config = spi_config.get_config()
@@ -104,13 +104,16 @@ if ENABLE_DEBUG_TOOLBAR:
 # WARNING: some keys may not be usable on non-redis backends.  See
 # https://docs.djangoproject.com/en/2.2/topics/cache/#cache-key-transformation
 
-# This configuration uses a short timeout and invalidates every cache
-# entry on every server restart.
+# This configuration uses a short timeout.  The key prefix is derived
+# from the deployed version, so every process running the same code
+# (web workers and the precompute cron jobs alike) shares the same
+# entries, and they're all invalidated when new code is deployed.
+CACHE_KEY_PREFIX = '%s:%s' % (TOOL_NAME, hashlib.sha1(VERSION_ID.encode()).hexdigest()[:12])
 REDIS_CACHE = {
         'BACKEND': 'django_redis.cache.RedisCache',
         'LOCATION': 'redis://tools-redis.svc.eqiad.wmflabs:6379/0',
         'TIMEOUT': 300,
-        'KEY_PREFIX': str(uuid4()),
+        'KEY_PREFIX': CACHE_KEY_PREFIX,
         'OPTIONS': {
             'CLIENT_CLASS': 'django_redis.client.DefaultClient',
             'IGNORE_EXCEPTIONS': True,
@@ -169,6 +172,27 @@ AUTHENTICATION_BACKENDS = (
 MEDIAWIKI_SITE_NAME = 'example.com' if TESTING else 'en.wikipedia.org'
 MEDIAWIKI_USER_AGENT = 'spi-tools (runserver)' if RUNSERVER else f'{TOOL_NAME} (toolforge)'
 
+# Share mwclient.Site objects (and their HTTP connections) across
+# requests; see wiki_interface.site_pool.  This is disabled during
+# testing so tests which patch mwclient.Site always get a fresh one.
+MEDIAWIKI_SITE_POOL_ENABLED = not TESTING
+
+# Maximum number of concurrent per-user fetches made by a single view;
+# see spi.fetch_utils.  This should be no larger than the requests
+# connection pool size (10), or connections will get thrown away.
+SPI_MAX_FETCH_WORKERS = 10
+
+# A table of routed prefixes, built from a prefix-to-AS dump (e.g.
+# CAIDA's RouteViews pfx2as), used to find the network for an IP address
+# without a whois lookup; see api.prefix_table.  Update it with
+# "manage.py fetch_prefix_table URL".  If the file doesn't exist, every
+# lookup goes to whois.
+API_PREFIX_TABLE_PATH = None if TESTING else os.path.join(PYTHON_DIR, 'prefix-table.pickle')
+
+# The cross-case IP index; see api.case_index.  It's written by
+# "manage.py update_case_index" and read by the web workers.
+API_CASE_INDEX_PATH = None if TESTING else os.path.join(PYTHON_DIR, 'case-index.pickle')
+
 
 # https://python-social-auth.readthedocs.io/en/latest/backends/mediawiki.html
 SOCIAL_AUTH_MEDIAWIKI_KEY = config["oauth"]["mediawiki_key"]
@@ -0,0 +1,43 @@
+import os
+import subprocess
+import sys
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from django.conf import settings
+
+
+# Runs outside of "manage.py test", so the settings are computed the
+# way a deployed process (web worker or cron job) computes them.  The
+# real cache is redis; a file based cache with the same KEY_PREFIX
+# stands in for it.
+SCRIPT = '''
+import sys
+from django.conf import settings
+from django.core.cache.backends.filebased import FileBasedCache
+
+command, location = sys.argv[1:]
+cache = FileBasedCache(location, {'KEY_PREFIX': settings.REDIS_CACHE['KEY_PREFIX']})
+if command == 'set':
+    cache.set('tools_app.test_settings', 'shared value', timeout=None)
+else:
+    print(cache.get('tools_app.test_settings'))
+'''
+
+
+class CacheKeyPrefixTest(TestCase):
+    def run_script(self, *args):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE='tools_app.settings')
+        result = subprocess.run([sys.executable, '-c', SCRIPT, *args],
+                                cwd=settings.BASE_DIR,
+                                env=env,
+                                capture_output=True,
+                                text=True,
+                                check=True)
+        return result.stdout.strip()
+
+
+    def test_value_set_in_one_process_is_read_in_another(self):
+        with TemporaryDirectory() as location:
+            self.run_script('set', location)
+            self.assertEqual(self.run_script('get', location), 'shared value')
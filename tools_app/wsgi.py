@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tools_app.settings')
 
 application = get_wsgi_application()
+
+# Load the prefix table before serving, rather than on the first
+# request which needs it.
+from api.prefix_table import load_prefix_table  # pylint: disable=wrong-import-position
+load_prefix_table()
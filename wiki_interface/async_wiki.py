@@ -0,0 +1,114 @@
+"""An asyncio interface to the wiki.
+
+AsyncWiki wraps a Wiki and exposes its long-running queries as async
+iterators, so a view can run the queries for many users concurrently
+(i.e. with asyncio.gather()) instead of one after another.
+
+The underlying mwclient calls are blocking, so each query is run on a
+bounded pool of worker threads.  The pool size defaults to the size of
+the requests connection pool, so every worker gets a kept-alive HTTP
+connection from the (shared) mwclient.Site.  Results are pulled from
+the worker threads in batches to amortize the cost of the thread hop.
+
+"""
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+import asyncio
+import logging
+
+from requests.adapters import DEFAULT_POOLSIZE
+
+
+logger = logging.getLogger('wiki_interface.async_wiki')
+
+
+DEFAULT_MAX_WORKERS = DEFAULT_POOLSIZE
+BATCH_SIZE = 500  # Matches the usual API limit for list queries.
+
+
+class AsyncWiki:
+    """Use this as a context manager, or call close() when you're done
+    with it, to release the worker threads.
+
+    """
+    def __init__(self, wiki, max_workers=DEFAULT_MAX_WORKERS):
+        self.wiki = wiki
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='async_wiki')
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+
+    def user_contributions(self, user_name_or_names, show='', start=None, end=None):
+        """Async version of Wiki.user_contributions()."""
+        return self._aiter(self.wiki.user_contributions, user_name_or_names,
+                           show=show, start=start, end=end)
+
+
+    def deleted_user_contributions(self, user_name, start=None, end=None):
+        """Async version of Wiki.deleted_user_contributions()."""
+        return self._aiter(self.wiki.deleted_user_contributions, user_name, start=start, end=end)
+
+
+    def user_blocks(self, user_name, start=None, end=None):
+        """Async version of Wiki.user_blocks()."""
+        return self._aiter(self.wiki.user_blocks, user_name, start=start, end=end)
+
+
+    def user_log_events(self, user_name, start=None, end=None):
+        """Async version of Wiki.user_log_events()."""
+        return self._aiter(self.wiki.user_log_events, user_name, start=start, end=end)
+
+
+    def get_cu_log(self, user=None, target=None, from_ts=None, to_ts=None):
+        """Async version of Wiki.get_cu_log()."""
+        return self._aiter(self.wiki.get_cu_log, user=user, target=target, from_ts=from_ts, to_ts=to_ts)
+
+
+    def page(self, title):
+        return AsyncPage(self, title)
+
+
+    async def _aiter(self, func, *args, **kwargs):
+        """Call func(*args, **kwargs) on a worker thread, and iterate over
+        the result.
+
+        Some of the Wiki methods are generators and some do their work
+        up front and return a list; calling func() on the worker
+        covers both cases.
+
+        """
+        loop = asyncio.get_running_loop()
+        iterator = await loop.run_in_executor(self._executor, lambda: iter(func(*args, **kwargs)))
+        while True:
+            batch = await loop.run_in_executor(self._executor, list, islice(iterator, BATCH_SIZE))
+            if not batch:
+                return
+            for item in batch:
+                yield item
+
+
+class AsyncPage:
+    def __init__(self, async_wiki, title):
+        self.async_wiki = async_wiki
+        self.title = title
+
+
+    def revisions(self, *, count=None):
+        """Async version of Page.revisions().  Building the Page makes an
+        API call, so that's done on the worker thread as well.
+
+        """
+        def revisions():
+            return self.async_wiki.wiki.page(self.title).revisions(count=count)
+        return self.async_wiki._aiter(revisions)  # pylint: disable=protected-access
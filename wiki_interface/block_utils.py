@@ -1,3 +1,4 @@
+from bisect import bisect_right
 from typing import List
 from dataclasses import dataclass
 from datetime import datetime, timezone
@@ -50,6 +51,152 @@ class UnblockEvent(BaseBlockEvent):
     id: int
 
 
+@dataclass(frozen=True)
+class BlockedPeriod:
+    """A span of time during which a user was blocked.  Start is
+    inclusive, end is exclusive.  For an indef block which is still in
+    effect, end is None.
+
+    """
+    start: datetime
+    end: datetime = None
+
+    def contains(self, timestamp):
+        return self.start <= timestamp and (self.end is None or timestamp < self.end)
+
+
+    def end_or_max(self):
+        return utc_max if self.end is None else self.end
+
+
+class BlockedPeriods:
+    """A user's block history, as a sorted list of non-overlapping
+    BlockedPeriods.
+
+    Block, reblock, unblock, and expiry are all folded in: a block (or
+    reblock) lasts until its expiry, or until the next unblock, and a
+    reblock replaces the expiry of the block it modifies.  Periods
+    which abut are merged.
+
+    Point queries are a bisect over the period start times; batch
+    queries (mask() and select()) are a single merge pass.
+
+    """
+    def __init__(self, periods=()):
+        self.periods = list(periods)
+        self._starts = [p.start for p in self.periods]
+
+
+    @staticmethod
+    def from_events(events):
+        """Events is an iterable of BlockEvents and/or UnblockEvents, in
+        chronological order.
+
+        """
+        periods = []
+        def add(start, end):
+            if periods and periods[-1].end == start:
+                start = periods.pop().start
+            periods.append(BlockedPeriod(start, end))
+
+        start = None  # of the block in effect, if any
+        expiry = None
+        for event in events:
+            if start and expiry and expiry <= event.timestamp:
+                add(start, expiry)
+                start = None
+            if isinstance(event, BlockEvent):
+                start = start or event.timestamp
+                expiry = event.expiry
+            elif start:
+                add(start, event.timestamp)
+                start = None
+        if start:
+            add(start, expiry)
+        return BlockedPeriods(periods)
+
+
+    def __iter__(self):
+        return iter(self.periods)
+
+
+    def __len__(self):
+        return len(self.periods)
+
+
+    def __eq__(self, other):
+        if isinstance(other, BlockedPeriods):
+            return self.periods == other.periods
+        return NotImplemented
+
+
+    def __repr__(self):
+        return f'BlockedPeriods({self.periods!r})'
+
+
+    def contains(self, timestamp):
+        i = bisect_right(self._starts, timestamp)
+        return i > 0 and self.periods[i - 1].contains(timestamp)
+
+
+    def mask(self, timestamps):
+        """Returns a list of bools, one for each of the timestamps (in the
+        same order), saying if that timestamp is in any of the
+        periods.
+
+        """
+        timestamps = list(timestamps)
+        mask = [False] * len(timestamps)
+        i = 0
+        for index in sorted(range(len(timestamps)), key=timestamps.__getitem__):
+            timestamp = timestamps[index]
+            while i < len(self.periods) and self.periods[i].end_or_max() <= timestamp:
+                i += 1
+            mask[index] = i < len(self.periods) and self.periods[i].contains(timestamp)
+        return mask
+
+
+    def select(self, items, key=lambda item: item.timestamp, reverse=False):
+        """Lazily yields the items (i.e. an edit stream) whose key falls
+        in one of the periods.  The items must be sorted by key,
+        newest first if reverse is true.
+
+        """
+        periods = self.periods[::-1] if reverse else self.periods
+        i = 0
+        for item in items:
+            timestamp = key(item)
+            if reverse:
+                while i < len(periods) and timestamp < periods[i].start:
+                    i += 1
+            else:
+                while i < len(periods) and periods[i].end_or_max() <= timestamp:
+                    i += 1
+            if i < len(periods) and periods[i].contains(timestamp):
+                yield item
+
+
+    def intersection(self, other):
+        """Returns the BlockedPeriods during which both self and other
+        are blocked.
+
+        """
+        periods = []
+        i = j = 0
+        while i < len(self.periods) and j < len(other.periods):
+            a = self.periods[i]
+            b = other.periods[j]
+            start = max(a.start, b.start)
+            end = min(a.end_or_max(), b.end_or_max())
+            if start < end:
+                periods.append(BlockedPeriod(start, None if end == utc_max else end))
+            if a.end_or_max() < b.end_or_max():
+                i += 1
+            else:
+                j += 1
+        return BlockedPeriods(periods)
+
+
 @dataclass
 class UserBlockHistory:
     """A representation of a user's block log.
@@ -57,11 +204,15 @@ class UserBlockHistory:
     Constructor takes a iterable of BlockEvents and/or UnblockEvents
     in arbitrary order.
 
+    Queries are answered from the BlockedPeriods built from the
+    events, so expiries are taken into account.
+
     """
     events: List[BaseBlockEvent]
 
     def __init__(self, unordered_events):
         self.events = sorted(unordered_events, key=lambda e: e.timestamp)
+        self.periods = BlockedPeriods.from_events(self.events)
 
 
     def __post_init__(self):
@@ -80,9 +231,16 @@ class UserBlockHistory:
         Returns True if they were, False otherwise.
 
         """
-        is_blocked = False
-        for event in self.events:
-            if event.timestamp > timestamp:
-                break
-            is_blocked = isinstance(event, BlockEvent)
-        return is_blocked
+        return self.periods.contains(timestamp)
+
+
+    def blocked_mask(self, timestamps):
+        """Determine if the user was blocked at each of a batch of
+        timestamps.
+
+        Returns a list of bools, in the same order as timestamps.
+        This is much cheaper than calling is_blocked_at() for each
+        one.
+
+        """
+        return self.periods.mask(timestamps)
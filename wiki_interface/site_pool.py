@@ -0,0 +1,78 @@
+"""A process-wide pool of mwclient.Site objects.
+
+Building a Site is expensive; it opens a new HTTP session and makes a
+siteinfo API call before any real work gets done.  Pooling them lets
+us reuse both the HTTP connection (keep-alive) and the siteinfo across
+requests.
+
+Anonymous sites are shared by everybody and live forever.
+Authenticated sites are keyed by OAuth access token and are evicted
+after they've been idle for idle_timeout seconds.
+
+"""
+import logging
+import threading
+import time
+
+
+logger = logging.getLogger('wiki_interface.site_pool')
+
+
+DEFAULT_IDLE_TIMEOUT = 600  # seconds
+
+
+class SitePool:
+    def __init__(self, idle_timeout=DEFAULT_IDLE_TIMEOUT, clock=time.monotonic):
+        self.idle_timeout = idle_timeout
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._sites = {}  # access token (None for anonymous) -> [site, last_used]
+
+
+    def get(self, access_token, factory):
+        """Return a Site for the given access token.  An access_token of
+        None means anonymous.
+
+        If there is no pooled Site, factory() is called to build one.
+        The factory is called without holding the pool lock, since
+        building a Site requires network traffic.  If two threads race
+        to build the same Site, the first one to finish wins, and the
+        other one is discarded.
+
+        """
+        now = self.clock()
+        with self._lock:
+            self._evict_idle(now)
+            entry = self._sites.get(access_token)
+            if entry:
+                entry[1] = now
+                return entry[0]
+
+        logger.info('building new %s site',
+                    'anonymous' if access_token is None else 'authenticated')
+        site = factory()
+        with self._lock:
+            entry = self._sites.setdefault(access_token, [site, now])
+            return entry[0]
+
+
+    def clear(self):
+        with self._lock:
+            self._sites.clear()
+
+
+    def __len__(self):
+        return len(self._sites)
+
+
+    def _evict_idle(self, now):
+        """Must be called with self._lock held."""
+        expired = [token for token, (_, last_used) in self._sites.items()
+                   if token is not None and now - last_used > self.idle_timeout]
+        for token in expired:
+            del self._sites[token]
+        if expired:
+            logger.info('evicted %d idle site(s)', len(expired))
+
+
+site_pool = SitePool()
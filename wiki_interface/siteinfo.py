@@ -0,0 +1,77 @@
+"""Cached siteinfo (general site data and namespaces).
+
+Siteinfo almost never changes, but mwclient fetches it every time a
+Site is constructed, and Wiki used to rebuild its namespace maps on
+every request.  Here we keep it in the django cache, so a newly built
+Site can be initialized without making the meta=siteinfo API call.
+
+"""
+from dataclasses import dataclass, field
+from typing import Dict
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+logger = logging.getLogger('wiki_interface.siteinfo')
+
+
+SITEINFO_TIMEOUT = 24 * 60 * 60  # seconds
+
+
+@dataclass(frozen=True)
+class SiteInfo:
+    general: dict
+    namespaces: Dict[int, str]
+    namespace_values: Dict[str, int] = field(init=False, compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, 'namespace_values', {v: k for k, v in self.namespaces.items()})
+
+
+    @staticmethod
+    def from_api(meta):
+        """Return a SiteInfo given the result of a query/siteinfo API call
+        with siprop=general|namespaces.
+
+        """
+        namespaces = {ns['id']: ns.get('*', '') for ns in meta['query']['namespaces'].values()}
+        return SiteInfo(meta['query']['general'], namespaces)
+
+
+    def apply(self, site):
+        """Initialize a mwclient.Site (which must have been constructed
+        with do_init=False) from this SiteInfo.  This duplicates the
+        siteinfo part of mwclient.Site.site_init().
+
+        On return, the site is marked as initialized, so calling
+        site.site_init() will just fetch the userinfo.  The SiteInfo
+        itself is left on the site (as site.siteinfo), so Wiki can use
+        its namespace maps without rebuilding them.
+
+        """
+        site.siteinfo = self
+        site.site = self.general
+        site.namespaces = self.namespaces
+        site.writeapi = 'writeapi' in self.general
+        site.version = site.version_tuple_from_generator(self.general['generator'])
+        site.initialized = True
+
+
+def get_siteinfo(site):
+    """Return the SiteInfo for the given mwclient.Site.
+
+    The cache is consulted first.  On a miss, siteinfo is fetched
+    using the site and the result is cached for SITEINFO_TIMEOUT
+    seconds.
+
+    """
+    key = f'wiki_interface.siteinfo.{settings.MEDIAWIKI_SITE_NAME}'
+    siteinfo = cache.get(key)
+    if siteinfo is None:
+        logger.info('fetching siteinfo for %s', settings.MEDIAWIKI_SITE_NAME)
+        meta = site.get('query', meta='siteinfo', siprop='general|namespaces')
+        siteinfo = SiteInfo.from_api(meta)
+        cache.set(key, siteinfo, SITEINFO_TIMEOUT)
+    return siteinfo
@@ -0,0 +1,120 @@
+from datetime import datetime, timezone
+from unittest import TestCase
+from unittest.mock import NonCallableMock
+import asyncio
+import threading
+
+from asgiref.sync import async_to_sync
+
+from wiki_interface.async_wiki import AsyncWiki, BATCH_SIZE
+from wiki_interface.block_utils import BlockEvent
+from wiki_interface.data import WikiContrib, LogEvent
+from wiki_interface.wiki import Wiki, Page, CuLogEntry
+
+
+def _dt(year, month, day):
+    "Construct a UTC-aware datetime."
+    return datetime(year, month, day, tzinfo=timezone.utc)
+
+
+async def collect(aiterable):
+    return [item async for item in aiterable]
+
+
+class AsyncWikiTest(TestCase):
+    def setUp(self):
+        self.wiki = NonCallableMock(Wiki)
+        self.async_wiki = AsyncWiki(self.wiki)
+        self.addCleanup(self.async_wiki.close)
+
+
+    def test_user_contributions(self):
+        contribs = [WikiContrib(2, _dt(2020, 1, 2), 'Fred', 0, 'Foo', ''),
+                    WikiContrib(1, _dt(2020, 1, 1), 'Fred', 0, 'Foo', '')]
+        self.wiki.user_contributions.return_value = iter(contribs)
+
+        result = async_to_sync(collect)(self.async_wiki.user_contributions('Fred', end='2020-01-01T00:00:00'))
+
+        self.wiki.user_contributions.assert_called_once_with('Fred', show='', start=None, end='2020-01-01T00:00:00')
+        self.assertEqual(result, contribs)
+
+
+    def test_deleted_user_contributions(self):
+        contribs = [WikiContrib(1, _dt(2020, 1, 1), 'Fred', 0, 'Foo', '', is_live=False)]
+        self.wiki.deleted_user_contributions.return_value = contribs
+
+        result = async_to_sync(collect)(self.async_wiki.deleted_user_contributions('Fred'))
+
+        self.wiki.deleted_user_contributions.assert_called_once_with('Fred', start=None, end=None)
+        self.assertEqual(result, contribs)
+
+
+    def test_user_blocks(self):
+        blocks = [BlockEvent('Fred', _dt(2020, 1, 1), 1)]
+        self.wiki.user_blocks.return_value = blocks
+
+        result = async_to_sync(collect)(self.async_wiki.user_blocks('Fred'))
+
+        self.wiki.user_blocks.assert_called_once_with('Fred', start=None, end=None)
+        self.assertEqual(result, blocks)
+
+
+    def test_user_log_events(self):
+        events = [LogEvent(1, _dt(2020, 1, 1), 'Fred', 'Foo', 'create', 'create', '')]
+        self.wiki.user_log_events.return_value = iter(events)
+
+        result = async_to_sync(collect)(self.async_wiki.user_log_events('Fred'))
+
+        self.wiki.user_log_events.assert_called_once_with('Fred', start=None, end=None)
+        self.assertEqual(result, events)
+
+
+    def test_get_cu_log(self):
+        entries = [CuLogEntry('Barney', 'reason', 'Fred', _dt(2020, 1, 1), 'userips')]
+        self.wiki.get_cu_log.return_value = entries
+
+        result = async_to_sync(collect)(self.async_wiki.get_cu_log(target='Fred'))
+
+        self.wiki.get_cu_log.assert_called_once_with(user=None, target='Fred', from_ts=None, to_ts=None)
+        self.assertEqual(result, entries)
+
+
+    def test_page_revisions(self):
+        revisions = [WikiContrib(1, _dt(2020, 1, 1), 'Fred', 0, 'Foo', '')]
+        page = NonCallableMock(Page)
+        page.revisions.return_value = iter(revisions)
+        self.wiki.page.return_value = page
+
+        result = async_to_sync(collect)(self.async_wiki.page('Foo').revisions(count=1))
+
+        self.wiki.page.assert_called_once_with('Foo')
+        page.revisions.assert_called_once_with(count=1)
+        self.assertEqual(result, revisions)
+
+
+    def test_results_longer_than_one_batch_are_complete(self):
+        contribs = [WikiContrib(i, _dt(2020, 1, 1), 'Fred', 0, 'Foo', '') for i in range(BATCH_SIZE * 2 + 1)]
+        self.wiki.user_contributions.return_value = iter(contribs)
+
+        result = async_to_sync(collect)(self.async_wiki.user_contributions('Fred'))
+
+        self.assertEqual(result, contribs)
+
+
+    def test_wiki_calls_run_concurrently(self):
+        # Each call blocks until both have started; if the calls were
+        # serialized, this would time out.
+        barrier = threading.Barrier(2, timeout=5)
+        def user_blocks(user_name, **kwargs):
+            barrier.wait()
+            return [BlockEvent(user_name, _dt(2020, 1, 1), 1)]
+        self.wiki.user_blocks.side_effect = user_blocks
+
+        async def fan_out():
+            return await asyncio.gather(collect(self.async_wiki.user_blocks('Fred')),
+                                        collect(self.async_wiki.user_blocks('Wilma')))
+
+        fred, wilma = async_to_sync(fan_out)()
+
+        self.assertEqual(fred, [BlockEvent('Fred', _dt(2020, 1, 1), 1)])
+        self.assertEqual(wilma, [BlockEvent('Wilma', _dt(2020, 1, 1), 1)])
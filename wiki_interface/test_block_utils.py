@@ -1,7 +1,7 @@
 from unittest import TestCase
 from datetime import datetime, timezone
 
-from wiki_interface.block_utils import BlockEvent, UnblockEvent, UserBlockHistory
+from wiki_interface.block_utils import BlockEvent, BlockedPeriod, BlockedPeriods, UnblockEvent, UserBlockHistory
 
 
 # Note: In all of these tests, it is assumed that the last three
@@ -92,3 +92,111 @@ class TestUserBlockHistory(TestCase):
                                     UnblockEvent("fred", _dt(2019, 1, 3), 1001)])
 
         self.assertTrue(history.is_blocked_at(_dt(2019, 1, 2)))
+
+
+    def test_is_blocked_at_after_expiry(self):
+        history = UserBlockHistory([BlockEvent("fred", _dt(2019, 1, 1), 1000, _dt(2019, 1, 3))])
+
+        self.assertFalse(history.is_blocked_at(_dt(2018, 12, 31)))
+        self.assertTrue(history.is_blocked_at(_dt(2019, 1, 1)))
+        self.assertTrue(history.is_blocked_at(_dt(2019, 1, 2)))
+        self.assertFalse(history.is_blocked_at(_dt(2019, 1, 3)))
+
+
+    def test_is_blocked_at_with_reblock_extending_expiry(self):
+        history = UserBlockHistory([BlockEvent("fred", _dt(2019, 1, 1), 1000, _dt(2019, 1, 3)),
+                                    BlockEvent("fred", _dt(2019, 1, 2), 1001, _dt(2019, 1, 5), is_reblock=True)])
+
+        self.assertTrue(history.is_blocked_at(_dt(2019, 1, 4)))
+        self.assertFalse(history.is_blocked_at(_dt(2019, 1, 5)))
+
+
+    def test_is_blocked_at_with_block_after_expiry(self):
+        history = UserBlockHistory([BlockEvent("fred", _dt(2019, 1, 1), 1000, _dt(2019, 1, 2)),
+                                    BlockEvent("fred", _dt(2019, 1, 5), 1001)])
+
+        self.assertFalse(history.is_blocked_at(_dt(2019, 1, 3)))
+        self.assertTrue(history.is_blocked_at(_dt(2020, 1, 1)))
+
+
+    def test_blocked_mask(self):
+        history = UserBlockHistory([BlockEvent("fred", _dt(2019, 1, 1), 1000, _dt(2019, 1, 3)),
+                                    BlockEvent("fred", _dt(2019, 1, 5), 1001),
+                                    UnblockEvent("fred", _dt(2019, 1, 7), 1002)])
+        timestamps = [_dt(2019, 1, d) for d in (8, 2, 4, 6, 1, 7, 5, 3)]
+
+        mask = history.blocked_mask(timestamps)
+
+        self.assertEqual(mask, [False, True, False, True, True, False, True, False])
+        self.assertEqual(mask, [history.is_blocked_at(t) for t in timestamps])
+
+
+    def test_blocked_mask_with_no_events(self):
+        self.assertEqual(UserBlockHistory([]).blocked_mask([_dt(2019, 1, 1)]), [False])
+
+
+
+class BlockedPeriodsTest(TestCase):
+    def test_from_events_with_no_events(self):
+        self.assertEqual(BlockedPeriods.from_events([]), BlockedPeriods())
+
+
+    def test_from_events_merges_block_reblock_unblock_and_expiry(self):
+        events = [BlockEvent("fred", _dt(2019, 1, 1), 1, _dt(2019, 1, 3)),
+                  BlockEvent("fred", _dt(2019, 1, 2), 2, _dt(2019, 1, 10), is_reblock=True),
+                  UnblockEvent("fred", _dt(2019, 1, 5), 3),
+                  BlockEvent("fred", _dt(2019, 2, 1), 4, _dt(2019, 2, 2)),
+                  BlockEvent("fred", _dt(2019, 2, 2), 5, _dt(2019, 2, 4)),
+                  BlockEvent("fred", _dt(2019, 3, 1), 6)]
+
+        periods = BlockedPeriods.from_events(events)
+
+        self.assertEqual(list(periods), [BlockedPeriod(_dt(2019, 1, 1), _dt(2019, 1, 5)),
+                                         BlockedPeriod(_dt(2019, 2, 1), _dt(2019, 2, 4)),
+                                         BlockedPeriod(_dt(2019, 3, 1), None)])
+
+
+    def test_unblock_without_block_is_ignored(self):
+        periods = BlockedPeriods.from_events([UnblockEvent("fred", _dt(2019, 1, 1), 1)])
+
+        self.assertEqual(list(periods), [])
+
+
+    def test_contains(self):
+        periods = BlockedPeriods([BlockedPeriod(_dt(2019, 1, 1), _dt(2019, 1, 3)),
+                                  BlockedPeriod(_dt(2019, 2, 1))])
+
+        self.assertFalse(periods.contains(_dt(2018, 1, 1)))
+        self.assertTrue(periods.contains(_dt(2019, 1, 1)))
+        self.assertFalse(periods.contains(_dt(2019, 1, 3)))
+        self.assertTrue(periods.contains(_dt(2030, 1, 1)))
+
+
+    def test_mask(self):
+        periods = BlockedPeriods([BlockedPeriod(_dt(2019, 1, 1), _dt(2019, 1, 3)),
+                                  BlockedPeriod(_dt(2019, 2, 1))])
+        timestamps = [_dt(2019, 3, 1), _dt(2019, 1, 2), _dt(2019, 1, 5), _dt(2018, 1, 1)]
+
+        self.assertEqual(periods.mask(timestamps), [True, True, False, False])
+
+
+    def test_select(self):
+        periods = BlockedPeriods([BlockedPeriod(_dt(2019, 1, 2), _dt(2019, 1, 4)),
+                                  BlockedPeriod(_dt(2019, 1, 6), _dt(2019, 1, 7))])
+        days = list(range(1, 9))
+
+        selected = list(periods.select(days, key=lambda d: _dt(2019, 1, d)))
+        selected_reversed = list(periods.select(reversed(days), key=lambda d: _dt(2019, 1, d), reverse=True))
+
+        self.assertEqual(selected, [2, 3, 6])
+        self.assertEqual(selected_reversed, [6, 3, 2])
+
+
+    def test_intersection(self):
+        a = BlockedPeriods([BlockedPeriod(_dt(2019, 1, 1), _dt(2019, 1, 5)),
+                            BlockedPeriod(_dt(2019, 2, 1))])
+        b = BlockedPeriods([BlockedPeriod(_dt(2019, 1, 3), _dt(2019, 2, 3))])
+
+        self.assertEqual(list(a.intersection(b)), [BlockedPeriod(_dt(2019, 1, 3), _dt(2019, 1, 5)),
+                                                   BlockedPeriod(_dt(2019, 2, 1), _dt(2019, 2, 3))])
+        self.assertEqual(list(a.intersection(a)), list(a))
@@ -0,0 +1,94 @@
+from unittest import TestCase
+from unittest.mock import Mock
+
+from wiki_interface.site_pool import SitePool
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class SitePoolTest(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.pool = SitePool(idle_timeout=100, clock=self.clock)
+
+
+    def test_get_calls_factory_on_first_use(self):
+        factory = Mock()
+
+        site = self.pool.get(None, factory)
+
+        factory.assert_called_once_with()
+        self.assertIs(site, factory.return_value)
+
+
+    def test_anonymous_site_is_reused(self):
+        factory = Mock()
+
+        site1 = self.pool.get(None, factory)
+        site2 = self.pool.get(None, factory)
+
+        factory.assert_called_once_with()
+        self.assertIs(site1, site2)
+
+
+    def test_authenticated_sites_are_keyed_by_token(self):
+        factory = Mock(side_effect=lambda: Mock())
+
+        site1 = self.pool.get('token1', factory)
+        site2 = self.pool.get('token2', factory)
+        site3 = self.pool.get('token1', factory)
+
+        self.assertEqual(factory.call_count, 2)
+        self.assertIsNot(site1, site2)
+        self.assertIs(site1, site3)
+
+
+    def test_idle_authenticated_site_is_evicted(self):
+        factory = Mock(side_effect=lambda: Mock())
+
+        site1 = self.pool.get('token', factory)
+        self.clock.now = 101
+        site2 = self.pool.get('token', factory)
+
+        self.assertEqual(factory.call_count, 2)
+        self.assertIsNot(site1, site2)
+
+
+    def test_use_resets_idle_timer(self):
+        factory = Mock(side_effect=lambda: Mock())
+
+        site1 = self.pool.get('token', factory)
+        self.clock.now = 60
+        self.pool.get('token', factory)
+        self.clock.now = 120
+        site2 = self.pool.get('token', factory)
+
+        factory.assert_called_once_with()
+        self.assertIs(site1, site2)
+
+
+    def test_anonymous_site_is_never_evicted(self):
+        factory = Mock(side_effect=lambda: Mock())
+
+        site1 = self.pool.get(None, factory)
+        self.clock.now = 1_000_000
+        site2 = self.pool.get(None, factory)
+
+        factory.assert_called_once_with()
+        self.assertIs(site1, site2)
+
+
+    def test_clear_empties_pool(self):
+        self.pool.get(None, Mock())
+        self.pool.get('token', Mock())
+        self.assertEqual(len(self.pool), 2)
+
+        self.pool.clear()
+
+        self.assertEqual(len(self.pool), 0)
@@ -0,0 +1,69 @@
+from unittest import TestCase
+from unittest.mock import patch, Mock
+
+import mwclient
+
+from wiki_interface.siteinfo import SiteInfo, get_siteinfo, SITEINFO_TIMEOUT
+
+
+API_RESULT = {
+    'query': {
+        'general': {'generator': 'MediaWiki 1.40.0-wmf.1',
+                    'writeapi': ''},
+        'namespaces': {
+            '0': {'id': 0, 'case': 'first-letter', '*': ''},
+            '2': {'id': 2, 'case': 'first-letter', '*': 'User'},
+            '-1': {'id': -1, 'case': 'first-letter', '*': 'Special'},
+        },
+    },
+}
+
+
+class SiteInfoTest(TestCase):
+    def test_from_api_builds_namespace_maps(self):
+        siteinfo = SiteInfo.from_api(API_RESULT)
+
+        self.assertEqual(siteinfo.namespaces, {0: '', 2: 'User', -1: 'Special'})
+        self.assertEqual(siteinfo.namespace_values, {'': 0, 'User': 2, 'Special': -1})
+        self.assertEqual(siteinfo.general, API_RESULT['query']['general'])
+
+
+    def test_apply_initializes_site(self):
+        siteinfo = SiteInfo.from_api(API_RESULT)
+        site = mwclient.Site('example.com', do_init=False)
+
+        siteinfo.apply(site)
+
+        self.assertTrue(site.initialized)
+        self.assertIs(site.siteinfo, siteinfo)
+        self.assertTrue(site.writeapi)
+        self.assertEqual(site.namespaces, {0: '', 2: 'User', -1: 'Special'})
+        self.assertEqual(site.version, (1, 40, 0, '-wmf', 1))
+
+
+@patch('wiki_interface.siteinfo.cache')
+class GetSiteInfoTest(TestCase):
+    def test_cache_miss_fetches_and_caches_siteinfo(self, mock_cache):
+        mock_cache.get.return_value = None
+        site = Mock(mwclient.Site)
+        site.get.return_value = API_RESULT
+
+        siteinfo = get_siteinfo(site)
+
+        site.get.assert_called_once_with('query', meta='siteinfo', siprop='general|namespaces')
+        self.assertEqual(siteinfo, SiteInfo.from_api(API_RESULT))
+        mock_cache.set.assert_called_once_with('wiki_interface.siteinfo.example.com',
+                                               siteinfo,
+                                               SITEINFO_TIMEOUT)
+
+
+    def test_cache_hit_makes_no_api_call(self, mock_cache):
+        cached = SiteInfo.from_api(API_RESULT)
+        mock_cache.get.return_value = cached
+        site = Mock(mwclient.Site)
+
+        siteinfo = get_siteinfo(site)
+
+        site.get.assert_not_called()
+        mock_cache.set.assert_not_called()
+        self.assertIs(siteinfo, cached)
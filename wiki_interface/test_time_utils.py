@@ -2,9 +2,25 @@ from unittest import TestCase
 import time
 import datetime
 
-from wiki_interface.time_utils import struct_to_datetime
+from wiki_interface.time_utils import api_timestamp, struct_to_datetime
 
 class StructToDatetimeTest(TestCase):
     def test_convert(self):
         self.assertEqual(struct_to_datetime(time.struct_time((2001, 1, 2, 0, 0, 0, 0, 0, 0))),
                          datetime.datetime(2001, 1, 2, tzinfo=datetime.timezone.utc))
+
+
+class ApiTimestampTest(TestCase):
+    def test_aware(self):
+        tz = datetime.timezone(datetime.timedelta(hours=-5))
+        self.assertEqual(api_timestamp(datetime.datetime(2001, 1, 2, 19, 30, tzinfo=tz)),
+                         '2001-01-03T00:30:00Z')
+
+
+    def test_naive(self):
+        self.assertEqual(api_timestamp(datetime.datetime(2001, 1, 2)), '2001-01-02T00:00:00Z')
+
+
+    def test_passes_through_none_and_strings(self):
+        self.assertIsNone(api_timestamp(None))
+        self.assertEqual(api_timestamp('2001-01-02T00:00:00'), '2001-01-02T00:00:00')
@@ -8,6 +8,7 @@ from logging import getLogger
 from dateutil.parser import isoparse
 from django.conf import settings
 from django.http import HttpRequest
+from django.test import override_settings
 from asgiref.sync import async_to_sync
 
 import mwclient
@@ -15,8 +16,9 @@ import mwclient.util
 import mwclient.errors
 
 from wiki_interface.data import WikiContrib, LogEvent
-from wiki_interface.wiki import Wiki, Page, Category, MAX_UCUSER, CuLogEntry
+from wiki_interface.wiki import Wiki, Page, Category, MAX_BKUSERS, MAX_TITLES, MAX_UCUSER, CuLogEntry
 from wiki_interface.block_utils import BlockEvent, UnblockEvent
+from wiki_interface.site_pool import site_pool
 
 class ConstructorTest(TestCase):
     # pylint: disable=invalid-name
@@ -34,7 +36,8 @@ class ConstructorTest(TestCase):
         self.MockSiteClass.assert_called_once()
         args, kwargs = self.MockSiteClass.call_args
         self.assertEqual(args, (settings.MEDIAWIKI_SITE_NAME,))
-        self.assertEqual(kwargs, {'clients_useragent': settings.MEDIAWIKI_USER_AGENT})
+        self.assertEqual(kwargs, {'clients_useragent': settings.MEDIAWIKI_USER_AGENT,
+                                  'do_init': False})
 
 
     @patch('django.contrib.auth.get_user')
@@ -46,7 +49,8 @@ class ConstructorTest(TestCase):
         self.MockSiteClass.assert_called_once()
         args, kwargs = self.MockSiteClass.call_args
         self.assertEqual(args, (settings.MEDIAWIKI_SITE_NAME,))
-        self.assertEqual(kwargs, {'clients_useragent': settings.MEDIAWIKI_USER_AGENT})
+        self.assertEqual(kwargs, {'clients_useragent': settings.MEDIAWIKI_USER_AGENT,
+                                  'do_init': False})
 
 
     @patch('django.contrib.auth.get_user')
@@ -59,6 +63,7 @@ class ConstructorTest(TestCase):
         args, kwargs = self.MockSiteClass.call_args
         self.assertEqual(args, (settings.MEDIAWIKI_SITE_NAME,))
         self.assertEqual(set(kwargs.keys()), {'clients_useragent',
+                                              'do_init',
                                               'consumer_token',
                                               'consumer_secret',
                                               'access_token',
@@ -66,6 +71,88 @@ class ConstructorTest(TestCase):
         self.assertEqual(kwargs['clients_useragent'], settings.MEDIAWIKI_USER_AGENT)
 
 
+    def test_wiki_construction_with_anonymous_request_does_not_fetch_userinfo(self):
+        Wiki()
+
+        self.MockSiteClass.return_value.site_init.assert_not_called()
+
+
+    @patch('django.contrib.auth.get_user')
+    def test_wiki_construction_with_authenticated_request_fetches_userinfo(self, mock_get_user):
+        mock_get_user().is_anonymous = False
+
+        Wiki(HttpRequest())
+
+        self.MockSiteClass.return_value.site_init.assert_called_once_with()
+
+
+    @patch('django.contrib.auth.get_user')
+    def test_wiki_construction_with_invalid_oauth_authorization_raises_oauth_error(self, mock_get_user):
+        mock_get_user().is_anonymous = False
+        error = mwclient.errors.APIError('mwoauth-invalid-authorization', 'bad token', {})
+        self.MockSiteClass.return_value.site_init.side_effect = error
+
+        with self.assertRaises(mwclient.errors.OAuthAuthorizationError):
+            Wiki(HttpRequest())
+
+
+class PooledConstructorTest(TestCase):
+    # pylint: disable=invalid-name
+
+    def setUp(self):
+        settings_override = override_settings(MEDIAWIKI_SITE_POOL_ENABLED=True)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        site_patcher = patch('wiki_interface.wiki.Site', autospec=True)
+        self.MockSiteClass = site_patcher.start()
+        self.MockSiteClass.return_value.namespaces = {}
+        self.addCleanup(site_patcher.stop)
+        site_pool.clear()
+        self.addCleanup(site_pool.clear)
+
+
+    def test_anonymous_wikis_share_site(self):
+        wiki1 = Wiki()
+        wiki2 = Wiki()
+
+        self.MockSiteClass.assert_called_once()
+        self.assertIs(wiki1.site, wiki2.site)
+
+
+    def test_namespace_maps_are_built_once(self):
+        wiki1 = Wiki()
+        wiki2 = Wiki()
+
+        self.assertIs(wiki1.namespaces, wiki2.namespaces)
+        self.assertIs(wiki1.namespace_values, wiki2.namespace_values)
+
+
+    @patch('django.contrib.auth.get_user')
+    def test_authenticated_wikis_with_same_token_share_site(self, mock_get_user):
+        mock_get_user().is_anonymous = False
+        mock_get_user().social_auth.get().extra_data = {
+            'access_token': {'oauth_token': 'token', 'oauth_token_secret': 'secret'}}
+
+        wiki1 = Wiki(HttpRequest())
+        wiki2 = Wiki(HttpRequest())
+
+        self.MockSiteClass.assert_called_once()
+        self.assertIs(wiki1.site, wiki2.site)
+
+
+    @patch('django.contrib.auth.get_user')
+    def test_authenticated_wikis_with_different_tokens_get_different_sites(self, mock_get_user):
+        mock_get_user().is_anonymous = False
+        mock_get_user().social_auth.get().extra_data = {
+            'access_token': {'oauth_token': 'token1', 'oauth_token_secret': 'secret'}}
+        Wiki(HttpRequest())
+        mock_get_user().social_auth.get().extra_data = {
+            'access_token': {'oauth_token': 'token2', 'oauth_token_secret': 'secret'}}
+        Wiki(HttpRequest())
+
+        self.assertEqual(self.MockSiteClass.call_count, 2)
+
+
 
 class WikiTestCase(TestCase):
     def setUp(self):
@@ -81,8 +168,10 @@ class NamespaceTest(WikiTestCase):
     # pylint: disable=invalid-name
 
     def test_namespaces(self):
-        self.mock_site.namespaces = {0: '',
-                                     1: 'Whatever'}
+        self.mock_site.get.return_value = {
+            'query': {'general': {'generator': 'MediaWiki 1.40.0'},
+                      'namespaces': {'0': {'id': 0, '*': ''},
+                                     '1': {'id': 1, '*': 'Whatever'}}}}
         wiki = Wiki()
 
         self.assertEqual(wiki.namespaces[0], '')
@@ -91,6 +180,19 @@ class NamespaceTest(WikiTestCase):
         self.assertEqual(wiki.namespace_values['Whatever'], 1)
 
 
+class CanViewDeletedTest(WikiTestCase):
+    def test_admin_can_view_deleted(self):
+        self.mock_site.rights = ['read', 'deletedhistory']
+
+        self.assertTrue(Wiki().can_view_deleted())
+
+
+    def test_non_admin_cannot_view_deleted(self):
+        self.mock_site.rights = ['read']
+
+        self.assertFalse(Wiki().can_view_deleted())
+
+
 class WikiContribTest(TestCase):
     def test_construct_default(self):
         contrib = WikiContrib(999, datetime(2020, 7, 30), 'user', 0, 'title', 'comment')
@@ -136,6 +238,7 @@ class UserContributionsTest(WikiTestCase):
             'fred',
             prop='ids|title|timestamp|comment|flags|tags',
             show='',
+            start=None,
             end=None)
         self.assertIsInstance(contributions[0], WikiContrib)
         self.assertEqual(contributions, [
@@ -159,6 +262,7 @@ class UserContributionsTest(WikiTestCase):
             'bob|alice',
             prop='ids|title|timestamp|comment|flags|tags',
             show='',
+            start=None,
             end=None)
         self.assertIsInstance(contributions[0], WikiContrib)
         self.assertEqual(contributions, [
@@ -211,10 +315,12 @@ class UserContributionsTest(WikiTestCase):
                                '|40|41|42|43|44|45|46|47|48|49',
                                prop='ids|title|timestamp|comment|flags|tags',
                                show='',
+                               start=None,
                                end=None),
                           call('50|51|52|53|54',
                                prop='ids|title|timestamp|comment|flags|tags',
                                show='',
+                               start=None,
                                end=None),
                          ])
         self.assertEqual(contributions, [
@@ -278,10 +384,27 @@ class UserContributionsTest(WikiTestCase):
             'fred',
             prop='ids|title|timestamp|comment|flags|tags',
             show='',
+            start=None,
             end='2020-01-01T00:00:00')
         self.assertEqual(contributions, [])
 
 
+    def test_user_contributions_converts_datetime_bounds(self):
+        self.mock_site.usercontributions.return_value = []
+        wiki = Wiki()
+
+        list(wiki.user_contributions('fred',
+                                     start=datetime(2020, 2, 1, tzinfo=timezone.utc),
+                                     end=datetime(2020, 1, 1, tzinfo=timezone.utc)))
+
+        self.mock_site.usercontributions.assert_called_once_with(
+            'fred',
+            prop='ids|title|timestamp|comment|flags|tags',
+            show='',
+            start='2020-02-01T00:00:00Z',
+            end='2020-01-01T00:00:00Z')
+
+
 class DeletedUserContributionsTest(WikiTestCase):
     # pylint: disable=invalid-name
 
@@ -462,6 +585,21 @@ class DeletedUserContributionsTest(WikiTestCase):
             ])
 
 
+    @patch('wiki_interface.wiki.List')
+    def test_deleted_user_contributions_passes_bounds(self, mock_List):
+        mock_List().__iter__ = Mock(return_value=iter([]))
+        mock_List.generate_kwargs.side_effect = mwclient.listing.List.generate_kwargs
+        wiki = Wiki()
+
+        list(wiki.deleted_user_contributions('fred', start=datetime(2020, 2, 1, tzinfo=timezone.utc)))
+
+        args, kwargs = mock_List.call_args
+        self.assertEqual(kwargs, {'uselang': None,
+                                  'adruser': 'fred',
+                                  'adrprop': 'ids|title|timestamp|comment|flags|tags',
+                                  'adrstart': '2020-02-01T00:00:00Z'})
+
+
 class UserBlocksTest(WikiTestCase):
     # pylint: disable=invalid-name
 
@@ -592,7 +730,7 @@ class MultiUserBlocksTest(WikiTestCase):
         blocks = async_to_sync(wiki.multi_user_blocks)(['fred'])
 
         self.assertEqual(blocks, [])
-        self.mock_site.logevents.assert_called_once_with(title='User:fred', type='block')
+        self.mock_site.logevents.assert_called_once_with(title='User:fred', type='block', start=None, end=None)
 
 
     def test_multi_user_blocks_with_one_user_and_multiple_blocks_returns_correct_list(self):
@@ -622,7 +760,7 @@ class MultiUserBlocksTest(WikiTestCase):
             BlockEvent('fred', isoparse(mar_1), 101, isoparse(apr_1)),
             BlockEvent('fred', isoparse(jan_1), 102, isoparse(feb_1)),
         ])
-        self.mock_site.logevents.assert_called_once_with(title='User:fred', type='block')
+        self.mock_site.logevents.assert_called_once_with(title='User:fred', type='block', start=None, end=None)
 
 
     def test_multi_user_blocks_with_two_user_and_one_block_each_returns_correct_list(self):
@@ -648,13 +786,14 @@ class MultiUserBlocksTest(WikiTestCase):
                  'action': 'block'},
             ],
         }
-        self.mock_site.logevents.side_effect = lambda title, type: logevents_data[title]
+        self.mock_site.logevents.side_effect = lambda title, **kwargs: logevents_data[title]
         wiki = Wiki()
 
         blocks = async_to_sync(wiki.multi_user_blocks)(['fred', 'wilma'])
 
-        self.mock_site.logevents.assert_has_calls([call(title='User:fred', type='block'),
-                                                call(title='User:wilma', type='block')])
+        self.mock_site.logevents.assert_has_calls([call(title='User:fred', type='block', start=None, end=None),
+                                                call(title='User:wilma', type='block', start=None, end=None)],
+                                               any_order=True)
         self.assertEqual(blocks, [
             BlockEvent('wilma', isoparse(mar_1), 2, isoparse(apr_1)),
             BlockEvent('fred', isoparse(jan_1), 1, isoparse(feb_1)),
@@ -700,13 +839,14 @@ class MultiUserBlocksTest(WikiTestCase):
                  'action': 'block'},
             ],
         }
-        self.mock_site.logevents.side_effect = lambda title, type: logevents_data[title]
+        self.mock_site.logevents.side_effect = lambda title, **kwargs: logevents_data[title]
         wiki = Wiki()
 
         blocks = async_to_sync(wiki.multi_user_blocks)(['fred', 'wilma'])
 
-        self.mock_site.logevents.assert_has_calls([call(title='User:fred', type='block'),
-                                                call(title='User:wilma', type='block')])
+        self.mock_site.logevents.assert_has_calls([call(title='User:fred', type='block', start=None, end=None),
+                                                call(title='User:wilma', type='block', start=None, end=None)],
+                                               any_order=True)
         self.assertEqual(blocks, [
             BlockEvent('fred', isoparse(jul_1), 1, isoparse(aug_1)),
             BlockEvent('wilma', isoparse(may_1), 3, isoparse(jun_1)),
@@ -715,6 +855,62 @@ class MultiUserBlocksTest(WikiTestCase):
         ])
 
 
+    def test_multi_user_blocks_without_full_history_uses_current_blocks(self):
+        self.mock_site.blocks.return_value = iter([
+            {'id': 7,
+             'user': 'fred',
+             'timestamp': mwclient.util.parse_timestamp('2020-01-01T00:00:00Z'),
+             'expiry': 'infinity'},
+        ])
+        wiki = Wiki()
+
+        blocks = async_to_sync(wiki.multi_user_blocks)(['fred', 'wilma'], full_history=False)
+
+        self.mock_site.logevents.assert_not_called()
+        self.assertEqual(blocks, [BlockEvent('fred', isoparse('2020-01-01T00:00:00Z'), 7)])
+
+
+class CurrentBlocksTest(WikiTestCase):
+    def test_current_blocks_batches_users(self):
+        names = [f'user{i}' for i in range(MAX_BKUSERS + 5)]
+        blocks_data = {
+            '|'.join(names[:MAX_BKUSERS]): [
+                {'id': 2,
+                 'user': 'user1',
+                 'timestamp': mwclient.util.parse_timestamp('2020-03-01T00:00:00Z'),
+                 'expiry': '2020-04-01T00:00:00Z'},
+                {'id': 1,
+                 'user': 'user0',
+                 'timestamp': mwclient.util.parse_timestamp('2020-01-01T00:00:00Z'),
+                 'expiry': 'infinity'},
+            ],
+            '|'.join(names[MAX_BKUSERS:]): [
+                {'id': 3,
+                 'user': f'user{MAX_BKUSERS}',
+                 'timestamp': mwclient.util.parse_timestamp('2020-02-01T00:00:00Z'),
+                 'expiry': 'infinity'},
+            ],
+        }
+        self.mock_site.blocks.side_effect = lambda users, prop: iter(blocks_data[users])
+        wiki = Wiki()
+
+        blocks = wiki.current_blocks(names)
+
+        self.assertEqual(self.mock_site.blocks.call_count, 2)
+        self.assertEqual(blocks, [
+            BlockEvent('user1', isoparse('2020-03-01T00:00:00Z'), 2, isoparse('2020-04-01T00:00:00Z')),
+            BlockEvent(f'user{MAX_BKUSERS}', isoparse('2020-02-01T00:00:00Z'), 3),
+            BlockEvent('user0', isoparse('2020-01-01T00:00:00Z'), 1),
+        ])
+
+
+    def test_current_blocks_with_no_users_makes_no_calls(self):
+        wiki = Wiki()
+
+        self.assertEqual(wiki.current_blocks([]), [])
+        self.mock_site.blocks.assert_not_called()
+
+
 class UserLogsTest(WikiTestCase):
     # pylint: disable=invalid-name
 
@@ -830,6 +1026,76 @@ class GetPageTest(WikiTestCase):
         self.assertIsInstance(page, Page)
 
 
+class GetPagesTest(WikiTestCase):
+    def test_get_pages_batches_titles(self):
+        titles = [f'Page {i}' for i in range(MAX_TITLES + 1)]
+        def get(action, **kwargs):
+            chunk = kwargs['titles'].split('|')
+            return {'query': {'pages': {str(-i): {'ns': 0, 'title': t, 'missing': ''} if t == 'Page 0'
+                                        else {'ns': 0, 'title': t, 'pageid': i}
+                                        for i, t in enumerate(chunk, 1)}}}
+        wiki = Wiki()
+        self.mock_site.get.reset_mock()
+        self.mock_site.get.side_effect = get
+
+        pages = wiki.get_pages(titles + titles[:1])
+
+        self.assertEqual(self.mock_site.get.call_count, 2)
+        self.assertEqual(list(pages), titles)
+        self.assertFalse(pages['Page 0'].exists())
+        self.assertTrue(pages['Page 1'].exists())
+        self.assertEqual(pages['Page 1'].title(), 'Page 1')
+
+
+    def test_get_pages_maps_normalized_titles_back(self):
+        wiki = Wiki()
+        self.mock_site.get.return_value = {
+            'query': {'normalized': [{'from': 'foo_bar', 'to': 'Foo bar'}],
+                      'pages': {'1': {'ns': 0, 'title': 'Foo bar', 'pageid': 1}}}}
+
+        pages = wiki.get_pages(['foo_bar'])
+
+        self.assertEqual(list(pages), ['foo_bar'])
+        self.assertEqual(pages['foo_bar'].title(), 'Foo bar')
+
+
+    def test_get_pages_skips_invalid_titles(self):
+        wiki = Wiki()
+        self.mock_site.get.return_value = {
+            'query': {'pages': {'-1': {'title': 'Foo|', 'invalid': '', 'invalidreason': 'bad'}}}}
+
+        with self.assertLogs('wiki_interface', level='WARNING'):
+            pages = wiki.get_pages(['Foo|'])
+
+        self.assertEqual(pages, {})
+
+
+    def test_get_pages_last_rev_id(self):
+        wiki = Wiki()
+        self.mock_site.get.return_value = {
+            'query': {'pages': {'1': {'ns': 0, 'title': 'Foo', 'pageid': 1, 'lastrevid': 1234},
+                                '-1': {'ns': 0, 'title': 'Bar', 'missing': ''}}}}
+
+        pages = wiki.get_pages(['Foo', 'Bar'])
+
+        self.assertEqual(pages['Foo'].last_rev_id(), 1234)
+        self.assertEqual(pages['Bar'].last_rev_id(), 0)
+
+
+class PageTitlesTest(WikiTestCase):
+    def test_page_titles(self):
+        wiki = Wiki()
+        self.mock_site.allpages.return_value = iter(['Wikipedia:Foo/Bar', 'Wikipedia:Foo/Baz'])
+
+        titles = list(wiki.page_titles('Foo/', namespace=4))
+
+        self.assertEqual(titles, ['Wikipedia:Foo/Bar', 'Wikipedia:Foo/Baz'])
+        self.mock_site.allpages.assert_called_once_with(prefix='Foo/',
+                                                        namespace=4,
+                                                        filterredir='nonredirects',
+                                                        generator=False)
+
+
 class PageTest(WikiTestCase):
     #pylint: disable=invalid-name
 
@@ -6,3 +6,16 @@ def struct_to_datetime(struct_time):
 
     """
     return datetime.fromtimestamp(mktime(struct_time), tz=timezone.utc)
+
+
+def api_timestamp(value):
+    """Convert a datetime to the ISO 8601 UTC form the API expects.
+    Naive datetimes are assumed to be UTC.  None and strings are
+    passed through unchanged.
+
+    """
+    if not isinstance(value, datetime):
+        return value
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.strftime('%Y-%m-%dT%H:%M:%SZ')
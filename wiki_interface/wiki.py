@@ -29,9 +29,12 @@ import mwclient
 from dateutil.parser import isoparse
 from more_itertools import always_iterable, chunked, consume
 
+from wiki_interface.async_wiki import AsyncWiki
 from wiki_interface.data import WikiContrib, LogEvent
 from wiki_interface.block_utils import BlockEvent, UnblockEvent
-from wiki_interface.time_utils import struct_to_datetime
+from wiki_interface.site_pool import site_pool
+from wiki_interface.siteinfo import get_siteinfo
+from wiki_interface.time_utils import api_timestamp, struct_to_datetime
 
 
 logger = logging.getLogger('wiki_interface')
@@ -39,6 +42,8 @@ logger = logging.getLogger('wiki_interface')
 
 MAX_UCUSER = 50  # See https://www.mediawiki.org/wiki/API:Usercontribs.
 MAX_USUSER = 50  # See https://www.mediawiki.org/wiki/API:Users
+MAX_BKUSERS = 50  # See https://www.mediawiki.org/wiki/API:Blocks
+MAX_TITLES = 50  # See https://www.mediawiki.org/wiki/API:Query
 
 
 @dataclass(frozen=True)
@@ -77,14 +82,21 @@ class Wiki:
     """
     def __init__(self, request=None):
         self.site = self._get_mw_site(request)
-        self.namespaces = self.site.namespaces
-        self.namespace_values = {v: k for k, v in self.namespaces.items()}
+        self.namespaces = self.site.siteinfo.namespaces
+        self.namespace_values = self.site.siteinfo.namespace_values
         self.reqeust = request
         self.request_id = request and request.META.get('HTTP_X_REQUEST_ID')
 
 
     @staticmethod
     def _get_mw_site(request):
+        """Return a mwclient.Site appropriate for this request.
+
+        Sites are shared across requests via site_pool, keyed by the
+        OAuth access token.  If settings.MEDIAWIKI_SITE_POOL_ENABLED
+        is false, a new Site is built every time.
+
+        """
         user = request and django.contrib.auth.get_user(request)
 
         # It's not clear if we need to bother checking to see if the user
@@ -92,6 +104,7 @@ class Wiki:
         # works?  If so, these two code paths could be merged.
         if user is None or user.is_anonymous:
             auth_info = {}
+            pool_key = None
         else:
             access_token = (user
                             .social_auth
@@ -103,10 +116,49 @@ class Wiki:
                 'access_token': access_token['oauth_token'],
                 'access_secret': access_token['oauth_token_secret']
             }
+            pool_key = (access_token['oauth_token'], access_token['oauth_token_secret'])
+
+        def factory():
+            # Skip mwclient's own initialization; the (cached)
+            # siteinfo is applied by hand.  Authenticated sites still
+            # need the userinfo, so code can check site.groups.
+            site = Site(settings.MEDIAWIKI_SITE_NAME,
+                        clients_useragent=settings.MEDIAWIKI_USER_AGENT,
+                        do_init=False,
+                        **auth_info)
+            get_siteinfo(site).apply(site)
+            if auth_info:
+                Wiki._fetch_userinfo(site)
+            return site
+
+        if not settings.MEDIAWIKI_SITE_POOL_ENABLED:
+            return factory()
+        return site_pool.get(pool_key, factory)
+
+
+    @staticmethod
+    def _fetch_userinfo(site):
+        """Finish initializing an authenticated site.  This translates
+        errors the same way mwclient.Site.__init__() does when it calls
+        site_init() itself.
 
-        return Site(settings.MEDIAWIKI_SITE_NAME,
-                    clients_useragent=settings.MEDIAWIKI_USER_AGENT,
-                    **auth_info)
+        """
+        try:
+            site.site_init()
+        except APIError as error:
+            if error.args[0] == 'mwoauth-invalid-authorization':
+                raise mwclient.errors.OAuthAuthorizationError(site, error.code, error.info) from error
+            # Private wiki; initialization is done after login.
+            if error.args[0] not in {'unknown_action', 'readapidenied'}:
+                raise
+
+
+    def can_view_deleted(self):
+        """Return True if the current user can see deleted revisions
+        (in practice, if they're an admin).
+
+        """
+        return 'deletedhistory' in self.site.rights
 
 
     def page_exists(self, title):
@@ -129,7 +181,7 @@ class Wiki:
             return None
 
 
-    def user_contributions(self, user_name_or_names, show='', end=None):
+    def user_contributions(self, user_name_or_names, show='', start=None, end=None):
         """Get one or more users' live (i.e. non-deleted) edits.
 
         If user_name_or_names is a string, get the edits for that
@@ -137,6 +189,11 @@ class Wiki:
         a set of users.  The contributions for all of the users are
         returned.
 
+        Start and end (datetimes or API timestamp strings) bound the
+        time range, with the same meaning as in the API.  Edits are
+        listed newest first, so start is the *newer* bound and end is
+        the older one.
+
         Little Bobby Tables alert: As a temporary hack, it is a
         ValueError for any of the names to contain a pipe ('|')
         character.
@@ -153,7 +210,9 @@ class Wiki:
 
         props = 'ids|title|timestamp|comment|flags|tags'
         for chunk in chunked(all_names, MAX_UCUSER):
-            for contrib in self.site.usercontributions('|'.join(chunk), show=show, prop=props, end=end):
+            for contrib in self.site.usercontributions('|'.join(chunk), show=show, prop=props,
+                                                         start=api_timestamp(start),
+                                                         end=api_timestamp(end)):
                 logger.debug("contrib = %s", contrib)
                 yield WikiContrib(contrib['revid'],
                                   struct_to_datetime(contrib['timestamp']),
@@ -165,11 +224,14 @@ class Wiki:
                                   contrib['tags'])
 
 
-    def deleted_user_contributions(self, user_name):
+    def deleted_user_contributions(self, user_name, start=None, end=None):
         """Get a user's deleted edits.
 
         Returns an interable over WikiContribs.
 
+        Start and end bound the time range, as for
+        user_contributions().
+
         If the mwclient connection is not authenticated to a
         user with admin rights, returns an empty iterable.
 
@@ -182,7 +244,9 @@ class Wiki:
         """
         kwargs = dict(List.generate_kwargs('adr',
                                            user=user_name,
-                                           prop='ids|title|timestamp|comment|flags|tags'))
+                                           prop='ids|title|timestamp|comment|flags|tags',
+                                           start=api_timestamp(start),
+                                           end=api_timestamp(end)))
         listing = List(self.site,
                        'alldeletedrevisions',
                        'adr',
@@ -219,16 +283,20 @@ class Wiki:
         return contribs
 
 
-    def user_blocks(self, user_name):
+    def user_blocks(self, user_name, start=None, end=None):
         """Get the user's block history.
 
         Returns a (heterogeneous) list of BlockEvents and
         UnblockEvents.
 
         Events are returned in reverse chronological order
-        (i.e. most recent first).
+        (i.e. most recent first).  Start and end bound the time
+        range, as for user_contributions().
         """
-        blocks = self.site.logevents(title=f'User:{user_name}', type="block")
+        blocks = self.site.logevents(title=f'User:{user_name}',
+                                     type="block",
+                                     start=api_timestamp(start),
+                                     end=api_timestamp(end))
         events = []
         for block in blocks:
             action = block['action']
@@ -247,7 +315,7 @@ class Wiki:
         return events
 
 
-    async def multi_user_blocks(self, user_names):
+    async def multi_user_blocks(self, user_names, full_history=True):
         """Get the the block history for multiple users.
 
         Returns a (heterogeneous) list of BlockEvents and
@@ -257,21 +325,60 @@ class Wiki:
         recent first), with the events for the various users
         intermingled.
 
+        The API can't batch block log queries by title, so the full
+        history takes one call per user.  Those run concurrently, on
+        AsyncWiki's bounded pool of worker threads.  If only the
+        currently active blocks are needed, pass full_history=False;
+        that uses current_blocks(), which needs one call per
+        MAX_BKUSERS users.
+
         """
-        tasks = [sync_to_async(self.user_blocks)(name) for name in user_names]
-        blocks = await asyncio.gather(*tasks)
+        if not full_history:
+            return await sync_to_async(self.current_blocks)(user_names)
+
+        async def collect(events):
+            return [event async for event in events]
+
+        with AsyncWiki(self) as async_wiki:
+            blocks = await asyncio.gather(*[collect(async_wiki.user_blocks(name)) for name in user_names])
         return list(heapq.merge(*blocks, reverse=True))
 
 
-    def user_log_events(self, user_name):
+    def current_blocks(self, user_names):
+        """Get the currently active blocks for multiple users, with one
+        API call (list=blocks) per MAX_BKUSERS names.
+
+        Returns a list of BlockEvents, in reverse chronological order.
+        Unlike user_blocks(), the ids are block ids, not log ids, and
+        is_reblock is always False.
+
+        """
+        chunks = []
+        for chunk in chunked(user_names, MAX_BKUSERS):
+            events = []
+            for block in self.site.blocks(users='|'.join(chunk), prop='id|user|timestamp|expiry'):
+                mw_expiry = block['expiry']
+                expiry = None if mw_expiry == 'infinity' else isoparse(mw_expiry)
+                events.append(BlockEvent(block['user'],
+                                         struct_to_datetime(block['timestamp']),
+                                         block['id'],
+                                         expiry))
+            chunks.append(events)
+        return list(heapq.merge(*chunks, reverse=True))
+
+
+    def user_log_events(self, user_name, start=None, end=None):
         """Get the user's log events, i.e. where the user is the performer.
         Things that happened *to* the user are accessed through other
         calls, such as user_blocks().
 
-        Returns an iterable over LogEvents.
+        Returns an iterable over LogEvents.  Start and end bound the
+        time range, as for user_contributions().
 
         """
-        for event in self.site.logevents(user=user_name):
+        for event in self.site.logevents(user=user_name,
+                                         start=api_timestamp(start),
+                                         end=api_timestamp(end)):
             yield LogEvent(event['logid'],
                            struct_to_datetime(event['timestamp']),
                            event['user'],
@@ -284,10 +391,45 @@ class Wiki:
         return Page(self, title)
 
 
+    def get_pages(self, titles):
+        """Get Pages for many titles at once.  page() makes an API call
+        for each title; this makes one (prop=info) per MAX_TITLES
+        titles.
+
+        Returns a dict mapping each title, as given, to a Page.
+        Invalid titles are left out.
+
+        """
+        pages = {}
+        for chunk in chunked(list(dict.fromkeys(titles)), MAX_TITLES):
+            result = self.site.get('query', prop='info', inprop='protection', titles='|'.join(chunk))
+            query = result['query']
+            original_titles = {n['to']: n['from'] for n in query.get('normalized', [])}
+            for info in query['pages'].values():
+                title = info['title']
+                if 'invalid' in info:
+                    logger.warning('Ignoring invalid title %s: %s', title, info.get('invalidreason'))
+                    continue
+                pages[original_titles.get(title, title)] = Page(self, title, info=info)
+        return pages
+
+
     def category(self, title):
         return Category(self, title)
 
 
+    def page_titles(self, prefix, namespace=0):
+        """Returns an iterable over the titles (as strings, including the
+        namespace) of all the non-redirect pages in namespace (a
+        number) whose titles, without the namespace, start with prefix.
+
+        """
+        return self.site.allpages(prefix=prefix,
+                                  namespace=namespace,
+                                  filterredir='nonredirects',
+                                  generator=False)
+
+
     def is_valid_username(self, user_name):
         """Test a username for validity.  Valid in this context means properly
         formed, i.e. the underlying API doesn't return a 'baduser'
@@ -419,15 +561,31 @@ class Page:
     mw_page: mwclient.page.Page
 
 
-    def __init__(self, wiki, title):
+    def __init__(self, wiki, title, info=None):
+        """If info (the page's entry from a prop=info query) is given,
+        it's used instead of fetching it again.
+
+        """
         self.wiki = wiki
-        self.mw_page = self.wiki.site.pages[title]
+        if info:
+            self.mw_page = mwclient.page.Page(self.wiki.site, title, info)
+        else:
+            self.mw_page = self.wiki.site.pages[title]
 
 
     def exists(self):
         return self.mw_page.exists
 
 
+    def last_rev_id(self):
+        """Returns the rev_id of the latest revision, or 0 if the page
+        doesn't exist.  Unlike revisions(), this doesn't need another API
+        call for pages from Wiki.get_pages().
+
+        """
+        return self.mw_page.revision
+
+
     def revisions(self, *, count=None):
         revisions = self.mw_page.revisions()
         if count is not None: